@@ -0,0 +1,249 @@
+"""Analytics summary: single-pass aggregation and the incrementally maintained KPI snapshot"""
+import time
+import asyncio
+from collections import Counter, defaultdict
+
+
+def _num(row, key):
+    return float(row.get(key, 0) or 0)
+
+
+def summarize(vehicles, trips, drivers, expenses, maintenance):
+    total_vehicles = len(vehicles)
+    available = on_trip = in_shop = 0
+    for v in vehicles:
+        status = v['status']
+        if status == 'available':
+            available += 1
+        elif status == 'on_trip':
+            on_trip += 1
+        elif status == 'in_shop':
+            in_shop += 1
+
+    active_trips = completed_trips = 0
+    total_revenue = total_distance = 0
+    revenue_by_day = defaultdict(float)
+    revenue_by_vehicle = defaultdict(int)
+    for t in trips:
+        status = t['status']
+        if status == 'dispatched':
+            active_trips += 1
+        elif status == 'completed':
+            completed_trips += 1
+            revenue = _num(t, 'revenue')
+            total_revenue += revenue
+            total_distance += _num(t, 'distance')
+            revenue_by_vehicle[t.get('vehicle_id')] += revenue
+            if t.get('end_time'):
+                revenue_by_day[t['end_time'][:10]] += revenue
+
+    total_fuel_cost = total_other_cost = total_fuel_liters = 0
+    expense_by_day = defaultdict(float)
+    expense_by_vehicle = defaultdict(int)
+    for e in expenses:
+        fuel_cost = _num(e, 'fuel_cost')
+        other_cost = _num(e, 'other_cost')
+        total_fuel_cost += fuel_cost
+        total_other_cost += other_cost
+        total_fuel_liters += _num(e, 'fuel_liters')
+        expense_by_vehicle[e.get('vehicle_id')] += fuel_cost + other_cost
+        if e.get('created_at'):
+            expense_by_day[e['created_at'][:10]] += fuel_cost + other_cost
+
+    total_maint_cost = 0
+    maint_by_vehicle = defaultdict(int)
+    for m in maintenance:
+        cost = _num(m, 'cost')
+        total_maint_cost += cost
+        maint_by_vehicle[m.get('vehicle_id')] += cost
+
+    on_duty_drivers = 0
+    for d in drivers:
+        if d['status'] == 'on_duty':
+            on_duty_drivers += 1
+
+    utilization = (on_trip / total_vehicles * 100) if total_vehicles > 0 else 0
+    fuel_efficiency = (total_distance / total_fuel_liters) if total_fuel_liters > 0 else 0
+
+    vehicle_roi = []
+    for v in vehicles:
+        vid = v['id']
+        v_revenue = revenue_by_vehicle.get(vid, 0)
+        v_cost = expense_by_vehicle.get(vid, 0) + maint_by_vehicle.get(vid, 0)
+        acq = float(v.get('acquisition_cost', 1) or 1)
+        roi = ((v_revenue - v_cost) / acq * 100) if acq > 0 else 0
+        vehicle_roi.append({"id": vid, "name": v['name'], "revenue": v_revenue, "cost": v_cost, "roi": round(roi, 1)})
+
+    return {
+        "kpis": {
+            "total_vehicles": total_vehicles, "available_vehicles": available, "on_trip_vehicles": on_trip,
+            "in_shop_vehicles": in_shop, "active_trips": active_trips, "completed_trips": completed_trips,
+            "total_revenue": total_revenue, "total_fuel_cost": total_fuel_cost, "total_maintenance_cost": total_maint_cost,
+            "total_expenses": total_fuel_cost + total_maint_cost + total_other_cost,
+            "utilization": round(utilization, 1), "fuel_efficiency": round(fuel_efficiency, 2),
+            "on_duty_drivers": on_duty_drivers, "total_drivers": len(drivers)
+        },
+        "revenue_by_day": dict(revenue_by_day),
+        "expense_by_day": dict(expense_by_day),
+        "vehicle_roi": vehicle_roi,
+        "cost_breakdown": {"fuel": total_fuel_cost, "maintenance": total_maint_cost, "other": total_other_cost}
+    }
+
+
+class KPISnapshot:
+    """Summary kept current by mutation deltas, reloaded from analytics_state every `max_age` seconds"""
+
+    def __init__(self, max_age=300):
+        self.max_age = max_age
+        self.next_reconcile = 0.0
+        self.loaded = False
+        self.mutations = 0
+        self._payload = None
+        self._lock = asyncio.Lock()
+
+    def load(self, state):
+        k = state['kpis']
+        self.vehicles = {v['id']: dict(v) for v in state['vehicles']}
+        self.drivers = {d['id']: d['status'] for d in state['drivers']}
+        self.vehicle_status = Counter(v['status'] for v in self.vehicles.values())
+        self.driver_status = Counter(self.drivers.values())
+        self.trip_status = Counter({'dispatched': k['active_trips'], 'completed': k['completed_trips']})
+        self.totals = {key: k[key] for key in ('total_revenue', 'total_distance', 'total_fuel_cost', 'total_other_cost',
+                                               'total_fuel_liters', 'total_maintenance_cost')}
+        self.revenue_by_day = defaultdict(float, state['revenue_by_day'])
+        self.expense_by_day = defaultdict(float, state['expense_by_day'])
+        self.loaded = True
+        self._payload = None
+
+    def invalidate(self):
+        self.next_reconcile = 0.0
+
+    def is_due(self):
+        return not self.loaded or time.monotonic() >= self.next_reconcile
+
+    async def read(self, loader):
+        """Return the summary payload, reconciling through `loader()` first when due"""
+        if self.is_due():
+            async with self._lock:
+                if self.is_due():
+                    mutations = self.mutations
+                    self.load(await loader())
+                    # A write that landed while the state was loading may or may not be in
+                    # it; reconcile again shortly instead of trusting the snapshot for max_age
+                    delay = self.max_age if self.mutations == mutations else min(self.max_age, 5)
+                    self.next_reconcile = time.monotonic() + delay
+        if self._payload is None:
+            self._payload = self._render()
+        return self._payload
+
+    def _changed(self):
+        self.mutations += 1
+        self._payload = None
+
+    # --- Deltas ---
+    def vehicle_changed(self, row):
+        """Insert or update a vehicle; `row` may be partial, e.g. {'id': ..., 'status': ...}"""
+        if not self.loaded or not row or 'id' not in row:
+            return
+        v = self.vehicles.get(row['id'])
+        if v is None:
+            v = self.vehicles[row['id']] = {"id": row['id'], "name": row.get('name'), "status": None,
+                                            "acquisition_cost": 0, "revenue": 0, "cost": 0}
+        else:
+            self.vehicle_status[v['status']] -= 1
+        for key in ('name', 'status', 'acquisition_cost'):
+            if key in row:
+                v[key] = row[key]
+        self.vehicle_status[v['status']] += 1
+        self._changed()
+
+    def driver_changed(self, row):
+        if not self.loaded or not row or 'id' not in row or 'status' not in row:
+            return
+        if row['id'] in self.drivers:
+            self.driver_status[self.drivers[row['id']]] -= 1
+        self.drivers[row['id']] = row['status']
+        self.driver_status[row['status']] += 1
+        self._changed()
+
+    def driver_removed(self, driver_id):
+        if not self.loaded or driver_id not in self.drivers:
+            return
+        self.driver_status[self.drivers.pop(driver_id)] -= 1
+        self._changed()
+
+    def trip_changed(self, old, new):
+        """Apply a trip insert (old=None) or transition, with the vehicle and driver embedded in `new`"""
+        if not self.loaded:
+            return
+        for row, sign in ((old, -1), (new, 1)):
+            if not row:
+                continue
+            self.trip_status[row['status']] += sign
+            if row['status'] == 'completed':
+                revenue = _num(row, 'revenue')
+                self.totals['total_revenue'] += sign * revenue
+                self.totals['total_distance'] += sign * _num(row, 'distance')
+                if row.get('end_time'):
+                    self.revenue_by_day[row['end_time'][:10]] += sign * revenue
+                vehicle = self.vehicles.get(row.get('vehicle_id'))
+                if vehicle:
+                    vehicle['revenue'] += sign * revenue
+        self._changed()
+        if new:
+            self.vehicle_changed(new.get('vehicles'))
+            self.driver_changed(new.get('drivers'))
+
+    def expense_added(self, row):
+        if not self.loaded:
+            return
+        fuel_cost = _num(row, 'fuel_cost')
+        other_cost = _num(row, 'other_cost')
+        self.totals['total_fuel_cost'] += fuel_cost
+        self.totals['total_other_cost'] += other_cost
+        self.totals['total_fuel_liters'] += _num(row, 'fuel_liters')
+        if row.get('created_at'):
+            self.expense_by_day[row['created_at'][:10]] += fuel_cost + other_cost
+        vehicle = self.vehicles.get(row.get('vehicle_id'))
+        if vehicle:
+            vehicle['cost'] += fuel_cost + other_cost
+        self._changed()
+
+    def maintenance_added(self, row):
+        if not self.loaded:
+            return
+        cost = _num(row, 'cost')
+        self.totals['total_maintenance_cost'] += cost
+        vehicle = self.vehicles.get(row.get('vehicle_id'))
+        if vehicle:
+            vehicle['cost'] += cost
+        self._changed()
+
+    def _render(self):
+        t = self.totals
+        total_vehicles = len(self.vehicles)
+        on_trip = self.vehicle_status['on_trip']
+        utilization = (on_trip / total_vehicles * 100) if total_vehicles > 0 else 0
+        fuel_efficiency = (t['total_distance'] / t['total_fuel_liters']) if t['total_fuel_liters'] > 0 else 0
+        vehicle_roi = []
+        for v in self.vehicles.values():
+            acq = float(v.get('acquisition_cost', 1) or 1)
+            roi = ((v['revenue'] - v['cost']) / acq * 100) if acq > 0 else 0
+            vehicle_roi.append({"id": v['id'], "name": v['name'], "revenue": v['revenue'], "cost": v['cost'], "roi": round(roi, 1)})
+        return {
+            "kpis": {
+                "total_vehicles": total_vehicles, "available_vehicles": self.vehicle_status['available'],
+                "on_trip_vehicles": on_trip, "in_shop_vehicles": self.vehicle_status['in_shop'],
+                "active_trips": self.trip_status['dispatched'], "completed_trips": self.trip_status['completed'],
+                "total_revenue": t['total_revenue'], "total_fuel_cost": t['total_fuel_cost'],
+                "total_maintenance_cost": t['total_maintenance_cost'],
+                "total_expenses": t['total_fuel_cost'] + t['total_maintenance_cost'] + t['total_other_cost'],
+                "utilization": round(utilization, 1), "fuel_efficiency": round(fuel_efficiency, 2),
+                "on_duty_drivers": self.driver_status['on_duty'], "total_drivers": len(self.drivers)
+            },
+            "revenue_by_day": dict(self.revenue_by_day),
+            "expense_by_day": dict(self.expense_by_day),
+            "vehicle_roi": vehicle_roi,
+            "cost_breakdown": {"fuel": t['total_fuel_cost'], "maintenance": t['total_maintenance_cost'],
+                               "other": t['total_other_cost']}
+        }
@@ -0,0 +1,98 @@
+"""
+Benchmark for the /api/analytics/summary aggregation.
+
+Compares analytics.summarize against the original nested-scan implementation on
+synthetic datasets and asserts that both produce byte-identical JSON.
+
+    python benchmarks/bench_analytics.py [--sizes 1000 10000 100000]
+"""
+import argparse
+import json
+import time
+from collections import defaultdict
+
+from common import synthetic_fleet
+from analytics import summarize
+
+
+def nested_scan_summary(vehicles, trips, drivers, expenses, maintenance):
+    """The pre-index implementation, kept verbatim as the correctness and speed baseline"""
+    total_vehicles = len(vehicles)
+    available = len([v for v in vehicles if v['status'] == 'available'])
+    on_trip = len([v for v in vehicles if v['status'] == 'on_trip'])
+    in_shop = len([v for v in vehicles if v['status'] == 'in_shop'])
+    active_trips = len([t for t in trips if t['status'] == 'dispatched'])
+    completed_trips = len([t for t in trips if t['status'] == 'completed'])
+    total_revenue = sum(float(t.get('revenue', 0) or 0) for t in trips if t['status'] == 'completed')
+    total_fuel_cost = sum(float(e.get('fuel_cost', 0) or 0) for e in expenses)
+    total_maint_cost = sum(float(m.get('cost', 0) or 0) for m in maintenance)
+    total_other_cost = sum(float(e.get('other_cost', 0) or 0) for e in expenses)
+    utilization = (on_trip / total_vehicles * 100) if total_vehicles > 0 else 0
+    total_fuel_liters = sum(float(e.get('fuel_liters', 0) or 0) for e in expenses)
+    total_distance = sum(float(t.get('distance', 0) or 0) for t in trips if t['status'] == 'completed')
+    fuel_efficiency = (total_distance / total_fuel_liters) if total_fuel_liters > 0 else 0
+
+    revenue_by_day = defaultdict(float)
+    expense_by_day = defaultdict(float)
+    for t in trips:
+        if t['status'] == 'completed' and t.get('end_time'):
+            day = t['end_time'][:10]
+            revenue_by_day[day] += float(t.get('revenue', 0) or 0)
+    for e in expenses:
+        if e.get('created_at'):
+            day = e['created_at'][:10]
+            expense_by_day[day] += float(e.get('fuel_cost', 0) or 0) + float(e.get('other_cost', 0) or 0)
+
+    vehicle_roi = []
+    for v in vehicles:
+        v_trips = [t for t in trips if t.get('vehicle_id') == v['id'] and t['status'] == 'completed']
+        v_expenses = [e for e in expenses if e.get('vehicle_id') == v['id']]
+        v_maint = [m for m in maintenance if m.get('vehicle_id') == v['id']]
+        v_revenue = sum(float(t.get('revenue', 0) or 0) for t in v_trips)
+        v_cost = sum(float(e.get('fuel_cost', 0) or 0) + float(e.get('other_cost', 0) or 0) for e in v_expenses) + sum(float(m.get('cost', 0) or 0) for m in v_maint)
+        acq = float(v.get('acquisition_cost', 1) or 1)
+        roi = ((v_revenue - v_cost) / acq * 100) if acq > 0 else 0
+        vehicle_roi.append({"id": v['id'], "name": v['name'], "revenue": v_revenue, "cost": v_cost, "roi": round(roi, 1)})
+
+    return {
+        "kpis": {
+            "total_vehicles": total_vehicles, "available_vehicles": available, "on_trip_vehicles": on_trip,
+            "in_shop_vehicles": in_shop, "active_trips": active_trips, "completed_trips": completed_trips,
+            "total_revenue": total_revenue, "total_fuel_cost": total_fuel_cost, "total_maintenance_cost": total_maint_cost,
+            "total_expenses": total_fuel_cost + total_maint_cost + total_other_cost,
+            "utilization": round(utilization, 1), "fuel_efficiency": round(fuel_efficiency, 2),
+            "on_duty_drivers": len([d for d in drivers if d['status'] == 'on_duty']), "total_drivers": len(drivers)
+        },
+        "revenue_by_day": dict(revenue_by_day),
+        "expense_by_day": dict(expense_by_day),
+        "vehicle_roi": vehicle_roi,
+        "cost_breakdown": {"fuel": total_fuel_cost, "maintenance": total_maint_cost, "other": total_other_cost}
+    }
+
+
+def timed(fn, tables):
+    args = (tables["vehicles"], tables["trips"], tables["drivers"], tables["expenses"], tables["maintenance_logs"])
+    start = time.perf_counter()
+    out = fn(*args)
+    return time.perf_counter() - start, out
+
+
+def main(sizes, max_nested):
+    print(f"{'trips':>8} {'vehicles':>9} {'nested (s)':>11} {'single-pass (s)':>16} {'speedup':>8}")
+    for n in sizes:
+        tables = synthetic_fleet(n)
+        fast_s, fast = timed(summarize, tables)
+        if n <= max_nested:
+            slow_s, slow = timed(nested_scan_summary, tables)
+            assert json.dumps(fast) == json.dumps(slow), f"output mismatch at {n} rows"
+            print(f"{n:>8} {len(tables['vehicles']):>9} {slow_s:>11.3f} {fast_s:>16.4f} {slow_s / fast_s:>7.0f}x")
+        else:
+            print(f"{n:>8} {len(tables['vehicles']):>9} {'skipped':>11} {fast_s:>16.4f} {'-':>8}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--max-nested", type=int, default=10000, help="skip the O(V*(T+E+M)) baseline above this size (100k takes minutes)")
+    args = parser.parse_args()
+    main(args.sizes, args.max_nested)
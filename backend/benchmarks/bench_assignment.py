@@ -0,0 +1,73 @@
+"""
+Vehicle/driver assignment: min-cost assignment (planning.assign_trips) vs first-fit.
+
+Generates N pending trip requests, N available vehicles and N eligible drivers, then
+compares the solver against a greedy loop that gives each trip the first free vehicle
+that can carry it and the first free driver: solve time, trips assigned, and the
+resulting vehicle cost (unused capacity + relocations) and driver cost.
+
+    python benchmarks/bench_assignment.py [--size 1000] [--seed 7]
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+
+import common  # noqa: F401  (puts the backend on sys.path)
+from planning import assign_trips, vehicle_costs, driver_costs
+from seeding import CITIES, MODELS
+
+
+def make_problem(n, seed):
+    rng = random.Random(seed)
+    vehicles = [{"id": f"v{i}", "name": f"Truck {i}", "max_capacity": model[1], "location": rng.choice(CITIES)}
+                for i, model in enumerate(rng.choice(MODELS) for _ in range(n))]
+    drivers = [{"id": f"d{i}", "full_name": f"Driver {i}", "safety_score": rng.randint(80, 100)} for i in range(n)]
+    trips = [{"origin": rng.choice(CITIES), "destination": rng.choice(CITIES),
+              "cargo_weight": round(rng.choice(MODELS)[1] * rng.uniform(0.2, 0.95))} for _ in range(n)]
+    return trips, vehicles, drivers
+
+
+def first_fit(trips, vehicles, drivers):
+    free_vehicles = list(range(len(vehicles)))
+    free_drivers = list(range(len(drivers)))
+    vehicle_of = np.full(len(trips), -1)
+    driver_of = np.full(len(trips), -1)
+    for i, t in enumerate(trips):
+        for j in free_vehicles:
+            if vehicles[j]["max_capacity"] >= t["cargo_weight"]:
+                vehicle_of[i] = j
+                free_vehicles.remove(j)
+                if free_drivers:
+                    driver_of[i] = free_drivers.pop(0)
+                break
+    return vehicle_of, driver_of
+
+
+def score(trips, vehicles, drivers, vehicle_of, driver_of):
+    served = np.flatnonzero((vehicle_of >= 0) & (driver_of >= 0))
+    v_cost = vehicle_costs(trips, vehicles)[served, vehicle_of[served]].sum()
+    d_cost = driver_costs(trips, drivers)[served, driver_of[served]].sum()
+    relocations = sum(1 for i in served if vehicles[vehicle_of[i]]["location"] != trips[i]["origin"])
+    return len(served), v_cost, d_cost, relocations
+
+
+def main(size, seed):
+    trips, vehicles, drivers = make_problem(size, seed)
+    print(f"{size} trips x {size} vehicles x {size} drivers")
+    print(f"{'method':>10} {'time (s)':>9} {'assigned':>9} {'vehicle cost':>13} {'relocations':>12} {'driver cost':>12}")
+    for name, solver in (("assignment", assign_trips), ("first-fit", first_fit)):
+        start = time.perf_counter()
+        vehicle_of, driver_of = solver(trips, vehicles, drivers)
+        elapsed = time.perf_counter() - start
+        assigned, v_cost, d_cost, relocations = score(trips, vehicles, drivers, vehicle_of, driver_of)
+        print(f"{name:>10} {elapsed:>9.3f} {assigned:>9} {v_cost:>13.1f} {relocations:>12} {d_cost:>12.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    main(args.size, args.seed)
@@ -0,0 +1,65 @@
+"""
+Dashboard polling of GET /api/trips: full responses vs compressed vs conditional 304s.
+
+Serves N embedded trip rows (vehicles(*), drivers(*)) from a stand-in database with a
+fixed table version, then polls the list the way an always-open screen does and reports
+bytes on the wire and time per request for:
+
+- identity: no compression, no revalidation (the previous behaviour)
+- gzip:     Accept-Encoding: gzip, no revalidation
+- 304:      revalidating with the ETag of the previous response while nothing changed
+
+    python benchmarks/bench_conditional_get.py [--rows 5000] [--requests 50]
+"""
+import argparse
+import asyncio
+import time
+
+from common import server, SlowSupabase, SlowQuery, _Response, auth_headers, client, synthetic_fleet
+
+
+class VersionedSupabase(SlowSupabase):
+    """SlowSupabase whose table_versions() rpc reports a fixed version"""
+
+    def rpc(self, name, params):
+        query = SlowQuery([], self.latency)
+        query.execute = lambda: _Response("bench")
+        return query
+
+
+async def poll(http, headers, total, revalidate):
+    sizes, etag = [], None
+    start = time.perf_counter()
+    for _ in range(total):
+        res = await http.get("/api/trips", headers={**headers, **({"If-None-Match": etag} if etag and revalidate else {})})
+        assert res.status_code in (200, 304)
+        etag = res.headers.get("etag")
+        sizes.append(res.num_bytes_downloaded)
+    return (time.perf_counter() - start) / total, sizes
+
+
+async def main(n_rows, total):
+    fleet = synthetic_fleet(n_rows)
+    vehicles = {v["id"]: v for v in fleet["vehicles"]}
+    drivers = {d["id"]: d for d in fleet["drivers"]}
+    trips = [{**t, "vehicles": vehicles[t["vehicle_id"]], "drivers": drivers[t["driver_id"]]} for t in fleet["trips"]]
+    server.store = VersionedSupabase({"trips": trips}, latency=0)
+    headers = auth_headers()
+    print(f"{n_rows} embedded trip rows, {total} polls each")
+    print(f"{'mode':>9} {'ms/request':>11} {'KB/request':>11}")
+    async with client() as http:
+        for mode, extra, revalidate in (("identity", {"Accept-Encoding": "identity"}, False),
+                                        ("gzip", {"Accept-Encoding": "gzip"}, False),
+                                        ("304", {"Accept-Encoding": "gzip"}, True)):
+            per_request, sizes = await poll(http, {**headers, **extra}, total, revalidate)
+            # The first revalidating poll has no ETag yet; report the steady state
+            steady = sizes[1:] if revalidate else sizes
+            print(f"{mode:>9} {per_request * 1000:>11.1f} {sum(steady) / len(steady) / 1024:>11.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--requests", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(main(args.rows, args.requests))
@@ -0,0 +1,37 @@
+"""
+Concurrency benchmark for the DB access layer.
+
+Every query is simulated as a blocking 50 ms round trip. With the queries running on
+the DB worker pool, throughput should scale with the number of in-flight requests
+(up to DB_POOL_SIZE) instead of staying flat at ~1/latency.
+
+    python benchmarks/bench_db_concurrency.py [--latency 0.05] [--requests 256]
+"""
+import argparse
+import asyncio
+
+from common import server, SlowSupabase, auth_headers, client, run_concurrent
+
+
+async def main(latency, total):
+    # Trips rather than vehicles: vehicle lists are served from the reference cache
+    trips = [{"id": str(i), "origin": "A", "destination": "B", "status": "draft"} for i in range(20)]
+    server.store = SlowSupabase({"trips": trips}, latency=latency)
+    headers = auth_headers()
+    print(f"latency={latency * 1000:.0f}ms requests={total} pool={server.DB_POOL_SIZE}")
+    print(f"{'concurrency':>12} {'req/s':>10} {'speedup':>8}")
+    baseline = None
+    async with client() as http:
+        for concurrency in (1, 4, 16, 32, 64):
+            elapsed, _ = await run_concurrent(http, "GET", "/api/trips", total, concurrency, headers=headers)
+            rps = total / elapsed
+            baseline = baseline or rps
+            print(f"{concurrency:>12} {rps:>10.1f} {rps / baseline:>7.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--requests", type=int, default=256)
+    args = parser.parse_args()
+    asyncio.run(main(args.latency, args.requests))
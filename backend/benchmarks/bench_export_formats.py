@@ -0,0 +1,62 @@
+"""
+Size and load-time comparison of the CSV export against the Parquet / Arrow IPC exports.
+
+Encodes the same synthetic trips through the server's streaming CSV writer and the
+columnar encoder, then times loading each into pandas.
+
+    python benchmarks/bench_export_formats.py [--rows 100000]
+"""
+import argparse
+import asyncio
+import io
+import time
+
+import pandas as pd
+import pyarrow as pa
+
+from common import server, synthetic_fleet
+from columnar import DATASETS, encode_stream
+
+
+async def collect(chunks):
+    out = []
+    async for chunk in chunks:
+        out.append(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+    return b''.join(out)
+
+
+def main(n_rows):
+    trips = synthetic_fleet(n_rows)["trips"]
+    for t in trips:
+        t["vehicles"] = {"name": f"Truck {t['vehicle_id']}"}
+        t["drivers"] = {"full_name": f"Driver {t['driver_id']}"}
+    page = server.EXPORT_PAGE_SIZE
+
+    async def pages():
+        for i in range(0, len(trips), page):
+            yield trips[i:i + page]
+
+    schema = DATASETS["trips"][2]
+    loaders = {
+        "csv": lambda b: pd.read_csv(io.BytesIO(b)),
+        "parquet": lambda b: pd.read_parquet(io.BytesIO(b)),
+        "arrow": lambda b: pa.ipc.open_stream(b).read_all().to_pandas(),
+    }
+    print(f"{n_rows} trips, {page} rows per page")
+    print(f"{'format':>8} {'encode (s)':>11} {'size (MB)':>10} {'load (s)':>9} {'typed columns':>14}")
+    for fmt in ("csv", "parquet", "arrow"):
+        start = time.perf_counter()
+        chunks = server.trip_csv_chunks(pages()) if fmt == "csv" else encode_stream(pages(), schema, fmt)
+        data = asyncio.run(collect(chunks))
+        encode_s = time.perf_counter() - start
+        start = time.perf_counter()
+        df = loaders[fmt](data)
+        load_s = time.perf_counter() - start
+        typed = sum(1 for dtype in df.dtypes if str(dtype).startswith(("float", "int", "datetime")))
+        print(f"{fmt:>8} {encode_s:>11.2f} {len(data) / 1e6:>10.2f} {load_s:>9.3f} {typed:>14}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100000)
+    main(parser.parse_args().rows)
@@ -0,0 +1,66 @@
+"""
+Encode time and peak memory of a trips list response with embedded vehicles and drivers.
+
+Compares FastAPI's default path for a returned dict (jsonable_encoder, then
+JSONResponse's json.dumps) with the server's `responses.encode_json` (orjson), plus
+stdlib json.dumps alone to separate the encoder walk from the serialization itself.
+
+    python benchmarks/bench_json_encode.py [--sizes 10000 100000] [--repeat 3]
+"""
+import argparse
+import gc
+import json
+import time
+import tracemalloc
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from common import synthetic_fleet
+from responses import encode_json
+
+
+def trips_payload(n_rows):
+    fleet = synthetic_fleet(n_rows)
+    vehicles = {v["id"]: v for v in fleet["vehicles"]}
+    drivers = {d["id"]: d for d in fleet["drivers"]}
+    return {"data": [{**t, "vehicles": vehicles[t["vehicle_id"]], "drivers": drivers[t["driver_id"]]} for t in fleet["trips"]]}
+
+
+METHODS = {
+    "fastapi default": lambda payload: JSONResponse(jsonable_encoder(payload)).body,
+    "json.dumps": lambda payload: json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode(),
+    "orjson": encode_json,
+}
+
+
+def measure(encode, payload, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        body = encode(payload)
+        best = min(best, time.perf_counter() - start)
+    gc.collect()
+    tracemalloc.start()
+    encode(payload)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak, len(body)
+
+
+def main(sizes, repeat):
+    print(f"{'rows':>8} {'method':>16} {'encode (ms)':>12} {'peak (MB)':>10} {'body (MB)':>10}")
+    for n_rows in sizes:
+        payload = trips_payload(n_rows)
+        for name, encode in METHODS.items():
+            seconds, peak, size = measure(encode, payload, repeat)
+            print(f"{n_rows:>8} {name:>16} {seconds * 1000:>12.1f} {peak / 1e6:>10.1f} {size / 1e6:>10.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    main(args.sizes, args.repeat)
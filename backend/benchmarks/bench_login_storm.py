@@ -0,0 +1,64 @@
+"""
+Login storm benchmark.
+
+Fires a burst of concurrent logins while a second client keeps polling an unrelated,
+DB-free endpoint (/api/auth/me), and reports logins/sec plus the poller's p50/p99
+latency. Run with --inline to verify bcrypt on the event loop, as before the auth pool,
+for comparison.
+
+    python benchmarks/bench_login_storm.py [--logins 200] [--concurrency 50] [--rounds 12] [--inline]
+"""
+import argparse
+import asyncio
+import time
+
+from common import server, SlowSupabase, auth_headers, client, run_concurrent, percentile
+
+
+async def poll(http, headers, stop, latencies):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await http.get("/api/auth/me", headers=headers)
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(0.005)
+
+
+async def main(logins, concurrency, rounds, inline):
+    server.BCRYPT_ROUNDS = rounds
+    user = {"id": "u1", "email": "manager@fleetflow.com", "password_hash": server.hash_password("password123"),
+            "full_name": "Alex Thompson", "role": "manager"}
+    server.store = SlowSupabase({"users": [user]}, latency=0.0)
+    server.AUTH_MAX_PENDING = max(server.AUTH_MAX_PENDING, concurrency)
+    if inline:
+        async def run_inline(fn, *args):
+            return fn(*args)
+        server.run_auth = run_inline
+
+    headers = auth_headers()
+    stop = asyncio.Event()
+    latencies = []
+    async with client() as http:
+        poller = asyncio.create_task(poll(http, headers, stop, latencies))
+        await asyncio.sleep(0.05)
+        elapsed, login_latencies = await run_concurrent(
+            http, "POST", "/api/auth/login", logins, concurrency,
+            json={"email": user["email"], "password": "password123"})
+        stop.set()
+        await poller
+
+    mode = "inline (event loop)" if inline else f"auth pool ({server.AUTH_POOL_SIZE} threads)"
+    print(f"bcrypt rounds={rounds}, {logins} logins at concurrency {concurrency}, {mode}")
+    print(f"  logins/sec:            {logins / elapsed:8.1f}")
+    print(f"  login p99:             {percentile(login_latencies, 99) * 1000:8.1f} ms")
+    print(f"  /api/auth/me p50:      {percentile(latencies, 50) * 1000:8.1f} ms")
+    print(f"  /api/auth/me p99:      {percentile(latencies, 99) * 1000:8.1f} ms  ({len(latencies)} polls)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=12)
+    parser.add_argument("--inline", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(main(args.logins, args.concurrency, args.rounds, args.inline))
@@ -0,0 +1,81 @@
+"""
+Reference cache benchmark: vehicle/driver list reads with occasional vehicle updates.
+
+Every query is simulated as a blocking round trip of `--latency` seconds. Runs the same
+read-mostly mix (one PUT /api/vehicles/{id} per `--write-every` requests, the rest split
+between GET /api/vehicles and GET /api/drivers) with the reference cache bypassed and
+enabled, and reports throughput, database queries issued and the cache hit rate.
+
+    python benchmarks/bench_ref_cache.py [--latency 0.02] [--requests 2000] [--write-every 50]
+"""
+import argparse
+import asyncio
+import time
+
+from common import server, SlowSupabase, auth_headers, client, percentile
+from caching import RefCache, LocalStore
+
+
+class CountingSupabase(SlowSupabase):
+    def __init__(self, tables, latency):
+        super().__init__(tables, latency)
+        self.queries = 0
+
+    def table(self, name):
+        self.queries += 1
+        return super().table(name)
+
+
+class NoCache(RefCache):
+    """Pass-through: every read goes to the database"""
+
+    def __init__(self):
+        super().__init__(LocalStore())
+
+    async def query(self, table, params, load):
+        self._count(table, 0, 1)
+        return await load()
+
+
+async def run(cache, latency, total, write_every, concurrency=16):
+    vehicles = [{"id": f"v{i}", "name": f"Truck {i}", "status": "available"} for i in range(200)]
+    drivers = [{"id": f"d{i}", "full_name": f"Driver {i}", "status": "on_duty"} for i in range(200)]
+    db = CountingSupabase({"vehicles": vehicles, "drivers": drivers}, latency)
+    server.store = db
+    server.ref_cache = cache
+    headers = auth_headers()
+    sem = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(http, i):
+        async with sem:
+            start = time.perf_counter()
+            if i % write_every == write_every - 1:
+                res = await http.put("/api/vehicles/v1", json={"status": "in_shop"}, headers=headers)
+            else:
+                res = await http.get("/api/vehicles" if i % 2 else "/api/drivers", headers=headers)
+            res.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+
+    async with client() as http:
+        start = time.perf_counter()
+        await asyncio.gather(*(one(http, i) for i in range(total)))
+        elapsed = time.perf_counter() - start
+    return total / elapsed, db.queries, percentile(latencies, 50), percentile(latencies, 99), cache.info()["hit_rate"]
+
+
+async def main(latency, total, write_every):
+    print(f"latency={latency * 1000:.0f}ms requests={total} one write per {write_every} requests")
+    print(f"{'cache':>8} {'req/s':>9} {'db queries':>11} {'p50 (ms)':>9} {'p99 (ms)':>9} {'hit rate':>9}")
+    for name, cache in (("off", NoCache()), ("local", RefCache(LocalStore(server.REF_CACHE_MAX_ROWS, server.REF_CACHE_TTL)))):
+        rps, queries, p50, p99, hit_rate = await run(cache, latency, total, write_every)
+        print(f"{name:>8} {rps:>9.1f} {queries:>11} {p50 * 1000:>9.1f} {p99 * 1000:>9.1f} {hit_rate:>9.2%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--write-every", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(main(args.latency, args.requests, args.write_every))
@@ -0,0 +1,205 @@
+"""
+EXPLAIN-based regression check of the indexes and partitions in schema.sql.
+
+Seeds a local Postgres with a production-sized fleet (1M trips and 1M expenses by
+default, spread over two years), then runs EXPLAIN ANALYZE on the SQL that PostgREST
+generates for the API's hot queries: list pages and keyset next pages, the status /
+vehicle / driver filters, the active-trip guards of vehicle and driver deletes, login,
+the assignment candidates and month ranges of expenses. Each plan is checked for the
+index it is expected to use, for sequential scans over the large tables and, on
+expenses, for partition pruning. Exits with status 1 when any check fails.
+
+Needs an empty database the script may write to:
+
+    python benchmarks/check_query_plans.py --dsn postgresql://localhost/fleetflow_plans --setup [--trips 1000000]
+
+--setup applies schema.sql first (creating the supabase_realtime publication Supabase
+would provide); without it the schema must already be in place. Seeding is skipped
+when the database already holds trips.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+import asyncpg
+
+SCHEMA = os.path.join(os.path.dirname(__file__), '..', 'schema.sql')
+PAGE = 50
+LARGE_TABLES = ('trips', 'expenses', 'maintenance_logs', 'change_log')
+
+
+async def setup(conn):
+    if not await conn.fetchval("SELECT EXISTS (SELECT 1 FROM pg_publication WHERE pubname = 'supabase_realtime')"):
+        await conn.execute("CREATE PUBLICATION supabase_realtime")
+    with open(SCHEMA) as f:
+        await conn.execute(f.read())
+
+
+async def seed(conn, n_trips):
+    n_vehicles = max(n_trips // 100, 10)
+    n_drivers = max(n_trips // 100, 10)
+    # Bulk load without the change_log triggers and foreign key checks
+    await conn.execute("SET session_replication_role = replica")
+    await conn.execute("SELECT create_month_partitions('expenses', (now() - interval '2 years')::date, now()::date)")
+    await conn.execute(f"""
+        INSERT INTO vehicles (name, model, license_plate, max_capacity, status, created_at)
+        SELECT 'Truck ' || g, 'Model ' || g % 7, 'PL-' || g, 500 + g % 20 * 100,
+               (ARRAY['available', 'available', 'on_trip', 'in_shop', 'retired'])[1 + g % 5],
+               now() - g * interval '1 hour'
+        FROM generate_series(1, {n_vehicles}) g;
+        INSERT INTO drivers (full_name, license_number, license_expiry, safety_score, status, created_at)
+        SELECT 'Driver ' || g, 'LN-' || g, current_date + (g % 1000 - 100), 60 + g % 41,
+               (ARRAY['on_duty', 'off_duty', 'suspended'])[1 + g % 3], now() - g * interval '1 hour'
+        FROM generate_series(1, {n_drivers}) g;
+        CREATE TEMP TABLE v AS SELECT row_number() OVER () AS n, id FROM vehicles;
+        CREATE TEMP TABLE d AS SELECT row_number() OVER () AS n, id FROM drivers;
+        INSERT INTO trips (vehicle_id, driver_id, origin, destination, cargo_weight, distance, revenue,
+                           status, start_time, end_time, created_at)
+        SELECT v.id, d.id, 'City ' || g % 50, 'City ' || (g * 7) % 50, 100 + g % 900, g % 500, g % 2000,
+               s.status, t - interval '1 hour', CASE WHEN s.status = 'completed' THEN t END, t
+        FROM generate_series(1, {n_trips}) g
+        CROSS JOIN LATERAL (SELECT now() - g * interval '2 years' / {n_trips} AS t) tt
+        -- Mostly history; the recent rows carry the drafts and active trips
+        CROSS JOIN LATERAL (SELECT CASE WHEN g % 20 = 0 THEN 'cancelled'
+                                        WHEN g > {n_trips // 100} THEN 'completed'
+                                        WHEN g % 4 = 0 THEN 'dispatched' ELSE 'draft' END AS status) s
+        JOIN v ON v.n = 1 + g % {n_vehicles}
+        JOIN d ON d.n = 1 + (g * 13) % {n_drivers};
+        INSERT INTO expenses (vehicle_id, trip_id, fuel_liters, fuel_cost, other_cost, created_at)
+        SELECT vehicle_id, id, distance / 3, distance / 2, cargo_weight % 7, created_at FROM trips;
+        INSERT INTO maintenance_logs (vehicle_id, description, cost, service_date, status, created_at)
+        SELECT v.id, 'Service ' || g, 100 + g % 900, (now() - g * interval '1 hour')::date,
+               CASE WHEN g % 10 = 0 THEN 'in_progress' ELSE 'completed' END, now() - g * interval '1 hour'
+        FROM generate_series(1, {n_trips // 10}) g
+        JOIN v ON v.n = 1 + g % {n_vehicles};
+        INSERT INTO users (email, password_hash, full_name, role)
+        SELECT 'user' || g || '@fleetflow.test', 'x', 'User ' || g, 'dispatcher' FROM generate_series(1, 10000) g;
+    """)
+    await conn.execute("SET session_replication_role = DEFAULT")
+    await conn.execute("ANALYZE")
+
+
+async def samples(conn):
+    """Representative parameter values: a busy vehicle and driver, a cursor deep in the trips list"""
+    vehicle_id, driver_id = await conn.fetchrow(
+        "SELECT vehicle_id, driver_id FROM trips WHERE status = 'dispatched' LIMIT 1")
+    cursor = await conn.fetchrow(
+        "SELECT created_at, id FROM trips ORDER BY created_at DESC, id DESC OFFSET (SELECT count(*) / 2 FROM trips) LIMIT 1")
+    month = await conn.fetchval("SELECT date_trunc('month', now() - interval '6 months')")
+    trip_id = await conn.fetchval("SELECT trip_id FROM expenses WHERE created_at < $1 LIMIT 1", month)
+    return {"vehicle_id": vehicle_id, "driver_id": driver_id, "trip_id": trip_id, "cursor_at": cursor["created_at"],
+            "cursor_id": cursor["id"], "month": month, "email": "user5000@fleetflow.test"}
+
+
+def keyset_sql(where=None):
+    """A keyset next page as keyset_query builds it: the OR condition plus its redundant created_at bound"""
+    return (f"SELECT * FROM trips WHERE {where + ' AND ' if where else ''}created_at <= $1"
+            f" AND (created_at < $1 OR (created_at = $1 AND id < $2)) ORDER BY created_at DESC, id DESC LIMIT {PAGE}")
+
+
+# (name, SQL, parameter names, index the plan must use, max partitions of expenses scanned). Queries
+# without an index read whole partitions by design and are only checked for pruning.
+QUERIES = [
+    ("trips page", f"SELECT * FROM trips ORDER BY created_at DESC, id DESC LIMIT {PAGE}", (),
+     "trips_created_idx", None),
+    ("trips next page", keyset_sql(), ("cursor_at", "cursor_id"),
+     "trips_created_idx", None),
+    ("trips by status", f"SELECT * FROM trips WHERE status = 'dispatched' ORDER BY created_at DESC, id DESC LIMIT {PAGE}",
+     (), "trips_status_created_idx", None),
+    ("trips by status next page", keyset_sql("status = 'completed'"), ("cursor_at", "cursor_id"),
+     "trips_status_created_idx", None),
+    ("trips by vehicle", f"SELECT * FROM trips WHERE vehicle_id = $1 ORDER BY created_at DESC, id DESC LIMIT {PAGE}",
+     ("vehicle_id",), "trips_vehicle_created_idx", None),
+    ("trips by driver", f"SELECT * FROM trips WHERE driver_id = $1 ORDER BY created_at DESC, id DESC LIMIT {PAGE}",
+     ("driver_id",), "trips_driver_created_idx", None),
+    ("delete_vehicle guard", "SELECT id FROM trips WHERE vehicle_id = $1 AND status = 'dispatched'",
+     ("vehicle_id",), "trips_dispatched_vehicle_idx", None),
+    ("delete_driver guard", "SELECT id FROM trips WHERE driver_id = $1 AND status = 'dispatched'",
+     ("driver_id",), "trips_dispatched_driver_idx", None),
+    ("delete_vehicle trips", "SELECT id FROM trips WHERE vehicle_id = $1", ("vehicle_id",),
+     "trips_vehicle_created_idx", None),
+    ("delete_vehicle expenses", "SELECT id FROM expenses WHERE vehicle_id = $1", ("vehicle_id",),
+     "expenses_vehicle_created_idx", None),
+    ("trip delete fk check", "SELECT 1 FROM expenses WHERE trip_id = $1", ("trip_id",), "expenses_trip_idx", None),
+    ("login", "SELECT * FROM users WHERE email = $1", ("email",), "users_email_key", None),
+    ("maintenance by status",
+     f"SELECT * FROM maintenance_logs WHERE status = 'in_progress' ORDER BY created_at DESC, id DESC LIMIT {PAGE}",
+     (), "maintenance_status_created_idx", None),
+    ("expenses page", f"SELECT * FROM expenses ORDER BY created_at DESC, id DESC LIMIT {PAGE}", (),
+     "expenses_created_idx", None),
+    ("expenses month", "SELECT sum(fuel_cost) FROM expenses WHERE created_at >= $1 AND created_at < $1 + interval '1 month'",
+     ("month",), None, 1),
+    ("assignment location",
+     "SELECT v.id, loc.destination FROM vehicles v LEFT JOIN LATERAL (SELECT destination FROM trips t "
+     "WHERE t.vehicle_id = v.id AND t.status = 'completed' ORDER BY t.end_time DESC NULLS LAST LIMIT 1) loc ON true "
+     "WHERE v.status = 'available'", (), "trips_completed_vehicle_idx", None),
+]
+
+
+def walk(plan):
+    yield plan
+    for child in plan.get("Plans", ()):
+        yield from walk(child)
+
+
+def problems(plan, index, max_partitions, sizes, parents):
+    nodes = list(walk(plan))
+    found = []
+    # Scans of a partition name the partition's own index; compare the partitioned one
+    indexes = {parents.get(n["Index Name"], n["Index Name"]) for n in nodes if n.get("Index Name")}
+    if index and index not in indexes:
+        found.append(f"expected {index}")
+    for n in nodes:
+        relation = n.get("Relation Name", "")
+        large = any(relation == t or relation.startswith(t + '_') for t in LARGE_TABLES)
+        if index and n["Node Type"] == "Seq Scan" and large and sizes.get(relation, 0) > 10000:
+            found.append(f"seq scan on {relation}")
+    if max_partitions is not None:
+        scanned = {n["Relation Name"] for n in nodes if n.get("Relation Name", "").startswith("expenses_")}
+        if len(scanned) > max_partitions:
+            found.append(f"{len(scanned)} partitions scanned")
+    return found
+
+
+async def main(dsn, n_trips, do_setup):
+    conn = await asyncpg.connect(dsn)
+    if do_setup:
+        await setup(conn)
+    if not await conn.fetchval("SELECT EXISTS (SELECT 1 FROM trips)"):
+        start = time.perf_counter()
+        await seed(conn, n_trips)
+        print(f"seeded {n_trips} trips in {time.perf_counter() - start:.0f}s")
+    sizes = dict(await conn.fetch("SELECT relname, reltuples::bigint FROM pg_class WHERE relkind = 'r'"))
+    parents = dict(await conn.fetch(
+        "SELECT c.relname, p.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "JOIN pg_class p ON p.oid = i.inhparent WHERE c.relkind = 'i'"))
+    params = await samples(conn)
+
+    failures = 0
+    print(f"{'query':<26} {'ms':>8} {'rows':>6}  plan")
+    for name, sql, names, index, max_partitions in QUERIES:
+        (raw,) = await conn.fetchrow(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}", *(params[n] for n in names))
+        result = json.loads(raw)[0]
+        plan = result["Plan"]
+        found = problems(plan, index, max_partitions, sizes, parents)
+        failures += bool(found)
+        shape = ' > '.join(dict.fromkeys(
+            n["Node Type"] + (f" ({n['Index Name']})" if n.get("Index Name") else '') for n in walk(plan)))
+        print(f"{name:<26} {result['Execution Time']:>8.2f} {plan['Actual Rows']:>6}  {shape[:110]}")
+        for problem in found:
+            print(f"{'':<26} !! {problem}")
+    await conn.close()
+    print("FAIL" if failures else "OK", f"({failures} of {len(QUERIES)} plans regressed)")
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dsn", default=os.environ.get("DATABASE_URL", "postgresql://localhost/fleetflow_plans"))
+    parser.add_argument("--trips", type=int, default=1_000_000)
+    parser.add_argument("--setup", action="store_true")
+    args = parser.parse_args()
+    sys.exit(1 if asyncio.run(main(args.dsn, args.trips, args.setup)) else 0)
@@ -0,0 +1,120 @@
+"""
+Shared helpers for the FleetFlow benchmarks.
+
+Benchmarks import the FastAPI app in-process and drive it through httpx's ASGI
+transport, so no network or live Supabase project is needed.
+"""
+import os
+import sys
+import time
+import asyncio
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "benchmark")
+os.environ.setdefault("JWT_SECRET", "fleetflow-benchmark-secret-0123456789")
+
+import httpx  # noqa: E402
+import server  # noqa: E402
+
+
+class _Response:
+    def __init__(self, data):
+        self.data = data
+
+
+class SlowQuery:
+    """Query builder stand-in: accepts any chained call and blocks for `latency` seconds on execute()"""
+
+    def __init__(self, rows, latency):
+        self._rows = rows
+        self._latency = latency
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self
+
+    def execute(self):
+        time.sleep(self._latency)
+        return _Response(list(self._rows))
+
+
+class SlowSupabase:
+    """Mimics a blocking supabase client with a fixed round-trip latency per query"""
+
+    def __init__(self, tables=None, latency=0.05):
+        self.tables = tables or {}
+        self.latency = latency
+
+    def table(self, name):
+        return SlowQuery(self.tables.get(name, []), self.latency)
+
+
+def auth_headers(role="manager"):
+    token = server.create_token("bench-user", role, f"{role}@fleetflow.com", "Bench User")
+    return {"Authorization": f"Bearer {token}"}
+
+
+def client():
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://bench")
+
+
+async def run_concurrent(http, method, path, total, concurrency, **kwargs):
+    """Issue `total` requests with at most `concurrency` in flight; returns (elapsed_s, latencies_s)"""
+    sem = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one():
+        async with sem:
+            start = time.perf_counter()
+            res = await http.request(method, path, **kwargs)
+            res.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    return time.perf_counter() - start, latencies
+
+
+def synthetic_fleet(n_rows, seed=7):
+    """
+    Deterministic fleet dataset with `n_rows` trips and proportionally sized other tables
+    (one vehicle and one driver per 10 trips, one expense per 2 trips, one maintenance
+    log per 5 trips). Rows have the shape PostgREST returns.
+    """
+    import random
+    from datetime import datetime, timedelta, timezone
+
+    rng = random.Random(seed)
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    n_vehicles = max(1, n_rows // 10)
+    vehicles = [{"id": f"v{i}", "name": f"Truck {i}", "status": rng.choice(["available", "on_trip", "in_shop", "retired"]),
+                 "max_capacity": rng.choice([2000, 4500, 8000, 15000]), "acquisition_cost": rng.choice([0, 35000, 85000, 125000]),
+                 "created_at": (start + timedelta(minutes=i)).isoformat()} for i in range(n_vehicles)]
+    drivers = [{"id": f"d{i}", "full_name": f"Driver {i}", "status": rng.choice(["on_duty", "off_duty", "suspended"]),
+                "safety_score": rng.randint(50, 100), "license_expiry": "2030-01-01",
+                "created_at": (start + timedelta(minutes=i)).isoformat()} for i in range(n_vehicles)]
+    trips = []
+    for i in range(n_rows):
+        created = start + timedelta(minutes=7 * i)
+        status = rng.choice(["draft", "dispatched", "completed", "completed", "completed", "cancelled"])
+        trips.append({"id": f"t{i}", "vehicle_id": f"v{rng.randrange(n_vehicles)}", "driver_id": f"d{rng.randrange(n_vehicles)}",
+                      "origin": "A", "destination": "B", "cargo_weight": rng.randint(100, 2000),
+                      "distance": round(rng.uniform(10, 1200), 1), "revenue": round(rng.uniform(100, 8000), 2), "status": status,
+                      "start_time": created.isoformat() if status != "draft" else None,
+                      "end_time": (created + timedelta(hours=9)).isoformat() if status == "completed" else None,
+                      "created_at": created.isoformat()})
+    expenses = [{"id": f"e{i}", "vehicle_id": f"v{rng.randrange(n_vehicles)}", "trip_id": None,
+                 "fuel_liters": round(rng.uniform(20, 300), 1), "fuel_cost": round(rng.uniform(30, 500), 2),
+                 "other_cost": rng.choice([0, None, 15, 45.5]), "created_at": (start + timedelta(minutes=14 * i)).isoformat()}
+                for i in range(n_rows // 2)]
+    maintenance = [{"id": f"m{i}", "vehicle_id": f"v{rng.randrange(n_vehicles)}", "description": "Service",
+                    "cost": round(rng.uniform(100, 3000), 2), "service_date": "2025-06-01", "status": "completed",
+                    "created_at": (start + timedelta(minutes=35 * i)).isoformat()} for i in range(n_rows // 5)]
+    return {"vehicles": vehicles, "drivers": drivers, "trips": trips, "expenses": expenses, "maintenance_logs": maintenance}
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
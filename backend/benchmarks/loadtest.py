@@ -0,0 +1,273 @@
+"""
+Load test of the FleetFlow API with realistic traffic mixes.
+
+Boots the app in-process on a local storage backend (in-memory SQLite by default, or a
+local Postgres with schema.sql applied), seeds it through /api/seed with the requested
+fleet size, then runs closed-loop virtual users for a fixed duration. Each scenario
+gets its own number of users:
+
+- dashboard: an open dashboard polling the analytics summary and the vehicle, driver
+             and first trip pages, revalidating with ETags like the browser does
+- dispatch:  dispatch waves: assign a batch of trip requests (creating the drafts),
+             bulk-dispatch them, then bulk-complete them
+- login:     login bursts with the demo accounts (bcrypt-bound)
+- export:    full CSV exports of completed trips
+
+Reports requests, errors, throughput and p50/p95/p99 latency per endpoint and saves the
+run (configuration, git revision and per-endpoint stats) as JSON under
+benchmarks/results/. --compare loads an earlier run and exits with status 1 when an
+endpoint's p95 grew, or its throughput fell, by more than --threshold.
+
+    python benchmarks/loadtest.py [--backend sqlite|postgres] [--dsn postgresql://...]
+        [--vehicles 200] [--drivers 200] [--trips 20000] [--duration 30]
+        [--mix dashboard=8,dispatch=2,login=2,export=1] [--name baseline] [--compare results/baseline.json]
+
+On SQLite the analytics summary runs its analytics_summary fallback instead of the
+incremental snapshot (analytics_state is Postgres-only), so dashboard numbers are only
+comparable between runs on the same backend.
+--url points the same mixes at an already running server instead (seeded separately).
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import httpx
+
+from common import server, client, percentile
+from storage import create_storage
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+DEMO_USERS = {role: {"email": f"{role}@fleetflow.com", "password": "password123"}
+              for role in ("manager", "dispatcher", "safety", "analyst")}
+CITIES = ["Chicago", "Detroit", "Denver", "Houston", "Atlanta", "Phoenix", "Seattle", "Boston"]
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}
+        self.recording = False
+
+    async def request(self, http, label, method, path, **kwargs):
+        start = time.perf_counter()
+        res = await http.request(method, path, **kwargs)
+        size = res.num_bytes_downloaded
+        if self.recording:
+            self.samples.setdefault(label, []).append((time.perf_counter() - start, res.status_code, size))
+        return res
+
+    def stats(self, elapsed):
+        out = {}
+        for label, samples in sorted(self.samples.items()):
+            latencies = [s[0] for s in samples]
+            out[label] = {
+                "requests": len(samples),
+                "errors": sum(1 for s in samples if s[1] >= 400),
+                "rps": round(len(samples) / elapsed, 2),
+                "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+                "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+                "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+                "mean_wire_bytes": round(sum(s[2] for s in samples) / len(samples)),
+            }
+        return out
+
+
+async def dashboard(http, rec, headers, stop, think):
+    etags = {}
+    pages = [("GET /api/analytics/summary", "/api/analytics/summary"), ("GET /api/vehicles", "/api/vehicles"),
+             ("GET /api/drivers", "/api/drivers"), ("GET /api/trips?limit=50", "/api/trips?limit=50")]
+    while not stop.is_set():
+        for label, path in pages:
+            conditional = {"If-None-Match": etags[path]} if path in etags else {}
+            res = await rec.request(http, label, "GET", path, headers={**headers, **conditional})
+            if res.headers.get("etag"):
+                etags[path] = res.headers["etag"]
+        await asyncio.sleep(think)
+
+
+async def dispatch(http, rec, headers, stop, think, wave):
+    n = 0
+    while not stop.is_set():
+        requests = [{"origin": CITIES[(n + i) % len(CITIES)], "destination": CITIES[(n + i + 3) % len(CITIES)],
+                     "cargo_weight": 200 + (n + i) % 20 * 50, "distance": 300, "revenue": 1200} for i in range(wave)]
+        n += wave
+        res = await rec.request(http, "POST /api/trips/assign", "POST", "/api/trips/assign", headers=headers,
+                                json={"trips": requests, "create": True})
+        ids = [item["trip"]["id"] for item in res.json().get("data", []) if item.get("trip")] if res.status_code == 200 else []
+        if ids:
+            res = await rec.request(http, "POST /api/trips/bulk/dispatch", "POST", "/api/trips/bulk/dispatch",
+                                    headers=headers, json={"trip_ids": ids})
+            dispatched = [i["id"] for i in res.json().get("data", []) if i.get("ok")] if res.status_code == 200 else []
+            if dispatched:
+                await rec.request(http, "POST /api/trips/bulk/complete", "POST", "/api/trips/bulk/complete",
+                                  headers=headers, json={"trip_ids": dispatched})
+        await asyncio.sleep(think)
+
+
+async def login(http, rec, headers, stop, think):
+    while not stop.is_set():
+        for credentials in DEMO_USERS.values():
+            await rec.request(http, "POST /api/auth/login", "POST", "/api/auth/login", json=credentials)
+        await asyncio.sleep(think)
+
+
+async def export(http, rec, headers, stop, think):
+    while not stop.is_set():
+        await rec.request(http, "GET /api/export/csv", "GET", "/api/export/csv?status=completed", headers=headers)
+        await asyncio.sleep(think)
+
+
+SCENARIOS = {"dashboard": dashboard, "dispatch": dispatch, "login": login, "export": export}
+
+
+def parse_mix(text):
+    mix = {}
+    for item in text.split(','):
+        name, _, users = item.partition('=')
+        if name.strip() not in SCENARIOS:
+            raise SystemExit(f"Unknown scenario '{name}'. Choose from: {', '.join(SCENARIOS)}")
+        mix[name.strip()] = int(users or 1)
+    return mix
+
+
+async def seed(http, vehicles, drivers, trips):
+    """Seed the demo users and fleet, then add the synthetic fleet on top; returns manager auth headers"""
+    res = await http.post("/api/seed", timeout=None)
+    res.raise_for_status()
+    skipped = res.json().get("skipped")
+    res = await http.post("/api/auth/login", json=DEMO_USERS["manager"])
+    res.raise_for_status()
+    headers = {"Authorization": f"Bearer {res.json()['token']}"}
+    if skipped:
+        print("database already seeded, reusing it")
+        return headers
+    res = await http.post("/api/seed", params={"vehicles": vehicles, "drivers": drivers, "trips": trips, "seed": 1,
+                                               "force": True}, headers=headers, timeout=None)
+    res.raise_for_status()
+    print(f"seeded {res.json()['counts']}")
+    return headers
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(__file__)).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(current, baseline, threshold):
+    """Print per-endpoint deltas against a saved run; returns the endpoints that regressed"""
+    regressions = []
+    print(f"\nvs {baseline['name']} ({baseline['revision']}, {baseline['started_at']})")
+    changed = sorted(k for k in current["config"] if current["config"][k] != baseline["config"].get(k))
+    if changed:
+        print(f"warning: the runs differ in {', '.join(changed)}; the comparison is not like for like")
+    print(f"{'endpoint':<32} {'p95 (ms)':>20} {'req/s':>20}")
+    for label, now in current["endpoints"].items():
+        before = baseline["endpoints"].get(label)
+        if not before:
+            print(f"{label:<32} {'new':>20}")
+            continue
+        p95 = now["p95_ms"] / before["p95_ms"] - 1 if before["p95_ms"] else 0
+        rps = now["rps"] / before["rps"] - 1 if before["rps"] else 0
+        flag = p95 > threshold or rps < -threshold
+        if flag:
+            regressions.append(label)
+        print(f"{label:<32} {before['p95_ms']:>8.1f} -> {now['p95_ms']:>7.1f} {p95:>+5.0%} "
+              f"{before['rps']:>8.1f} -> {now['rps']:>7.1f} {rps:>+5.0%}{'  REGRESSION' if flag else ''}")
+    return regressions
+
+
+async def main(args):
+    mix = parse_mix(args.mix)
+    if args.url:
+        http = httpx.AsyncClient(base_url=args.url, timeout=None)
+    else:
+        server.ALLOW_SYNTHETIC_SEED = True
+        server.store = create_storage(args.backend, database_url=args.dsn, sqlite_path=args.sqlite_path,
+                                      pool_size=server.DB_POOL_SIZE)
+        http = client()
+        http.timeout = None
+    rec = Recorder()
+    async with http:
+        if args.url:
+            res = await http.post("/api/auth/login", json=DEMO_USERS["manager"])
+            res.raise_for_status()
+            headers = {"Authorization": f"Bearer {res.json()['token']}"}
+        else:
+            headers = await seed(http, args.vehicles, args.drivers, args.trips)
+
+        stop = asyncio.Event()
+        extra = {"dispatch": {"wave": args.wave}}
+        users = [asyncio.create_task(SCENARIOS[name](http, rec, headers, stop, args.think, **extra.get(name, {})))
+                 for name, count in mix.items() for _ in range(count)]
+        await asyncio.sleep(args.warmup)
+        rec.recording = True
+        started = time.perf_counter()
+        await asyncio.sleep(args.duration)
+        rec.recording = False
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await asyncio.gather(*users, return_exceptions=True)
+    if not args.url and hasattr(server.store, 'close'):
+        await server.store.close()
+
+    result = {
+        "name": args.name or datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ"),
+        "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "config": {"backend": "external" if args.url else args.backend, "vehicles": args.vehicles, "drivers": args.drivers,
+                   "trips": args.trips, "mix": mix, "duration": args.duration, "think": args.think, "wave": args.wave},
+        "endpoints": rec.stats(elapsed),
+    }
+    total = sum(e["requests"] for e in result["endpoints"].values())
+    result["total_rps"] = round(total / elapsed, 2)
+
+    print(f"\n{args.duration:.0f}s, mix {args.mix}, {total} requests, {result['total_rps']} req/s")
+    print(f"{'endpoint':<32} {'requests':>8} {'errors':>6} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'bytes':>9}")
+    for label, s in result["endpoints"].items():
+        print(f"{label:<32} {s['requests']:>8} {s['errors']:>6} {s['rps']:>8.1f} {s['p50_ms']:>8.1f} "
+              f"{s['p95_ms']:>8.1f} {s['p99_ms']:>8.1f} {s['mean_wire_bytes']:>9}")
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"{result['name']}.json")
+    with open(path, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"saved {path}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(result, json.load(f), args.threshold)
+        if regressions:
+            print(f"{len(regressions)} endpoint(s) regressed by more than {args.threshold:.0%}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backend", choices=("sqlite", "postgres"), default="sqlite")
+    parser.add_argument("--dsn", default=os.environ.get("DATABASE_URL"), help="postgres backend connection string")
+    parser.add_argument("--sqlite-path", default=":memory:")
+    parser.add_argument("--url", help="load-test a running server instead of booting one")
+    parser.add_argument("--vehicles", type=int, default=200)
+    parser.add_argument("--drivers", type=int, default=200)
+    parser.add_argument("--trips", type=int, default=20000)
+    parser.add_argument("--mix", default="dashboard=8,dispatch=2,login=2,export=1",
+                        help="virtual users per scenario")
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--warmup", type=float, default=3)
+    parser.add_argument("--think", type=float, default=0.0, help="seconds each user waits between iterations")
+    parser.add_argument("--wave", type=int, default=20, help="trips per dispatch wave")
+    parser.add_argument("--name", help="result name (default: a UTC timestamp)")
+    parser.add_argument("--compare", help="earlier result JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25)
+    args = parser.parse_args()
+    if args.backend == "postgres" and not (args.dsn or args.url):
+        parser.error("--backend postgres needs --dsn or DATABASE_URL")
+    sys.exit(asyncio.run(main(args)))
@@ -0,0 +1,142 @@
+"""Read-through cache for the reference tables (vehicles, drivers), invalidated by table generation"""
+import json
+import asyncio
+
+from cachetools import TTLCache
+
+
+def _rows_in(value) -> int:
+    """Size of an entry for the bound: the rows in a list response (or a tagged one), 1 for a single row"""
+    if isinstance(value, dict) and isinstance(value.get('payload'), dict):
+        value = value['payload']
+    if isinstance(value, dict) and isinstance(value.get('data'), list):
+        return len(value['data']) + 1
+    return 1
+
+
+class _RowBoundedCache(TTLCache):
+    def __init__(self, maxsize, ttl):
+        super().__init__(maxsize=maxsize, ttl=ttl, getsizeof=_rows_in)
+        self.evictions = 0
+
+    def popitem(self):
+        self.evictions += 1
+        return super().popitem()
+
+
+class LocalStore:
+    name = "local"
+
+    def __init__(self, max_rows=50000, ttl=30):
+        self.entries = _RowBoundedCache(max_rows, ttl)
+        self.generations = {}
+
+    async def generation(self, table):
+        return self.generations.get(table, 0)
+
+    async def bump(self, table):
+        self.generations[table] = self.generations.get(table, 0) + 1
+
+    async def get_many(self, keys):
+        return [self.entries.get(k) for k in keys]
+
+    async def set_many(self, items):
+        for key, value in items.items():
+            try:
+                self.entries[key] = value
+            except ValueError:
+                pass  # a single list larger than the whole cache: serve it uncached
+
+    def info(self):
+        return {"size": self.entries.currsize, "max_size": self.entries.maxsize,
+                "ttl_seconds": self.entries.ttl, "evictions": self.entries.evictions}
+
+
+class RedisStore:
+    name = "redis"
+
+    def __init__(self, url, ttl=30, prefix="fleetflow:cache:"):
+        import redis.asyncio as redis  # only needed when a shared cache is configured
+
+        self.redis = redis.from_url(url)
+        self.ttl_ms = int(ttl * 1000)
+        self.prefix = prefix
+
+    async def generation(self, table):
+        return int(await self.redis.get(f"{self.prefix}gen:{table}") or 0)
+
+    async def bump(self, table):
+        await self.redis.incr(f"{self.prefix}gen:{table}")
+
+    async def get_many(self, keys):
+        values = await self.redis.mget([self.prefix + k for k in keys])
+        return [json.loads(v) if v is not None else None for v in values]
+
+    async def set_many(self, items):
+        pipe = self.redis.pipeline(transaction=False)
+        for key, value in items.items():
+            pipe.set(self.prefix + key, json.dumps(value, default=str), px=self.ttl_ms)
+        await pipe.execute()
+
+    def info(self):
+        # Size and eviction are Redis' own business (maxmemory / maxmemory-policy)
+        return {"ttl_seconds": self.ttl_ms / 1000}
+
+
+class RefCache:
+    def __init__(self, store):
+        self.store = store
+        self.stats = {}
+        self.inflight = {}
+
+    def _count(self, table, hits, misses):
+        stats = self.stats.setdefault(table, {"hits": 0, "misses": 0})
+        stats["hits"] += hits
+        stats["misses"] += misses
+
+    async def rows(self, table, ids, load):
+        """Rows of `table` with the given ids; the missing ones come from the `load(ids)` coroutine in one call"""
+        ids = list(dict.fromkeys(ids))
+        generation = await self.store.generation(table)
+        cached = await self.store.get_many([f"{table}:{generation}:row:{i}" for i in ids]) if ids else []
+        rows = [r for r in cached if r is not None]
+        missing = [i for i, r in zip(ids, cached) if r is None]
+        self._count(table, len(rows), len(missing))
+        if missing:
+            loaded = await load(missing)
+            await self.store.set_many({f"{table}:{generation}:row:{r['id']}": r for r in loaded})
+            rows += loaded
+        return rows
+
+    async def query(self, table, params, load):
+        """Result of the list query described by `params`, from the `load()` coroutine on a miss"""
+        generation = await self.store.generation(table)
+        key = f"{table}:{generation}:list:{json.dumps(params, sort_keys=True, default=str)}"
+        (value,) = await self.store.get_many([key])
+        self._count(table, value is not None, value is None)
+        if value is not None:
+            return value
+        task = self.inflight.get(key)
+        if task is None:
+            task = self.inflight[key] = asyncio.ensure_future(self._load(key, load))
+            task.add_done_callback(lambda _: self.inflight.pop(key, None))
+        # Shielded: a client disconnecting mustn't cancel the load other requests wait on
+        return await asyncio.shield(task)
+
+    async def _load(self, key, load):
+        value = await load()
+        await self.store.set_many({key: value})
+        return value
+
+    async def invalidate(self, *tables):
+        for table in tables:
+            await self.store.bump(table)
+
+    def info(self):
+        hits = sum(s["hits"] for s in self.stats.values())
+        misses = sum(s["misses"] for s in self.stats.values())
+        return {"backend": self.store.name, "hits": hits, "misses": misses,
+                "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0,
+                "tables": {t: {**s, "hit_rate": round(s["hits"] / (s["hits"] + s["misses"]), 4)
+                               if s["hits"] + s["misses"] else 0} for t, s in self.stats.items()},
+                **self.store.info()}
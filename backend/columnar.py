@@ -0,0 +1,118 @@
+"""Typed columnar exports (Parquet and Arrow IPC stream), encoded page by page"""
+from datetime import datetime, date
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+TIMESTAMP = pa.timestamp('us', tz='UTC')
+ROW_GROUP_ROWS = 16384
+
+# dataset -> (table, PostgREST select, arrow schema)
+DATASETS = {
+    'trips': ('trips', '*, vehicles(name), drivers(full_name)', pa.schema([
+        ('id', pa.string()), ('vehicle_id', pa.string()), ('vehicle_name', pa.string()),
+        ('driver_id', pa.string()), ('driver_name', pa.string()),
+        ('origin', pa.string()), ('destination', pa.string()),
+        ('cargo_weight', pa.float64()), ('distance', pa.float64()), ('revenue', pa.float64()),
+        ('status', pa.string()), ('start_time', TIMESTAMP), ('end_time', TIMESTAMP), ('created_at', TIMESTAMP),
+    ])),
+    'expenses': ('expenses', '*', pa.schema([
+        ('id', pa.string()), ('vehicle_id', pa.string()), ('trip_id', pa.string()),
+        ('fuel_liters', pa.float64()), ('fuel_cost', pa.float64()), ('other_cost', pa.float64()),
+        ('created_at', TIMESTAMP),
+    ])),
+    'maintenance': ('maintenance_logs', '*', pa.schema([
+        ('id', pa.string()), ('vehicle_id', pa.string()), ('description', pa.string()),
+        ('cost', pa.float64()), ('service_date', pa.date32()), ('status', pa.string()),
+        ('created_at', TIMESTAMP),
+    ])),
+}
+
+FORMATS = {
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows'),
+}
+
+
+def _flatten(row):
+    """Lift the embedded vehicle/driver names of a trip row into plain columns"""
+    if 'vehicles' in row or 'drivers' in row:
+        row = dict(row)
+        row['vehicle_name'] = (row.pop('vehicles', None) or {}).get('name')
+        row['driver_name'] = (row.pop('drivers', None) or {}).get('full_name')
+    return row
+
+
+def _convert(value, type_):
+    if value is None:
+        return None
+    if type_ == TIMESTAMP:
+        return datetime.fromisoformat(value)
+    if type_ == pa.date32():
+        return date.fromisoformat(value[:10])
+    if type_ == pa.float64():
+        return float(value)
+    return str(value)
+
+
+def to_record_batch(rows, schema):
+    rows = [_flatten(r) for r in rows]
+    return pa.RecordBatch.from_arrays(
+        [pa.array([_convert(r.get(f.name), f.type) for r in rows], type=f.type) for f in schema], schema=schema)
+
+
+class _ChunkSink:
+    """Write-only file object that hands back whatever has been written since the last drain"""
+
+    def __init__(self):
+        self._chunks = []
+        self._pos = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._pos
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+async def encode_stream(pages, schema, fmt, row_group_rows=ROW_GROUP_ROWS):
+    """Yield Parquet or Arrow IPC stream bytes for an async iterator of row pages"""
+    sink = _ChunkSink()
+    if fmt == 'parquet':
+        writer = pq.ParquetWriter(pa.PythonFile(sink, mode='w'), schema, compression='zstd')
+    else:
+        writer = pa.ipc.new_stream(pa.PythonFile(sink, mode='w'), schema,
+                                   options=pa.ipc.IpcWriteOptions(compression='zstd'))
+    pending = []
+    async for rows in pages:
+        batch = to_record_batch(rows, schema)
+        if fmt == 'parquet':
+            pending.append(batch)
+            if sum(b.num_rows for b in pending) < row_group_rows:
+                continue
+            writer.write_table(pa.Table.from_batches(pending), row_group_size=row_group_rows)
+            pending = []
+        else:
+            writer.write_batch(batch)
+        data = sink.drain()
+        if data:
+            yield data
+    if pending:
+        writer.write_table(pa.Table.from_batches(pending), row_group_size=row_group_rows)
+    writer.close()
+    yield sink.drain()
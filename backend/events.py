@@ -0,0 +1,77 @@
+"""In-process fan-out of mutation events to Server-Sent Events subscribers, coalesced per row"""
+import asyncio
+
+
+class Subscriber:
+    def __init__(self, max_pending, window):
+        self.max_pending = max_pending
+        self.window = window
+        self.pending = {}
+        self.overflowed = False
+        self.wakeup = asyncio.Event()
+
+    def push(self, key, event):
+        if self.overflowed:
+            return
+        # Re-insert so the batch keeps the order of each row's latest change
+        self.pending.pop(key, None)
+        self.pending[key] = event
+        if len(self.pending) > self.max_pending:
+            self.pending.clear()
+            self.overflowed = True
+        self.wakeup.set()
+
+    async def next_batch(self, timeout):
+        """Wait up to `timeout` seconds: None, ('resync', []) after an overflow, or ('changes', events)"""
+        try:
+            await asyncio.wait_for(self.wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        await asyncio.sleep(self.window)
+        self.wakeup.clear()
+        if self.overflowed:
+            self.overflowed = False
+            return 'resync', []
+        events = list(self.pending.values())
+        self.pending.clear()
+        return 'changes', events
+
+
+class EventHub:
+    def __init__(self, max_pending=1000, window=0.2):
+        self.max_pending = max_pending
+        self.window = window
+        self.subscribers = set()
+        self.stats = {"published": 0, "overflows": 0}
+
+    def subscribe(self) -> Subscriber:
+        sub = Subscriber(self.max_pending, self.window)
+        self.subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscriber):
+        self.subscribers.discard(sub)
+
+    def _push(self, key, event):
+        self.stats["published"] += 1
+        for sub in self.subscribers:
+            was_overflowed = sub.overflowed
+            sub.push(key, event)
+            if sub.overflowed and not was_overflowed:
+                self.stats["overflows"] += 1
+
+    def publish(self, table, op, row=None, row_id=None):
+        """Announce an 'upsert' (with the row in list-endpoint shape) or a 'delete' (row_id only)"""
+        row_id = row['id'] if row else row_id
+        if row_id is None:
+            return
+        self._push((table, row_id), {"table": table, "op": op, "id": row_id, "row": row})
+
+    def publish_rows(self, table, rows):
+        for row in rows or ():
+            self.publish(table, 'upsert', row)
+
+    def refresh(self, *tables):
+        """Changes too broad to list (bulk import, seeding, cascading deletes): the client reloads these tables"""
+        for table in tables:
+            self._push((table, None), {"table": table, "op": "refresh", "id": None, "row": None})
@@ -0,0 +1,139 @@
+"""Streaming bulk import of CSV or NDJSON uploads"""
+import csv
+import json
+import time
+import codecs
+import heapq
+import asyncio
+
+from pydantic import ValidationError
+
+FORMATS = ('csv', 'ndjson')
+
+
+async def _lines(chunks):
+    decoder = codecs.getincrementaldecoder('utf-8-sig')(errors='replace')
+    pending = ''
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split('\n')
+        for line in lines:
+            yield line + '\n'
+    pending += decoder.decode(b'', final=True)
+    if pending:
+        yield pending
+
+
+async def iter_records(chunks, fmt):
+    """Yield (line number, record dict, error) for an async iterator of body chunks"""
+    line_no = 0
+    if fmt == 'ndjson':
+        async for line in _lines(chunks):
+            line_no += 1
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield line_no, None, f"Invalid JSON: {e}"
+                continue
+            if isinstance(record, dict):
+                yield line_no, record, None
+            else:
+                yield line_no, None, "Expected a JSON object"
+        return
+
+    header = None
+    record, start, quotes = [], 0, 0
+    async for line in _lines(chunks):
+        line_no += 1
+        if not record:
+            start = line_no
+        record.append(line)
+        quotes += line.count('"')
+        if quotes % 2:
+            continue  # quoted field continues on the next line
+        values = next(csv.reader(record), [])
+        record, quotes = [], 0
+        if not any(v.strip() for v in values):
+            continue
+        if header is None:
+            header = [h.strip() for h in values]
+        elif len(values) != len(header):
+            yield start, None, f"Expected {len(header)} columns, got {len(values)}"
+        else:
+            # Empty cells count as not given, so the model's defaults apply
+            yield start, {k: v for k, v in zip(header, values) if v != ''}, None
+    if record:
+        yield start, None, "Unterminated quoted field"
+
+
+def _validation_message(e: ValidationError) -> str:
+    return '; '.join(f"{'.'.join(str(p) for p in err['loc']) or 'row'}: {err['msg']}" for err in e.errors())
+
+
+def _is_data_error(e: Exception) -> bool:
+    """Postgres data exception (22xxx) or integrity violation (23xxx): the rows are at fault, not the connection"""
+    return str(getattr(e, 'code', None) or '')[:2] in ('22', '23')
+
+
+async def import_records(records, model, prepare, insert, batch_size=500, parallel=4, max_errors=1000):
+    """Validate, prepare and insert `records` in parallel batches; returns counts, errors and throughput"""
+    started = time.perf_counter()
+    slots = asyncio.Semaphore(parallel)
+    stats = {"received": 0, "inserted": 0, "failed": 0}
+    # Batches fail in any order: keep the max_errors lowest line numbers in a max-heap on line
+    errors = []
+
+    def fail(line, error):
+        stats['failed'] += 1
+        entry = (-line, error)
+        if len(errors) < max_errors:
+            heapq.heappush(errors, entry)
+        elif max_errors and entry > errors[0]:
+            heapq.heapreplace(errors, entry)
+
+    async def write(lines, rows):
+        try:
+            await insert(rows)
+            stats['inserted'] += len(rows)
+        except Exception as e:
+            if len(rows) > 1 and _is_data_error(e):
+                mid = len(rows) // 2
+                await write(lines[:mid], rows[:mid])
+                await write(lines[mid:], rows[mid:])
+            else:
+                for line in lines:
+                    fail(line, getattr(e, 'message', None) or str(e))
+
+    async def flush(lines, rows):
+        try:
+            await write(lines, rows)
+        finally:
+            slots.release()
+
+    tasks, lines, rows = [], [], []
+    async for line, record, error in records:
+        stats['received'] += 1
+        if error is None:
+            try:
+                rows.append(prepare(model.model_validate(record)))
+                lines.append(line)
+            except ValidationError as e:
+                error = _validation_message(e)
+        if error is not None:
+            fail(line, error)
+        elif len(rows) >= batch_size:
+            await slots.acquire()
+            tasks = [t for t in tasks if not t.done()]
+            tasks.append(asyncio.create_task(flush(lines, rows)))
+            lines, rows = [], []
+    if rows:
+        await slots.acquire()
+        tasks.append(asyncio.create_task(flush(lines, rows)))
+    await asyncio.gather(*tasks)
+    errors = [{"line": -line, "error": error} for line, error in sorted(errors, reverse=True)]
+
+    elapsed = time.perf_counter() - started
+    return {**stats, "errors": errors, "errors_truncated": stats['failed'] > len(errors),
+            "seconds": round(elapsed, 2), "rows_per_sec": round(stats['inserted'] / elapsed, 1) if elapsed > 0 else None}
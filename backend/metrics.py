@@ -0,0 +1,184 @@
+"""Per-request timing (Server-Timing), DB call accounting and Prometheus metrics"""
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from starlette.datastructures import MutableHeaders
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+DB_CALL_BUCKETS = (0, 1, 2, 3, 4, 6, 8, 12, 16, 32, 64)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+_current = ContextVar("request_timing", default=None)
+
+
+class RequestTiming:
+    __slots__ = ("start", "db_calls", "db_seconds", "phases")
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.db_calls = 0
+        self.db_seconds = 0.0
+        self.phases = {}
+
+    def server_timing(self, db=True) -> str:
+        entries = [f"total;dur={(time.perf_counter() - self.start) * 1000:.1f}"]
+        if db:
+            entries.append(f'db;desc="{self.db_calls} calls";dur={self.db_seconds * 1000:.1f}')
+        entries += [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.phases.items()]
+        return ", ".join(entries)
+
+
+def current_timing():
+    """The RequestTiming of the request being handled, or None outside a request"""
+    return _current.get()
+
+
+@contextmanager
+def db_call():
+    timing = _current.get()
+    if timing is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing.db_calls += 1
+        timing.db_seconds += time.perf_counter() - start
+
+
+@contextmanager
+def phase(name):
+    timing = _current.get()
+    if timing is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing.phases[name] = timing.phases.get(name, 0.0) + time.perf_counter() - start
+
+
+def _labels(names, values) -> str:
+    return ",".join(f'{n}="{v}"' for n, v in zip(names, values))
+
+
+class Histogram:
+    def __init__(self, name, help, buckets, labels=("method", "route")):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.labels = labels
+        self.series = {}
+
+    def observe(self, values, amount):
+        series = self.series.get(values)
+        if series is None:
+            # Per-bucket counts (the last one is +Inf), sum, count
+            series = self.series[values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, amount)] += 1
+        series[1] += amount
+        series[2] += 1
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for values, (counts, total, count) in sorted(self.series.items()):
+            labels = _labels(self.labels, values)
+            cumulative = 0
+            for bound, n in zip(self.buckets + ("+Inf",), counts):
+                cumulative += n
+                yield f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+            yield f"{self.name}_sum{{{labels}}} {total}"
+            yield f"{self.name}_count{{{labels}}} {count}"
+
+
+class Counter:
+    def __init__(self, name, help, labels):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.series = {}
+
+    def inc(self, values, amount=1):
+        self.series[values] = self.series.get(values, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for values, count in sorted(self.series.items()):
+            yield f"{self.name}{{{_labels(self.labels, values)}}} {count}"
+
+
+class Metrics:
+    def __init__(self, prefix="fleetflow"):
+        self.prefix = prefix
+        self.in_progress = 0
+        self.requests = Counter(f"{prefix}_http_requests_total", "Requests by route and status",
+                                ("method", "route", "status"))
+        self.duration = Histogram(f"{prefix}_http_request_duration_seconds", "Request wall time", DURATION_BUCKETS)
+        self.db_calls = Histogram(f"{prefix}_http_request_db_calls", "Database calls per request", DB_CALL_BUCKETS)
+        self.db_seconds = Histogram(f"{prefix}_http_request_db_seconds", "Summed database call time per request",
+                                    DURATION_BUCKETS)
+        self.response_bytes = Histogram(f"{prefix}_http_response_bytes", "Response body bytes as sent", SIZE_BUCKETS)
+
+    def record(self, method, route, status, seconds, timing, size):
+        key = (method, route)
+        self.requests.inc((method, route, status))
+        self.duration.observe(key, seconds)
+        self.db_calls.observe(key, timing.db_calls)
+        self.db_seconds.observe(key, timing.db_seconds)
+        self.response_bytes.observe(key, size)
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.prefix}_http_requests_in_progress Requests being handled",
+                 f"# TYPE {self.prefix}_http_requests_in_progress gauge",
+                 f"{self.prefix}_http_requests_in_progress {self.in_progress}"]
+        for metric in (self.requests, self.duration, self.db_calls, self.db_seconds, self.response_bytes):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class TimingMiddleware:
+    """ASGI middleware: times each request, adds Server-Timing and records it in `metrics`"""
+
+    def __init__(self, app, metrics, server_timing=True):
+        self.app = app
+        self.metrics = metrics
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        timing = RequestTiming()
+        token = _current.set(timing)
+        status, size = 500, 0
+
+        async def send_timed(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.server_timing:
+                    headers = MutableHeaders(scope=message)
+                    # No Content-Length on a response with a body: it is streamed and its queries haven't run yet
+                    streamed = "content-length" not in headers and status not in (204, 304)
+                    headers.append("Server-Timing", timing.server_timing(db=not streamed))
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        self.metrics.in_progress += 1
+        try:
+            await self.app(scope, receive, send_timed)
+        finally:
+            _current.reset(token)
+            self.metrics.in_progress -= 1
+            # The router stores the matched route in the scope; anything unrouted shares one series
+            route = scope.get("route")
+            self.metrics.record(scope["method"], route.path if route is not None else "unmatched", status,
+                                time.perf_counter() - timing.start, timing, size)
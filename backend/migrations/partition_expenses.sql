@@ -0,0 +1,150 @@
+-- FleetFlow migration: partition expenses by month
+-- For deployments whose expenses table was created before schema.sql declared it
+-- partitioned. Run it once in the Supabase SQL Editor; it is safe to run again (it does
+-- nothing once expenses is partitioned) and on fresh installs.
+--
+-- The plain table's rows are copied into a RANGE (created_at) partitioned table with
+-- monthly partitions and a default partition. Views that read expenses, directly or
+-- through other views, are dropped and recreated in dependency order, and the table's
+-- policies, change tracking and Realtime publication membership are carried over.
+-- The primary key becomes (id, created_at), as a partitioned table's unique keys must
+-- include the partition column. Everything runs in one transaction that holds an
+-- exclusive lock on expenses while the rows are copied.
+
+BEGIN;
+
+-- Same definition as in schema.sql
+CREATE OR REPLACE FUNCTION create_month_partitions(p_table text, p_from date, p_to date)
+RETURNS int AS $$
+DECLARE
+  month date := date_trunc('month', p_from);
+  part text;
+  fallback text := p_table || '_default';
+  misplaced boolean;
+  created int := 0;
+BEGIN
+  IF NOT EXISTS (SELECT 1 FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+                 WHERE n.nspname = 'public' AND c.relname = p_table AND c.relkind = 'p') THEN
+    RAISE SQLSTATE 'PT400' USING MESSAGE = format('%s is not a partitioned table', p_table);
+  END IF;
+  WHILE month <= p_to LOOP
+    part := format('%s_%s', p_table, to_char(month, 'YYYY_MM'));
+    IF to_regclass(part) IS NULL THEN
+      EXECUTE format('SELECT EXISTS (SELECT 1 FROM %I WHERE created_at >= %L AND created_at < %L)',
+                     fallback, month, month + 1 * interval '1 month') INTO misplaced;
+      IF misplaced THEN
+        EXECUTE format('ALTER TABLE %I DETACH PARTITION %I', p_table, fallback);
+      END IF;
+      EXECUTE format('CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                     part, p_table, month, month + interval '1 month');
+      IF misplaced THEN
+        EXECUTE format('WITH moved AS (DELETE FROM %1$I WHERE created_at >= %3$L AND created_at < %4$L RETURNING *) '
+                       'INSERT INTO %2$I SELECT * FROM moved', fallback, part, month, month + interval '1 month');
+        EXECUTE format('ALTER TABLE %I ATTACH PARTITION %I DEFAULT', p_table, fallback);
+      END IF;
+      created := created + 1;
+    END IF;
+    month := month + interval '1 month';
+  END LOOP;
+  RETURN created;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+REVOKE ALL ON FUNCTION create_month_partitions(text, date, date) FROM PUBLIC;
+DO $$
+BEGIN
+  IF EXISTS (SELECT 1 FROM pg_roles WHERE rolname = 'service_role') THEN
+    GRANT EXECUTE ON FUNCTION create_month_partitions(text, date, date) TO service_role;
+  END IF;
+END $$;
+
+DO $$
+DECLARE
+  first_month date;
+  drops text[];
+  creates text[];
+  policies text[];
+  published boolean;
+  stmt text;
+BEGIN
+  IF (SELECT relkind FROM pg_class WHERE oid = 'expenses'::regclass) = 'p' THEN
+    RETURN;
+  END IF;
+  LOCK TABLE expenses IN ACCESS EXCLUSIVE MODE;
+
+  -- Every view that depends on expenses, at the length of its longest dependency path:
+  -- dropped deepest first, recreated shallowest first
+  WITH RECURSIVE dependents(oid, depth) AS (
+    SELECT r.ev_class, 1
+    FROM pg_depend d
+    JOIN pg_rewrite r ON r.oid = d.objid
+    WHERE d.refobjid = 'expenses'::regclass AND r.ev_class <> 'expenses'::regclass
+    UNION
+    SELECT r.ev_class, p.depth + 1
+    FROM dependents p
+    JOIN pg_depend d ON d.refobjid = p.oid
+    JOIN pg_rewrite r ON r.oid = d.objid
+    WHERE r.ev_class <> p.oid
+  ), views AS (
+    SELECT v.oid, max(v.depth) AS depth
+    FROM dependents v JOIN pg_class c ON c.oid = v.oid AND c.relkind = 'v'
+    GROUP BY v.oid
+  )
+  SELECT array_agg(format('DROP VIEW %s', oid::regclass) ORDER BY depth DESC, oid),
+         array_agg(format('CREATE VIEW %s AS %s', oid::regclass, pg_get_viewdef(oid)) ORDER BY depth, oid)
+  INTO drops, creates
+  FROM views;
+  SELECT array_agg(format('CREATE POLICY %I ON expenses AS %s FOR %s TO %s%s%s', policyname, permissive, cmd,
+                          array_to_string(roles, ', '), ' USING (' || qual || ')', ' WITH CHECK (' || with_check || ')'))
+  INTO policies
+  FROM pg_policies WHERE schemaname = 'public' AND tablename = 'expenses';
+  SELECT EXISTS (SELECT 1 FROM pg_publication_tables WHERE pubname = 'supabase_realtime' AND tablename = 'expenses')
+  INTO published;
+
+  FOREACH stmt IN ARRAY COALESCE(drops, '{}') LOOP
+    EXECUTE stmt;
+  END LOOP;
+  ALTER TABLE expenses RENAME TO expenses_unpartitioned;
+  ALTER TABLE expenses_unpartitioned RENAME CONSTRAINT expenses_pkey TO expenses_unpartitioned_pkey;
+
+  CREATE TABLE expenses (
+    id uuid DEFAULT gen_random_uuid(),
+    vehicle_id uuid REFERENCES vehicles(id),
+    trip_id uuid REFERENCES trips(id),
+    fuel_liters numeric,
+    fuel_cost numeric,
+    other_cost numeric DEFAULT 0,
+    created_at timestamptz NOT NULL DEFAULT now(),
+    PRIMARY KEY (id, created_at)
+  ) PARTITION BY RANGE (created_at);
+  CREATE TABLE expenses_default PARTITION OF expenses DEFAULT;
+  SELECT LEAST(min(created_at), now()) INTO first_month FROM expenses_unpartitioned;
+  PERFORM create_month_partitions('expenses', COALESCE(first_month, now()::date), (now() + interval '3 months')::date);
+  INSERT INTO expenses (id, vehicle_id, trip_id, fuel_liters, fuel_cost, other_cost, created_at)
+  SELECT id, vehicle_id, trip_id, fuel_liters, fuel_cost, other_cost, COALESCE(created_at, now())
+  FROM expenses_unpartitioned;
+  DROP TABLE expenses_unpartitioned;
+
+  ALTER TABLE expenses ENABLE ROW LEVEL SECURITY;
+  FOREACH stmt IN ARRAY COALESCE(policies, '{}') LOOP
+    EXECUTE stmt;
+  END LOOP;
+  FOREACH stmt IN ARRAY COALESCE(creates, '{}') LOOP
+    EXECUTE stmt;
+  END LOOP;
+  -- Change feed triggers, when the deployment has the change feed (schema.sql's track_changes)
+  IF to_regprocedure('track_changes(text)') IS NOT NULL THEN
+    PERFORM track_changes('expenses');
+  END IF;
+  IF published THEN
+    ALTER PUBLICATION supabase_realtime SET (publish_via_partition_root = true);
+    ALTER PUBLICATION supabase_realtime ADD TABLE expenses;
+  END IF;
+END $$;
+
+-- The indexes schema.sql declares on expenses (created on every partition)
+CREATE INDEX IF NOT EXISTS expenses_created_idx ON expenses (created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS expenses_vehicle_created_idx ON expenses (vehicle_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS expenses_trip_idx ON expenses (trip_id);
+
+COMMIT;
@@ -0,0 +1,107 @@
+"""Trip planning: batch validation of candidate trips and min-cost vehicle and driver assignment"""
+from datetime import date
+
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+# Cost of an impossible pairing (cargo over capacity); far above any real cost, so the
+# solver only uses one when no feasible alternative exists and we can filter it out
+INFEASIBLE = 1e9
+# Extra cost of sending a vehicle whose last known location isn't the trip's origin
+RELOCATION_COST = 1.0
+
+
+def _lookup(ids, rows):
+    """Position of each id in `rows`, or -1 (which indexes the sentinel appended to each column)"""
+    index = {r['id']: i for i, r in enumerate(rows)}
+    return np.fromiter((index.get(i, -1) for i in ids), dtype=np.int64, count=len(ids))
+
+
+def check_trips(trips, vehicles, drivers, today=None):
+    """create_trip's checks for a batch: per candidate, its (status, message) errors in create_trip's order"""
+    today = np.datetime64(today or date.today(), 'D')
+    n = len(trips)
+    vi = _lookup([t['vehicle_id'] for t in trips], vehicles)
+    di = _lookup([t['driver_id'] for t in trips], drivers)
+    cargo = np.fromiter((float(t.get('cargo_weight') or 0) for t in trips), dtype=np.float64, count=n)
+
+    v_status = np.array([v['status'] for v in vehicles] + [None], dtype=object)[vi]
+    v_capacity = np.array([float(v.get('max_capacity') or 0) for v in vehicles] + [np.inf])[vi]
+    d_status = np.array([d['status'] for d in drivers] + [None], dtype=object)[di]
+    d_expiry = np.array([d.get('license_expiry') for d in drivers] + [None], dtype='datetime64[D]')[di]
+
+    vehicle_missing = vi < 0
+    driver_missing = di < 0
+    checks = [
+        (vehicle_missing, 404, lambda i: "Vehicle not found"),
+        (~vehicle_missing & (v_status != 'available'), 400,
+         lambda i: f"Vehicle is '{v_status[i]}', must be 'available'"),
+        (driver_missing, 404, lambda i: "Driver not found"),
+        (d_status == 'suspended', 400, lambda i: "Driver is suspended"),
+        (d_expiry < today, 400, lambda i: "Driver's license has expired"),
+        (cargo > v_capacity, 400,
+         lambda i: f"Cargo weight ({trips[i]['cargo_weight']}kg) exceeds vehicle capacity ({vehicles[vi[i]]['max_capacity']}kg)"),
+    ]
+
+    errors = [[] for _ in range(n)]
+    for mask, status, message in checks:
+        for i in np.flatnonzero(mask):
+            errors[i].append((status, message(i)))
+    return errors
+
+
+def _solve(cost):
+    """Row -> column assignment (-1 when unassigned) that minimises the total cost, skipping infeasible pairs"""
+    assigned = np.full(cost.shape[0], -1, dtype=np.int64)
+    if cost.size:
+        rows, cols = linear_sum_assignment(cost)
+        feasible = cost[rows, cols] < INFEASIBLE
+        assigned[rows[feasible]] = cols[feasible]
+    return assigned
+
+
+def vehicle_costs(trips, vehicles):
+    """trips x vehicles cost: unused capacity share, plus RELOCATION_COST off-location; INFEASIBLE if it can't fit"""
+    cargo = np.fromiter((float(t['cargo_weight']) for t in trips), dtype=np.float64, count=len(trips))
+    capacity = np.fromiter((float(v['max_capacity'] or 0) for v in vehicles), dtype=np.float64, count=len(vehicles))
+    places = {}
+    origin = np.fromiter((places.setdefault(t['origin'], len(places)) for t in trips), dtype=np.int64, count=len(trips))
+    location = np.fromiter((places.get(v.get('location'), -1) for v in vehicles), dtype=np.int64, count=len(vehicles))
+
+    unused = (capacity[None, :] - cargo[:, None]) / np.maximum(capacity, 1e-9)[None, :]
+    cost = unused + RELOCATION_COST * (origin[:, None] != location[None, :])
+    return np.where(cargo[:, None] <= capacity[None, :], cost, INFEASIBLE)
+
+
+def driver_costs(trips, drivers):
+    """trips x drivers cost (load share x risk) that puts the safest drivers on the heaviest loads"""
+    return _loads(trips)[:, None] * _risks(drivers)[None, :]
+
+
+def _loads(trips):
+    cargo = np.fromiter((float(t['cargo_weight']) for t in trips), dtype=np.float64, count=len(trips))
+    return cargo / cargo.max() if len(cargo) and cargo.max() > 0 else np.ones_like(cargo)
+
+
+def _risks(drivers):
+    return 1 - np.fromiter((float(d.get('safety_score') or 0) for d in drivers), dtype=np.float64, count=len(drivers)) / 100
+
+
+def _assign_drivers(trips, drivers):
+    """Optimal assignment for driver_costs by sorting (rearrangement inequality); heaviest loads first"""
+    assigned = np.full(len(trips), -1, dtype=np.int64)
+    k = min(len(trips), len(drivers))
+    by_load = np.argsort(-_loads(trips), kind='stable')[:k]
+    by_risk = np.argsort(_risks(drivers), kind='stable')[:k]
+    assigned[by_load] = by_risk
+    return assigned
+
+
+def assign_trips(trips, vehicles, drivers):
+    """Per trip, the index of its vehicle and of its driver (-1 when unassigned); vehicles are solved first"""
+    vehicle_of = _solve(vehicle_costs(trips, vehicles))
+    driver_of = np.full(len(trips), -1, dtype=np.int64)
+    served = np.flatnonzero(vehicle_of >= 0)
+    if len(served) and drivers:
+        driver_of[served] = _assign_drivers([trips[i] for i in served], drivers)
+    return vehicle_of, driver_of
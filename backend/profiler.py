@@ -0,0 +1,213 @@
+"""Opt-in statistical profiler: samples every thread's stack for a window or around slow requests"""
+import asyncio
+import itertools
+import re
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from datetime import datetime, timezone, timedelta
+
+RETAIN_SECONDS = 120
+MAX_STACK_DEPTH = 256
+
+# Leaf frames of a thread that is waiting for work rather than doing any
+IDLE_LEAVES = {("selectors.py", "select"), ("threading.py", "wait"), ("queue.py", "get"),
+               ("thread.py", "_worker")}
+
+
+def _frame_key(code):
+    return code.co_name, code.co_filename, code.co_firstlineno
+
+
+def _thread_group(name):
+    # ThreadPoolExecutor names its threads <prefix>_<n>
+    return re.sub(r"_\d+$", "", name)
+
+
+class Profile:
+    _ids = itertools.count(1)
+
+    def __init__(self, name, interval):
+        self.id = next(self._ids)
+        self.name = name
+        self.interval = interval
+        self.started_at = datetime.now(timezone.utc)
+        self.seconds = 0.0
+        self.stacks = Counter()
+
+    def summary(self) -> dict:
+        return {"id": self.id, "name": self.name, "started_at": self.started_at.isoformat(timespec="seconds"),
+                "seconds": round(self.seconds, 3), "interval_ms": self.interval * 1000,
+                "samples": sum(self.stacks.values())}
+
+    def collapsed(self) -> str:
+        """One `thread;outer;...;inner count` line per distinct stack"""
+        lines = []
+        for (group, stack), count in self.stacks.most_common():
+            frames = [group] + [f"{name} ({filename.rsplit('/', 1)[-1]}:{line})" for name, filename, line in stack]
+            lines.append(f"{';'.join(f.replace(';', ',') for f in frames)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def speedscope(self) -> dict:
+        frames, index = [], {}
+        profiles = {}
+        for (group, stack), count in self.stacks.most_common():
+            ids = []
+            for key in stack:
+                if key not in index:
+                    index[key] = len(frames)
+                    frames.append({"name": key[0], "file": key[1], "line": key[2]})
+                ids.append(index[key])
+            profile = profiles.setdefault(group, {"type": "sampled", "name": group, "unit": "seconds",
+                                                  "startValue": 0, "endValue": 0, "samples": [], "weights": []})
+            profile["samples"].append(ids)
+            profile["weights"].append(count * self.interval)
+            profile["endValue"] += count * self.interval
+        return {"$schema": "https://www.speedscope.app/file-format-schema.json", "name": self.name,
+                "exporter": "fleetflow", "activeProfileIndex": 0, "shared": {"frames": frames},
+                "profiles": sorted(profiles.values(), key=lambda p: -p["endValue"])}
+
+
+class Sampler:
+    """Daemon thread that hands (time, (thread group, stack)) samples to `on_sample` until stopped"""
+
+    def __init__(self, interval, on_sample, idle=False, until=None):
+        self.interval = interval
+        self.on_sample = on_sample
+        self.idle = idle
+        self.until = until
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="fleetflow-profiler", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def _run(self):
+        me = threading.get_ident()
+        names, names_at = {}, 0.0
+        while not self.stopped.wait(self.interval):
+            now = time.perf_counter()
+            if self.until is not None and now >= self.until:
+                break
+            if now - names_at > 1:
+                names, names_at = {t.ident: _thread_group(t.name) for t in threading.enumerate()}, now
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                code = frame.f_code
+                if not self.idle and (code.co_filename.rsplit("/", 1)[-1], code.co_name) in IDLE_LEAVES:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                    stack.append(_frame_key(frame.f_code))
+                    frame = frame.f_back
+                stack.reverse()
+                self.on_sample(now, (names.get(ident, str(ident)), tuple(stack)))
+        self.stopped.set()
+
+
+class Profiler:
+    def __init__(self, max_profiles=20):
+        self.max_profiles = max_profiles
+        self.profiles = OrderedDict()
+        self.armed = False
+        self.trigger = None
+        self.sampler = None
+        self.buffer = deque()
+        self.lock = threading.Lock()
+
+    @property
+    def busy(self) -> bool:
+        return self.sampler is not None and not self.sampler.stopped.is_set()
+
+    def _keep(self, profile):
+        self.profiles[profile.id] = profile
+        while len(self.profiles) > self.max_profiles:
+            self.profiles.popitem(last=False)
+
+    async def sample(self, seconds, interval=0.01, idle=False):
+        """Profile the whole process for `seconds`; raises RuntimeError while another session runs"""
+        if self.busy:
+            raise RuntimeError("A profiling session is already running")
+        profile = Profile(f"{seconds:g}s sample", interval)
+        self.sampler = Sampler(interval, lambda t, key: profile.stacks.update((key,)), idle)
+        start = time.perf_counter()
+        self.sampler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            self.sampler.stop()
+            self.sampler.thread.join()
+            profile.seconds = time.perf_counter() - start
+        self._keep(profile)
+        return profile
+
+    def arm(self, route=None, min_ms=0, seconds=300, interval=0.01, max_profiles=5, idle=False):
+        """Start capturing a profile for each matching request over the next `seconds`"""
+        if self.busy:
+            raise RuntimeError("A profiling session is already running")
+        self.trigger = {"route": route, "min_ms": min_ms, "max_profiles": max_profiles, "captured": 0,
+                        "until": datetime.fromtimestamp(time.time() + seconds, timezone.utc).isoformat(timespec="seconds"),
+                        "interval_ms": interval * 1000}
+        self.buffer.clear()
+        self.sampler = Sampler(interval, self._buffer_sample, idle, until=time.perf_counter() + seconds)
+        self.armed = True
+        self.sampler.start()
+
+    def disarm(self):
+        self.armed = False
+        if self.sampler is not None:
+            self.sampler.stop()
+        with self.lock:
+            self.buffer.clear()
+
+    def _buffer_sample(self, now, key):
+        with self.lock:
+            self.buffer.append((now, key))
+            while self.buffer and self.buffer[0][0] < now - RETAIN_SECONDS:
+                self.buffer.popleft()
+
+    def request_finished(self, method, route, start, end):
+        trigger = self.trigger
+        if not (self.armed and self.busy):
+            # Disarmed, or the sampler ran past the trigger's deadline
+            self.armed = False
+            return
+        if trigger["route"] not in (None, route) or (end - start) * 1000 < trigger["min_ms"]:
+            return
+        profile = Profile(f"{method} {route} {(end - start) * 1000:.0f}ms", self.sampler.interval)
+        profile.seconds = end - start
+        profile.started_at -= timedelta(seconds=profile.seconds)
+        with self.lock:
+            profile.stacks.update(key for t, key in self.buffer if start <= t <= end)
+        self._keep(profile)
+        trigger["captured"] += 1
+        if trigger["captured"] >= trigger["max_profiles"]:
+            self.disarm()
+
+    def status(self) -> dict:
+        return {"armed": self.armed and self.busy, "sampling": self.busy, "trigger": self.trigger if self.armed else None,
+                "profiles": [p.summary() for p in reversed(self.profiles.values())]}
+
+
+class ProfilerMiddleware:
+    """ASGI middleware: reports finished requests to `profiler` while it is armed, else a pass-through"""
+
+    def __init__(self, app, profiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if not self.profiler.armed or scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            route = scope.get("route")
+            self.profiler.request_finished(scope["method"], route.path if route is not None else "unmatched",
+                                           start, time.perf_counter())
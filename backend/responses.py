@@ -0,0 +1,109 @@
+"""Conditional (ETag / 304) and compressed JSON responses for the list and analytics endpoints"""
+import gzip
+import hashlib
+
+import orjson
+
+from starlette.exceptions import HTTPException
+from starlette.responses import Response
+
+from metrics import phase
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+COMPRESS_MIN_BYTES = 1024
+# Level 3 keeps most of the size reduction of the default (6) at half the CPU time:
+# 5000 embedded trips (2.8 MB) go to 359 KB in 24 ms, versus 290 KB in 48 ms
+GZIP_LEVEL = 3
+BROTLI_QUALITY = 5
+
+CACHE_HEADERS = {"Cache-Control": "private, no-cache", "Vary": "Accept-Encoding"}
+
+
+def make_etag(*parts) -> str:
+    return hashlib.sha1('\x1f'.join(str(p) for p in parts).encode()).hexdigest()
+
+
+def _accepted_encodings(header: str) -> set:
+    accepted = set()
+    for item in (header or '').split(','):
+        name, *params = item.split(';')
+        q = 1.0
+        for param in params:
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0
+        if q > 0:
+            accepted.add(name.strip().lower())
+    return accepted
+
+
+def _encoding(request, size: int):
+    if size < COMPRESS_MIN_BYTES:
+        return None
+    accepted = _accepted_encodings(request.headers.get('accept-encoding'))
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return None
+
+
+def _tag(etag: str, encoding) -> str:
+    return f'"{etag}-{encoding}"' if encoding else f'"{etag}"'
+
+
+def matching_tag(if_none_match, etag: str):
+    """The entity tag in If-None-Match that names `etag` in any of its encodings (weak comparison), or None"""
+    for tag in (if_none_match or '').split(','):
+        tag = tag.strip()
+        if tag == '*':
+            # Matches any current representation (RFC 9110, 13.1.2)
+            return _tag(etag, None)
+        opaque = tag[2:] if tag.startswith('W/') else tag
+        if opaque.strip('"').split('-')[0] == etag:
+            return tag
+    return None
+
+
+def not_modified(request, etag):
+    """A 304 response when the request's If-None-Match matches `etag`, else None"""
+    tag = matching_tag(request.headers.get('if-none-match'), etag) if etag else None
+    if tag is None:
+        return None
+    return Response(status_code=304, headers={**CACHE_HEADERS, "ETag": tag})
+
+
+def encode_json(payload) -> bytes:
+    # Unlike FastAPI's JSONResponse, NaN and Infinity are written as null (JSONResponse
+    # refuses them) and integers beyond 64 bits can't be encoded. Anything orjson doesn't
+    # know natively (Decimal, UUID subclasses, ...) goes out as a string.
+    with phase('encode'):
+        try:
+            return orjson.dumps(payload, default=str, option=orjson.OPT_NON_STR_KEYS)
+        except orjson.JSONEncodeError as e:
+            raise HTTPException(500, f"Response could not be encoded as JSON: {e}") from e
+
+
+def json_response(request, payload=None, etag=None, body: bytes = None):
+    """JSON response (from `payload`, or the already encoded `body`) tagged with `etag` and compressed when worthwhile"""
+    if body is None:
+        body = encode_json(payload)
+    encoding = _encoding(request, len(body))
+    headers = dict(CACHE_HEADERS)
+    if etag is not None:
+        headers["ETag"] = _tag(etag, encoding)
+    if encoding:
+        with phase('compress'):
+            if encoding == 'br':
+                body = brotli.compress(body, quality=BROTLI_QUALITY)
+            else:
+                body = gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+        headers["Content-Encoding"] = encoding
+    return Response(body, media_type="application/json", headers=headers)
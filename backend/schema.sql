@@ -66,16 +66,27 @@ CREATE TABLE IF NOT EXISTS maintenance_logs (
   created_at timestamptz DEFAULT now()
 );
 
--- Expenses table
+-- Expenses table. Append-only and read by time range (lists, exports, expense_by_day),
+-- so it is partitioned by month; the month partitions are created with
+-- create_month_partitions below. Deployments created with a plain expenses table
+-- convert it with migrations/partition_expenses.sql; until then the partition
+-- statements in this file skip it, so the rest of the file still installs.
 CREATE TABLE IF NOT EXISTS expenses (
-  id uuid DEFAULT gen_random_uuid() PRIMARY KEY,
+  id uuid DEFAULT gen_random_uuid(),
   vehicle_id uuid REFERENCES vehicles(id),
   trip_id uuid REFERENCES trips(id),
   fuel_liters numeric,
   fuel_cost numeric,
   other_cost numeric DEFAULT 0,
-  created_at timestamptz DEFAULT now()
-);
+  created_at timestamptz NOT NULL DEFAULT now(),
+  PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+DO $$
+BEGIN
+  IF EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'expenses'::regclass) THEN
+    CREATE TABLE IF NOT EXISTS expenses_default PARTITION OF expenses DEFAULT;
+  END IF;
+END $$;
 
 -- Enable RLS with permissive policies (RBAC handled at application layer)
 ALTER TABLE users ENABLE ROW LEVEL SECURITY;
@@ -86,18 +97,27 @@ ALTER TABLE maintenance_logs ENABLE ROW LEVEL SECURITY;
 ALTER TABLE expenses ENABLE ROW LEVEL SECURITY;
 
 -- Permissive policies for all tables
+DROP POLICY IF EXISTS "Allow all on users" ON users;
 CREATE POLICY "Allow all on users" ON users FOR ALL USING (true) WITH CHECK (true);
+DROP POLICY IF EXISTS "Allow all on vehicles" ON vehicles;
 CREATE POLICY "Allow all on vehicles" ON vehicles FOR ALL USING (true) WITH CHECK (true);
+DROP POLICY IF EXISTS "Allow all on drivers" ON drivers;
 CREATE POLICY "Allow all on drivers" ON drivers FOR ALL USING (true) WITH CHECK (true);
+DROP POLICY IF EXISTS "Allow all on trips" ON trips;
 CREATE POLICY "Allow all on trips" ON trips FOR ALL USING (true) WITH CHECK (true);
+DROP POLICY IF EXISTS "Allow all on maintenance_logs" ON maintenance_logs;
 CREATE POLICY "Allow all on maintenance_logs" ON maintenance_logs FOR ALL USING (true) WITH CHECK (true);
+DROP POLICY IF EXISTS "Allow all on expenses" ON expenses;
 CREATE POLICY "Allow all on expenses" ON expenses FOR ALL USING (true) WITH CHECK (true);
 
 -- Maintenance trigger: auto set vehicle to in_shop
 CREATE OR REPLACE FUNCTION set_vehicle_in_shop()
 RETURNS TRIGGER AS $$
 BEGIN
-  UPDATE vehicles SET status = 'in_shop' WHERE id = NEW.vehicle_id;
+  -- Historical (already completed) service records must not pull the vehicle into the shop
+  IF NEW.status IS DISTINCT FROM 'completed' THEN
+    UPDATE vehicles SET status = 'in_shop' WHERE id = NEW.vehicle_id;
+  END IF;
   RETURN NEW;
 END;
 $$ LANGUAGE plpgsql;
@@ -108,10 +128,526 @@ CREATE TRIGGER maintenance_vehicle_status
   FOR EACH ROW
   EXECUTE FUNCTION set_vehicle_in_shop();
 
+-- Analytics aggregates: the summary is computed in the database so the API only
+-- ships the aggregated result instead of every row of every table.
+CREATE OR REPLACE VIEW analytics_kpis AS
+WITH v AS (
+  SELECT count(*) AS total,
+         count(*) FILTER (WHERE status = 'available') AS available,
+         count(*) FILTER (WHERE status = 'on_trip') AS on_trip,
+         count(*) FILTER (WHERE status = 'in_shop') AS in_shop
+  FROM vehicles
+), t AS (
+  SELECT count(*) FILTER (WHERE status = 'dispatched') AS active,
+         count(*) FILTER (WHERE status = 'completed') AS completed,
+         COALESCE(sum(revenue) FILTER (WHERE status = 'completed'), 0) AS revenue,
+         COALESCE(sum(distance) FILTER (WHERE status = 'completed'), 0) AS distance
+  FROM trips
+), e AS (
+  SELECT COALESCE(sum(fuel_cost), 0) AS fuel, COALESCE(sum(other_cost), 0) AS other,
+         COALESCE(sum(fuel_liters), 0) AS liters
+  FROM expenses
+), m AS (
+  SELECT COALESCE(sum(cost), 0) AS cost FROM maintenance_logs
+), d AS (
+  SELECT count(*) AS total, count(*) FILTER (WHERE status = 'on_duty') AS on_duty FROM drivers
+)
+SELECT v.total AS total_vehicles, v.available AS available_vehicles, v.on_trip AS on_trip_vehicles,
+       v.in_shop AS in_shop_vehicles, t.active AS active_trips, t.completed AS completed_trips,
+       t.revenue::float8 AS total_revenue, e.fuel::float8 AS total_fuel_cost,
+       m.cost::float8 AS total_maintenance_cost, e.other::float8 AS total_other_cost,
+       (e.fuel + m.cost + e.other)::float8 AS total_expenses,
+       CASE WHEN v.total > 0 THEN round(v.on_trip::numeric / v.total * 100, 1) ELSE 0 END::float8 AS utilization,
+       CASE WHEN e.liters > 0 THEN round(t.distance / e.liters, 2) ELSE 0 END::float8 AS fuel_efficiency,
+       d.on_duty AS on_duty_drivers, d.total AS total_drivers,
+       t.distance::float8 AS total_distance, e.liters::float8 AS total_fuel_liters
+FROM v, t, e, m, d;
+
+CREATE OR REPLACE VIEW analytics_revenue_by_day AS
+SELECT to_char(end_time AT TIME ZONE 'UTC', 'YYYY-MM-DD') AS day, sum(COALESCE(revenue, 0))::float8 AS amount
+FROM trips
+WHERE status = 'completed' AND end_time IS NOT NULL
+GROUP BY 1;
+
+CREATE OR REPLACE VIEW analytics_expense_by_day AS
+SELECT to_char(created_at AT TIME ZONE 'UTC', 'YYYY-MM-DD') AS day,
+       sum(COALESCE(fuel_cost, 0) + COALESCE(other_cost, 0))::float8 AS amount
+FROM expenses
+WHERE created_at IS NOT NULL
+GROUP BY 1;
+
+CREATE OR REPLACE VIEW analytics_vehicle_roi AS
+SELECT v.id, v.name, v.created_at,
+       COALESCE(t.revenue, 0)::float8 AS revenue,
+       (COALESCE(e.cost, 0) + COALESCE(m.cost, 0))::float8 AS cost,
+       CASE WHEN COALESCE(NULLIF(v.acquisition_cost, 0), 1) > 0
+         THEN round((COALESCE(t.revenue, 0) - COALESCE(e.cost, 0) - COALESCE(m.cost, 0))
+                    / COALESCE(NULLIF(v.acquisition_cost, 0), 1) * 100, 1)
+         ELSE 0 END::float8 AS roi,
+       v.status, v.acquisition_cost
+FROM vehicles v
+LEFT JOIN (SELECT vehicle_id, sum(COALESCE(revenue, 0)) AS revenue FROM trips
+           WHERE status = 'completed' GROUP BY vehicle_id) t ON t.vehicle_id = v.id
+LEFT JOIN (SELECT vehicle_id, sum(COALESCE(fuel_cost, 0) + COALESCE(other_cost, 0)) AS cost FROM expenses
+           GROUP BY vehicle_id) e ON e.vehicle_id = v.id
+LEFT JOIN (SELECT vehicle_id, sum(COALESCE(cost, 0)) AS cost FROM maintenance_logs
+           GROUP BY vehicle_id) m ON m.vehicle_id = v.id;
+
+-- One round trip for the whole /api/analytics/summary payload (called via supabase.rpc)
+CREATE OR REPLACE FUNCTION analytics_summary()
+RETURNS json AS $$
+  SELECT json_build_object(
+    'kpis', json_build_object(
+      'total_vehicles', k.total_vehicles, 'available_vehicles', k.available_vehicles,
+      'on_trip_vehicles', k.on_trip_vehicles, 'in_shop_vehicles', k.in_shop_vehicles,
+      'active_trips', k.active_trips, 'completed_trips', k.completed_trips,
+      'total_revenue', k.total_revenue, 'total_fuel_cost', k.total_fuel_cost,
+      'total_maintenance_cost', k.total_maintenance_cost, 'total_expenses', k.total_expenses,
+      'utilization', k.utilization, 'fuel_efficiency', k.fuel_efficiency,
+      'on_duty_drivers', k.on_duty_drivers, 'total_drivers', k.total_drivers),
+    'revenue_by_day', COALESCE((SELECT json_object_agg(day, amount ORDER BY day) FROM analytics_revenue_by_day), '{}'::json),
+    'expense_by_day', COALESCE((SELECT json_object_agg(day, amount ORDER BY day) FROM analytics_expense_by_day), '{}'::json),
+    'vehicle_roi', COALESCE((SELECT json_agg(json_build_object('id', r.id, 'name', r.name, 'revenue', r.revenue,
+                                                               'cost', r.cost, 'roi', r.roi) ORDER BY r.created_at DESC)
+                             FROM analytics_vehicle_roi r), '[]'::json),
+    'cost_breakdown', json_build_object('fuel', k.total_fuel_cost, 'maintenance', k.total_maintenance_cost,
+                                        'other', k.total_other_cost)
+  )
+  FROM analytics_kpis k;
+$$ LANGUAGE sql STABLE;
+
+-- Raw totals and per-entity state the API's incrementally maintained KPI snapshot
+-- reconciles from (one round trip, sized by fleet rather than by history)
+CREATE OR REPLACE FUNCTION analytics_state()
+RETURNS json AS $$
+  SELECT json_build_object(
+    'kpis', (SELECT to_json(k) FROM analytics_kpis k),
+    'revenue_by_day', COALESCE((SELECT json_object_agg(day, amount ORDER BY day) FROM analytics_revenue_by_day), '{}'::json),
+    'expense_by_day', COALESCE((SELECT json_object_agg(day, amount ORDER BY day) FROM analytics_expense_by_day), '{}'::json),
+    'vehicles', COALESCE((SELECT json_agg(json_build_object('id', r.id, 'name', r.name, 'status', r.status,
+                                                            'acquisition_cost', r.acquisition_cost,
+                                                            'revenue', r.revenue, 'cost', r.cost) ORDER BY r.created_at DESC)
+                          FROM analytics_vehicle_roi r), '[]'::json),
+    'drivers', COALESCE((SELECT json_agg(json_build_object('id', id, 'status', status)) FROM drivers), '[]'::json)
+  );
+$$ LANGUAGE sql STABLE;
+
+-- Atomic trip state transitions (called via supabase.rpc). Each function locks the trip,
+-- vehicle and driver rows (always in that order), validates and updates all three in one
+-- transaction, and returns the previous trip row plus the updated trip with its vehicle
+-- and driver embedded. Errors use PostgREST's PTxxx SQLSTATEs to carry the HTTP status.
+CREATE OR REPLACE FUNCTION trip_with_relations(p_trip_id uuid)
+RETURNS jsonb AS $$
+  SELECT to_jsonb(t) || jsonb_build_object('vehicles', to_jsonb(v), 'drivers', to_jsonb(d))
+  FROM trips t
+  LEFT JOIN vehicles v ON v.id = t.vehicle_id
+  LEFT JOIN drivers d ON d.id = t.driver_id
+  WHERE t.id = p_trip_id;
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION trip_dispatch(p_trip_id uuid)
+RETURNS jsonb AS $$
+DECLARE
+  t trips;
+  v_status text;
+BEGIN
+  SELECT * INTO t FROM trips WHERE id = p_trip_id FOR UPDATE;
+  IF NOT FOUND THEN
+    RAISE SQLSTATE 'PT404' USING MESSAGE = 'Trip not found';
+  END IF;
+  IF t.status <> 'draft' THEN
+    RAISE SQLSTATE 'PT400' USING MESSAGE = format('Trip is ''%s'', must be ''draft'' to dispatch', t.status);
+  END IF;
+  SELECT status INTO v_status FROM vehicles WHERE id = t.vehicle_id FOR UPDATE;
+  IF FOUND AND v_status <> 'available' THEN
+    RAISE SQLSTATE 'PT400' USING MESSAGE = 'Vehicle is no longer available';
+  END IF;
+  PERFORM 1 FROM drivers WHERE id = t.driver_id FOR UPDATE;
+
+  UPDATE trips SET status = 'dispatched', start_time = now() WHERE id = p_trip_id;
+  UPDATE vehicles SET status = 'on_trip' WHERE id = t.vehicle_id;
+  UPDATE drivers SET status = 'on_duty' WHERE id = t.driver_id;
+  RETURN jsonb_build_object('previous', to_jsonb(t), 'trip', trip_with_relations(p_trip_id));
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION trip_complete(p_trip_id uuid)
+RETURNS jsonb AS $$
+DECLARE
+  t trips;
+BEGIN
+  SELECT * INTO t FROM trips WHERE id = p_trip_id FOR UPDATE;
+  IF NOT FOUND THEN
+    RAISE SQLSTATE 'PT404' USING MESSAGE = 'Trip not found';
+  END IF;
+  IF t.status <> 'dispatched' THEN
+    RAISE SQLSTATE 'PT400' USING MESSAGE = 'Trip must be dispatched to complete';
+  END IF;
+  PERFORM 1 FROM vehicles WHERE id = t.vehicle_id FOR UPDATE;
+  PERFORM 1 FROM drivers WHERE id = t.driver_id FOR UPDATE;
+
+  UPDATE trips SET status = 'completed', end_time = now() WHERE id = p_trip_id;
+  UPDATE vehicles SET status = 'available' WHERE id = t.vehicle_id;
+  UPDATE drivers SET status = 'off_duty' WHERE id = t.driver_id;
+  RETURN jsonb_build_object('previous', to_jsonb(t), 'trip', trip_with_relations(p_trip_id));
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION trip_cancel(p_trip_id uuid)
+RETURNS jsonb AS $$
+DECLARE
+  t trips;
+BEGIN
+  SELECT * INTO t FROM trips WHERE id = p_trip_id FOR UPDATE;
+  IF NOT FOUND THEN
+    RAISE SQLSTATE 'PT404' USING MESSAGE = 'Trip not found';
+  END IF;
+  IF t.status NOT IN ('draft', 'dispatched') THEN
+    RAISE SQLSTATE 'PT400' USING MESSAGE = 'Only draft or dispatched trips can be cancelled';
+  END IF;
+  IF t.status = 'dispatched' THEN
+    PERFORM 1 FROM vehicles WHERE id = t.vehicle_id FOR UPDATE;
+    PERFORM 1 FROM drivers WHERE id = t.driver_id FOR UPDATE;
+    UPDATE vehicles SET status = 'available' WHERE id = t.vehicle_id;
+    UPDATE drivers SET status = 'off_duty' WHERE id = t.driver_id;
+  END IF;
+
+  UPDATE trips SET status = 'cancelled' WHERE id = p_trip_id;
+  RETURN jsonb_build_object('previous', to_jsonb(t), 'trip', trip_with_relations(p_trip_id));
+END;
+$$ LANGUAGE plpgsql;
+
+-- Bulk trip transitions: validate and transition a whole list of trips with set-based
+-- statements in one transaction. Returns one result per requested id, in request order:
+-- {id, error, previous, trip}, where error is null and trip holds the updated joined row on
+-- success. Failed items are skipped; the rest of the batch still goes through.
+CREATE OR REPLACE FUNCTION lock_trips(p_trip_ids uuid[])
+RETURNS void AS $$
+BEGIN
+  -- Same lock order as the single-trip functions (trips, then vehicles, then drivers)
+  PERFORM 1 FROM trips WHERE id = ANY(p_trip_ids) ORDER BY id FOR UPDATE;
+  PERFORM 1 FROM vehicles
+    WHERE id IN (SELECT vehicle_id FROM trips WHERE id = ANY(p_trip_ids)) ORDER BY id FOR UPDATE;
+  PERFORM 1 FROM drivers
+    WHERE id IN (SELECT driver_id FROM trips WHERE id = ANY(p_trip_ids)) ORDER BY id FOR UPDATE;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION trip_batch_results(checked jsonb)
+RETURNS jsonb AS $$
+  SELECT COALESCE(jsonb_agg(
+    CASE WHEN c->>'error' IS NULL
+      THEN c || jsonb_build_object('trip', trip_with_relations((c->>'id')::uuid))
+      ELSE c - 'previous'
+    END ORDER BY n), '[]'::jsonb)
+  FROM jsonb_array_elements(checked) WITH ORDINALITY AS e(c, n);
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION trips_dispatch(p_trip_ids uuid[])
+RETURNS jsonb AS $$
+DECLARE
+  checked jsonb;
+BEGIN
+  PERFORM lock_trips(p_trip_ids);
+
+  WITH req AS (
+    SELECT r.id, r.ord, row_number() OVER (PARTITION BY r.id ORDER BY r.ord) AS dup
+    FROM unnest(p_trip_ids) WITH ORDINALITY AS r(id, ord)
+  ), validated AS (
+    SELECT req.id, req.ord, t.vehicle_id, t.driver_id, to_jsonb(t) AS previous,
+      CASE
+        WHEN t.id IS NULL THEN 'Trip not found'
+        WHEN req.dup > 1 THEN 'Duplicate trip id in batch'
+        WHEN t.status <> 'draft' THEN format('Trip is ''%s'', must be ''draft'' to dispatch', t.status)
+        WHEN v.status IS NOT NULL AND v.status <> 'available' THEN 'Vehicle is no longer available'
+      END AS error
+    FROM req
+    LEFT JOIN trips t ON t.id = req.id
+    LEFT JOIN vehicles v ON v.id = t.vehicle_id
+  ), ranked AS (
+    -- Only the first valid trip per vehicle in the batch gets the vehicle
+    SELECT id, ord, vehicle_id, driver_id, previous,
+      CASE
+        WHEN error IS NULL AND vehicle_id IS NOT NULL
+             AND row_number() OVER (PARTITION BY vehicle_id, error IS NULL ORDER BY ord) > 1
+          THEN 'Vehicle is already dispatched in this batch'
+        ELSE error
+      END AS error
+    FROM validated
+  ), trips_upd AS (
+    UPDATE trips SET status = 'dispatched', start_time = now()
+    WHERE id IN (SELECT id FROM ranked WHERE error IS NULL)
+  ), vehicles_upd AS (
+    UPDATE vehicles SET status = 'on_trip'
+    WHERE id IN (SELECT vehicle_id FROM ranked WHERE error IS NULL)
+  ), drivers_upd AS (
+    UPDATE drivers SET status = 'on_duty'
+    WHERE id IN (SELECT driver_id FROM ranked WHERE error IS NULL)
+  )
+  SELECT jsonb_agg(jsonb_build_object('id', id, 'error', error, 'previous', previous) ORDER BY ord)
+  INTO checked FROM ranked;
+
+  RETURN trip_batch_results(checked);
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION trips_complete(p_trip_ids uuid[])
+RETURNS jsonb AS $$
+DECLARE
+  checked jsonb;
+BEGIN
+  PERFORM lock_trips(p_trip_ids);
+
+  WITH req AS (
+    SELECT r.id, r.ord, row_number() OVER (PARTITION BY r.id ORDER BY r.ord) AS dup
+    FROM unnest(p_trip_ids) WITH ORDINALITY AS r(id, ord)
+  ), validated AS (
+    SELECT req.id, req.ord, t.vehicle_id, t.driver_id, to_jsonb(t) AS previous,
+      CASE
+        WHEN t.id IS NULL THEN 'Trip not found'
+        WHEN req.dup > 1 THEN 'Duplicate trip id in batch'
+        WHEN t.status <> 'dispatched' THEN 'Trip must be dispatched to complete'
+      END AS error
+    FROM req
+    LEFT JOIN trips t ON t.id = req.id
+  ), trips_upd AS (
+    UPDATE trips SET status = 'completed', end_time = now()
+    WHERE id IN (SELECT id FROM validated WHERE error IS NULL)
+  ), vehicles_upd AS (
+    UPDATE vehicles SET status = 'available'
+    WHERE id IN (SELECT vehicle_id FROM validated WHERE error IS NULL)
+  ), drivers_upd AS (
+    UPDATE drivers SET status = 'off_duty'
+    WHERE id IN (SELECT driver_id FROM validated WHERE error IS NULL)
+  )
+  SELECT jsonb_agg(jsonb_build_object('id', id, 'error', error, 'previous', previous) ORDER BY ord)
+  INTO checked FROM validated;
+
+  RETURN trip_batch_results(checked);
+END;
+$$ LANGUAGE plpgsql;
+
+-- Assignment candidates for the trip planner: available vehicles with their last known
+-- location (destination of their latest completed trip) and eligible drivers (not
+-- suspended, license valid today, safety_score at or above the threshold)
+CREATE OR REPLACE FUNCTION assignment_candidates(p_min_safety_score numeric DEFAULT 0)
+RETURNS json AS $$
+  SELECT json_build_object(
+    'vehicles', COALESCE((
+      SELECT json_agg(json_build_object('id', v.id, 'name', v.name, 'max_capacity', v.max_capacity,
+                                        'location', loc.destination))
+      FROM vehicles v
+      LEFT JOIN LATERAL (
+        SELECT destination FROM trips t
+        WHERE t.vehicle_id = v.id AND t.status = 'completed'
+        ORDER BY t.end_time DESC NULLS LAST LIMIT 1
+      ) loc ON true
+      WHERE v.status = 'available'), '[]'::json),
+    'drivers', COALESCE((
+      SELECT json_agg(json_build_object('id', d.id, 'full_name', d.full_name, 'safety_score', d.safety_score))
+      FROM drivers d
+      WHERE d.status <> 'suspended'
+        AND (d.license_expiry IS NULL OR d.license_expiry >= current_date)
+        AND COALESCE(d.safety_score, 0) >= p_min_safety_score), '[]'::json)
+  );
+$$ LANGUAGE sql STABLE;
+
+-- Change feed for GET /api/changes: statement-level triggers record which rows of the
+-- fleet tables were inserted, updated or deleted, tagged with the writing transaction.
+-- Readers only see entries of transactions older than every transaction still running,
+-- so a (txid, id) cursor never skips a change that commits late.
+CREATE TABLE IF NOT EXISTS change_log (
+  id bigserial PRIMARY KEY,
+  txid xid8 NOT NULL DEFAULT pg_current_xact_id(),
+  table_name text NOT NULL,
+  op text NOT NULL,
+  row_id uuid NOT NULL,
+  changed_at timestamptz NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS change_log_txid_idx ON change_log (txid, id);
+CREATE INDEX IF NOT EXISTS change_log_changed_at_idx ON change_log (changed_at);
+CREATE INDEX IF NOT EXISTS change_log_table_idx ON change_log (table_name, txid, id);
+-- Only the API (service role) reads the log
+ALTER TABLE change_log ENABLE ROW LEVEL SECURITY;
+
+CREATE OR REPLACE FUNCTION log_changes()
+RETURNS TRIGGER AS $$
+BEGIN
+  IF TG_OP = 'DELETE' THEN
+    INSERT INTO change_log (table_name, op, row_id) SELECT TG_TABLE_NAME, 'delete', id FROM old_rows;
+  ELSE
+    INSERT INTO change_log (table_name, op, row_id) SELECT TG_TABLE_NAME, lower(TG_OP), id FROM new_rows;
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION track_changes(p_table text)
+RETURNS void AS $$
+BEGIN
+  EXECUTE format('DROP TRIGGER IF EXISTS %1$s_log_insert ON %1$I', p_table);
+  EXECUTE format('CREATE TRIGGER %1$s_log_insert AFTER INSERT ON %1$I REFERENCING NEW TABLE AS new_rows '
+                 'FOR EACH STATEMENT EXECUTE FUNCTION log_changes()', p_table);
+  EXECUTE format('DROP TRIGGER IF EXISTS %1$s_log_update ON %1$I', p_table);
+  EXECUTE format('CREATE TRIGGER %1$s_log_update AFTER UPDATE ON %1$I REFERENCING NEW TABLE AS new_rows '
+                 'FOR EACH STATEMENT EXECUTE FUNCTION log_changes()', p_table);
+  EXECUTE format('DROP TRIGGER IF EXISTS %1$s_log_delete ON %1$I', p_table);
+  EXECUTE format('CREATE TRIGGER %1$s_log_delete AFTER DELETE ON %1$I REFERENCING OLD TABLE AS old_rows '
+                 'FOR EACH STATEMENT EXECUTE FUNCTION log_changes()', p_table);
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT track_changes(t) FROM unnest(ARRAY['vehicles', 'drivers', 'trips', 'maintenance_logs', 'expenses']) AS t;
+
+-- Changes after the (p_txid, p_id) cursor, oldest first. `horizon` is the oldest
+-- transaction still running: everything below it is final, so it is where the next
+-- cursor starts once the returned page is exhausted.
+CREATE OR REPLACE FUNCTION changes_since(p_txid xid8, p_id bigint DEFAULT 0, p_limit int DEFAULT 1000)
+RETURNS json AS $$
+  WITH horizon AS (
+    SELECT pg_snapshot_xmin(pg_current_snapshot()) AS txid
+  ), page AS (
+    SELECT c.id, c.txid, c.table_name, c.op, c.row_id
+    FROM change_log c, horizon h
+    WHERE (c.txid, c.id) > (p_txid, p_id) AND c.txid < h.txid
+    ORDER BY c.txid, c.id
+    LIMIT p_limit
+  )
+  SELECT json_build_object(
+    'horizon', (SELECT txid FROM horizon)::text,
+    'changes', COALESCE((SELECT json_agg(json_build_object('id', id, 'txid', txid::text, 'table', table_name,
+                                                           'op', op, 'row_id', row_id) ORDER BY txid, id)
+                         FROM page), '[]'::json)
+  );
+$$ LANGUAGE sql STABLE;
+
+-- Version tag of each table's contents, for the ETags of the list endpoints. Entries of
+-- finished transactions (below the horizon) are summarised by the newest one: anything
+-- that later becomes final has a higher txid, so it always moves the tag. Entries of
+-- transactions above the horizon that this snapshot already sees are listed by id.
+-- The tag therefore changes whenever the visible contents may have changed; it can also
+-- change spuriously (pruning, the horizon passing a change), which only costs a 200.
+CREATE OR REPLACE FUNCTION table_versions(p_tables text[])
+RETURNS text AS $$
+  WITH horizon AS (
+    SELECT pg_snapshot_xmin(pg_current_snapshot()) AS txid
+  )
+  SELECT string_agg(t || ':' || COALESCE(
+           (SELECT c.txid::text || '.' || c.id FROM change_log c
+            WHERE c.table_name = t AND c.txid < h.txid
+            ORDER BY c.txid DESC, c.id DESC LIMIT 1), '') || ':' || COALESCE(
+           (SELECT string_agg(c.id::text, '.' ORDER BY c.id) FROM change_log c
+            WHERE c.table_name = t AND c.txid >= h.txid), ''), ',' ORDER BY t)
+  FROM unnest(p_tables) AS t, horizon h;
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION prune_change_log(p_keep interval DEFAULT '1 day')
+RETURNS bigint AS $$
+  WITH pruned AS (DELETE FROM change_log WHERE changed_at < now() - p_keep RETURNING 1)
+  SELECT count(*) FROM pruned;
+$$ LANGUAGE sql;
+
+-- Monthly range partitions on created_at. Each month gets its own partition,
+-- <table>_YYYY_MM, and a <table>_default partition catches anything outside the
+-- created months, so an insert never fails for lack of a partition. When a new
+-- month is created, rows already in the default partition for that month move
+-- into it. Idempotent; the API calls it hourly (as the service role) to keep the
+-- coming months ready. Creating and detaching partitions needs the table owner's
+-- rights, so the function runs as its owner (whoever runs this file) and only
+-- accepts partitioned tables of this schema. migrations/partition_expenses.sql
+-- carries the same definition.
+CREATE OR REPLACE FUNCTION create_month_partitions(p_table text, p_from date, p_to date)
+RETURNS int AS $$
+DECLARE
+  month date := date_trunc('month', p_from);
+  part text;
+  fallback text := p_table || '_default';
+  misplaced boolean;
+  created int := 0;
+BEGIN
+  IF NOT EXISTS (SELECT 1 FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+                 WHERE n.nspname = 'public' AND c.relname = p_table AND c.relkind = 'p') THEN
+    RAISE SQLSTATE 'PT400' USING MESSAGE = format('%s is not a partitioned table', p_table);
+  END IF;
+  WHILE month <= p_to LOOP
+    part := format('%s_%s', p_table, to_char(month, 'YYYY_MM'));
+    IF to_regclass(part) IS NULL THEN
+      EXECUTE format('SELECT EXISTS (SELECT 1 FROM %I WHERE created_at >= %L AND created_at < %L)',
+                     fallback, month, month + 1 * interval '1 month') INTO misplaced;
+      IF misplaced THEN
+        EXECUTE format('ALTER TABLE %I DETACH PARTITION %I', p_table, fallback);
+      END IF;
+      EXECUTE format('CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                     part, p_table, month, month + interval '1 month');
+      IF misplaced THEN
+        EXECUTE format('WITH moved AS (DELETE FROM %1$I WHERE created_at >= %3$L AND created_at < %4$L RETURNING *) '
+                       'INSERT INTO %2$I SELECT * FROM moved', fallback, part, month, month + interval '1 month');
+        EXECUTE format('ALTER TABLE %I ATTACH PARTITION %I DEFAULT', p_table, fallback);
+      END IF;
+      created := created + 1;
+    END IF;
+    month := month + interval '1 month';
+  END LOOP;
+  RETURN created;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+REVOKE ALL ON FUNCTION create_month_partitions(text, date, date) FROM PUBLIC;
+DO $$
+BEGIN
+  IF EXISTS (SELECT 1 FROM pg_roles WHERE rolname = 'service_role') THEN
+    GRANT EXECUTE ON FUNCTION create_month_partitions(text, date, date) TO service_role;
+  END IF;
+END $$;
+
+DO $$
+BEGIN
+  IF EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'expenses'::regclass) THEN
+    PERFORM create_month_partitions('expenses', now()::date, (now() + interval '3 months')::date);
+  END IF;
+END $$;
+
+-- Trips stay a plain table. expenses.trip_id and PostgREST's trips(*) embed need a
+-- unique key on trips.id alone, and a partitioned table can only have unique keys that
+-- include the partition column. The (created_at, id) index below serves trips'
+-- time-range scans instead.
+
+-- Indexes for the API's query shapes. The list endpoints page by (created_at, id)
+-- descending, optionally filtered by one column (keyset_query), and exports and the
+-- changes feed read the same way; each filter gets a composite index in that order so
+-- a page is a bounded index range scan instead of a sort. On expenses the indexes are
+-- created on every partition.
+CREATE INDEX IF NOT EXISTS vehicles_created_idx ON vehicles (created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS drivers_created_idx ON drivers (created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS trips_created_idx ON trips (created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS trips_status_created_idx ON trips (status, created_at DESC, id DESC);
+-- Also serve the vehicle_id / driver_id lookups of vehicle and driver deletes
+CREATE INDEX IF NOT EXISTS trips_vehicle_created_idx ON trips (vehicle_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS trips_driver_created_idx ON trips (driver_id, created_at DESC, id DESC);
+-- Active trips of a vehicle or driver: the guards of delete_vehicle and delete_driver
+CREATE INDEX IF NOT EXISTS trips_dispatched_vehicle_idx ON trips (vehicle_id) WHERE status = 'dispatched';
+CREATE INDEX IF NOT EXISTS trips_dispatched_driver_idx ON trips (driver_id) WHERE status = 'dispatched';
+-- Latest completed trip of each vehicle (assignment_candidates)
+CREATE INDEX IF NOT EXISTS trips_completed_vehicle_idx ON trips (vehicle_id, end_time DESC NULLS LAST)
+  WHERE status = 'completed';
+CREATE INDEX IF NOT EXISTS maintenance_created_idx ON maintenance_logs (created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS maintenance_status_created_idx ON maintenance_logs (status, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS maintenance_vehicle_created_idx ON maintenance_logs (vehicle_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS expenses_created_idx ON expenses (created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS expenses_vehicle_created_idx ON expenses (vehicle_id, created_at DESC, id DESC);
+-- Foreign key checks when trips are deleted (delete_vehicle)
+CREATE INDEX IF NOT EXISTS expenses_trip_idx ON expenses (trip_id);
+
 -- Enable Realtime for all tables
-ALTER PUBLICATION supabase_realtime ADD TABLE vehicles;
-ALTER PUBLICATION supabase_realtime ADD TABLE drivers;
-ALTER PUBLICATION supabase_realtime ADD TABLE trips;
-ALTER PUBLICATION supabase_realtime ADD TABLE maintenance_logs;
-ALTER PUBLICATION supabase_realtime ADD TABLE expenses;
-ALTER PUBLICATION supabase_realtime ADD TABLE users;
+-- Changes to partitioned expenses are published as changes to `expenses`, not its partitions
+ALTER PUBLICATION supabase_realtime SET (publish_via_partition_root = true);
+DO $$
+DECLARE
+  t text;
+BEGIN
+  FOREACH t IN ARRAY ARRAY['vehicles', 'drivers', 'trips', 'maintenance_logs', 'expenses', 'users'] LOOP
+    IF NOT EXISTS (SELECT 1 FROM pg_publication_tables WHERE pubname = 'supabase_realtime' AND tablename = t) THEN
+      EXECUTE format('ALTER PUBLICATION supabase_realtime ADD TABLE %I', t);
+    END IF;
+  END LOOP;
+END $$;
@@ -0,0 +1,183 @@
+"""Synthetic fleet generation for capacity testing"""
+import time
+import uuid
+import random
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+CITIES = ["Los Angeles, CA", "San Francisco, CA", "Chicago, IL", "Detroit, MI", "Houston, TX", "Dallas, TX",
+          "New York, NY", "Boston, MA", "Seattle, WA", "Portland, OR", "Miami, FL", "Atlanta, GA",
+          "Denver, CO", "Phoenix, AZ", "Austin, TX", "San Antonio, TX"]
+MODELS = [("Ford F-750", 8000, 85000), ("Mercedes Sprinter", 3500, 52000), ("Volvo FH16", 15000, 125000),
+          ("Toyota Dyna", 2000, 35000), ("Kenworth T680", 12000, 110000), ("Isuzu NPR", 4500, 42000),
+          ("Peterbilt 579", 18000, 145000), ("Freightliner Cascadia", 10000, 95000)]
+FIRST_NAMES = ["Alex", "Priya", "Daniel", "Fatima", "Marcus", "Lisa", "Sarah", "Mike", "Emily", "Omar", "Chen", "Ana"]
+LAST_NAMES = ["Martinez", "Shah", "Kim", "Noor", "Johnson", "Wong", "Chen", "Rodriguez", "Park", "Haddad", "Silva"]
+
+# Relative dispatch volume per hour of day (UTC) and per weekday (Mon..Sun)
+HOUR_WEIGHTS = [1, 1, 1, 1, 2, 4, 8, 10, 10, 9, 8, 7, 6, 7, 8, 8, 7, 5, 4, 3, 2, 2, 1, 1]
+DAY_WEIGHTS = [10, 10, 10, 10, 9, 4, 2]
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class _Writer:
+    """Insert row chunks concurrently and keep per-table row counts"""
+
+    def __init__(self, insert, parallel):
+        self.insert = insert
+        self.slots = asyncio.Semaphore(parallel)
+        self.counts = {}
+
+    async def _write(self, table, chunk, kept, then, index):
+        try:
+            inserted = await self.insert(table, chunk)
+        finally:
+            self.slots.release()
+        self.counts[table] = self.counts.get(table, 0) + len(chunk)
+        if kept is not None:
+            kept.extend(inserted)
+        if then:
+            await then(inserted, index)
+
+    async def write(self, table, chunk):
+        await self.slots.acquire()
+        await self._write(table, chunk, None, None, 0)
+
+    async def write_all(self, table, rows, batch_size, keep=False, then=None):
+        """Insert `rows` in chunks, at most `parallel` in flight; `then(inserted, index)` runs after each"""
+        kept = [] if keep else None
+        tasks = []
+        for index, chunk in enumerate(_chunks(rows, batch_size)):
+            await self.slots.acquire()
+            tasks.append(asyncio.create_task(self._write(table, chunk, kept, then, index)))
+        await asyncio.gather(*tasks)
+        return kept
+
+
+def _vehicles(rng, n, tag, max_on_trip):
+    on_trip = 0
+    for i in range(n):
+        model, capacity, cost = rng.choice(MODELS)
+        status = rng.choices(["available", "on_trip", "in_shop", "retired"], [70, 20, 7, 3])[0]
+        if status == "on_trip":
+            if on_trip < max_on_trip:
+                on_trip += 1
+            else:
+                status = "available"
+        yield {"name": f"{rng.choice(['Falcon', 'Atlas', 'Titan', 'Metro', 'Blaze', 'Horizon'])} {i}", "model": model,
+               "license_plate": f"GEN-{tag}-{i:07d}", "max_capacity": capacity,
+               "odometer": round(rng.uniform(1000, 250000)),
+               "status": status,
+               "acquisition_cost": round(cost * rng.uniform(0.85, 1.1))}
+
+
+def _drivers(rng, n, tag, today, reserved):
+    # The first `reserved` drivers are on duty with a valid license: they drive the dispatched trips
+    for i in range(n):
+        assigned = i < reserved
+        yield {"full_name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+               "license_number": f"GEN-{tag}-{i:07d}",
+               "license_expiry": str(today + timedelta(days=rng.randint(30 if assigned else -60, 1500))),
+               "safety_score": max(30, min(100, round(rng.gauss(86, 9)))),
+               "status": "on_duty" if assigned else rng.choices(["on_duty", "off_duty", "suspended"], [45, 50, 5])[0]}
+
+
+def _trip_time(rng, now, days):
+    day = now.date() - timedelta(days=rng.randrange(days))
+    while rng.random() * 10 > DAY_WEIGHTS[day.weekday()]:
+        day = now.date() - timedelta(days=rng.randrange(days))
+    hour = rng.choices(range(24), HOUR_WEIGHTS)[0]
+    start = datetime(day.year, day.month, day.day, hour, rng.randrange(60), rng.randrange(60), tzinfo=timezone.utc)
+    return min(start, now - timedelta(minutes=1))
+
+
+def _trips(rng, n, vehicles, drivers, days, now):
+    active = [v for v in vehicles if v['status'] == 'on_trip']
+    today = str(now.date())
+    eligible = [d for d in drivers if d['status'] == 'on_duty' and str(d['license_expiry']) >= today]
+    for i in range(n):
+        start = _trip_time(rng, now, days)
+        distance = round(rng.lognormvariate(5.5, 0.7), 1)
+        hours = distance / rng.uniform(55, 80) + rng.uniform(0.5, 2)
+        if i < len(active):
+            vehicle, driver, status = active[i], eligible[i], "dispatched"
+            start = now - timedelta(hours=rng.uniform(0, hours))
+        else:
+            vehicle, driver = rng.choice(vehicles), rng.choice(drivers)
+            recent = now - start < timedelta(days=2)
+            status = rng.choices(["completed", "cancelled", "draft"], [85, 8, 7] if recent else [92, 8, 0])[0]
+        end = start + timedelta(hours=hours)
+        if status == "completed" and end > now:
+            end = now
+        yield {"vehicle_id": vehicle['id'], "driver_id": driver['id'],
+               "origin": rng.choice(CITIES), "destination": rng.choice(CITIES),
+               "cargo_weight": round(float(vehicle['max_capacity']) * rng.uniform(0.2, 0.95)),
+               "distance": distance, "revenue": round(distance * rng.uniform(4, 9), 2), "status": status,
+               "start_time": start.isoformat() if status in ("dispatched", "completed") else None,
+               "end_time": end.isoformat() if status == "completed" else None,
+               "created_at": (start - timedelta(hours=rng.uniform(1, 48))).isoformat()}
+
+
+def _expenses(rng, trips):
+    for t in trips:
+        if t['status'] == 'completed':
+            liters = round(float(t['distance']) * rng.uniform(0.25, 0.4), 1)
+            yield {"vehicle_id": t['vehicle_id'], "trip_id": t['id'], "fuel_liters": liters,
+                   "fuel_cost": round(liters * rng.uniform(1.5, 1.9), 2),
+                   "other_cost": rng.choice([0, 0, 0, 15, 25, 45]), "created_at": t['end_time']}
+
+
+def _maintenance(rng, vehicles, days, now):
+    for v in vehicles:
+        for _ in range(rng.randint(0, max(1, days // 60))):
+            when = now - timedelta(days=rng.randrange(days))
+            yield {"vehicle_id": v['id'], "description": rng.choice(["Oil Change & Filter", "Tire Rotation",
+                   "Brake Replacement", "Transmission Service", "Engine Diagnostics"]),
+                   "cost": rng.choice([180, 250, 800, 1200, 2500]), "service_date": str(when.date()),
+                   "status": "completed", "created_at": when.isoformat()}
+        if v['status'] == 'in_shop':
+            yield {"vehicle_id": v['id'], "description": "Scheduled inspection", "cost": 400,
+                   "service_date": str(now.date()), "status": "in_progress", "created_at": now.isoformat()}
+
+
+async def generate_fleet(insert, vehicles, drivers, trips, days=180, batch_size=1000, parallel=8, seed=None):
+    """Generate and insert a synthetic fleet; returns per-table row counts and rows/sec"""
+    rng = random.Random(seed)
+    on_trip = min(vehicles, drivers)
+    now = datetime.now(timezone.utc)
+    tag = uuid.uuid4().hex[:6].upper()
+    writer = _Writer(insert, parallel)
+    started = time.perf_counter()
+
+    async def write_expenses(trip_rows, index):
+        # Trip batches finish in any order: a generator per batch keeps seeded runs reproducible
+        batch_rng = random.Random(f"{seed}/expenses/{index}") if seed is not None else random.Random()
+        expenses = list(_expenses(batch_rng, sorted(trip_rows, key=lambda t: t['created_at'])))
+        if expenses:
+            await writer.write('expenses', expenses)
+
+    vehicle_rows = await writer.write_all('vehicles', _vehicles(rng, vehicles, tag, on_trip), batch_size, keep=True)
+    driver_rows = await writer.write_all('drivers', _drivers(rng, drivers, tag, now.date(), on_trip), batch_size,
+                                         keep=True)
+    # Chunks complete in any order; restore generation order before trips sample from them
+    vehicle_rows.sort(key=lambda v: v['license_plate'])
+    driver_rows.sort(key=lambda d: d['license_number'])
+    if trips:
+        await writer.write_all('trips', _trips(rng, trips, vehicle_rows, driver_rows, days, now), batch_size,
+                               then=write_expenses)
+    await writer.write_all('maintenance_logs', _maintenance(rng, vehicle_rows, days, now), batch_size)
+
+    elapsed = time.perf_counter() - started
+    total = sum(writer.counts.values())
+    return {"counts": writer.counts, "rows": total, "seconds": round(elapsed, 2),
+            "rows_per_sec": round(total / elapsed, 1) if elapsed > 0 else None}
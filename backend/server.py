@@ -3,25 +3,136 @@ import jwt
 import bcrypt
 import csv
 import io
+import json
+import re
+import zlib
+import hmac
+import time
+import uuid
+import base64
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone, timedelta, date
-from fastapi import FastAPI, HTTPException, Depends, Request
+from fastapi import FastAPI, HTTPException, Depends, Request, Query, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
+from fastapi.responses import StreamingResponse, Response
+from pydantic import BaseModel, Field
 from typing import Optional
-from supabase import create_client, Client
+from postgrest import ReturnMethod
+from cachetools import TLRUCache
 from dotenv import load_dotenv
+from analytics import KPISnapshot
+from seeding import generate_fleet
+from columnar import DATASETS as COLUMNAR_DATASETS, FORMATS as COLUMNAR_FORMATS, encode_stream
+from events import EventHub
+from caching import RefCache, LocalStore, RedisStore
+from responses import make_etag, not_modified, json_response, encode_json
+from planning import check_trips, assign_trips
+from importing import FORMATS as IMPORT_FORMATS, iter_records, import_records
+from storage import create_storage
+from metrics import Metrics, TimingMiddleware, db_call, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from profiler import Profiler, ProfilerMiddleware
 
 load_dotenv()
 
+logger = logging.getLogger("fleetflow")
+
 app = FastAPI(title="FleetFlow API")
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_credentials=True, allow_methods=["*"], allow_headers=["*"])
 
 SUPABASE_URL = os.environ.get("SUPABASE_URL")
 SUPABASE_SERVICE_KEY = os.environ.get("SUPABASE_SERVICE_ROLE_KEY")
+# supabase (PostgREST), postgres (direct SQL on DATABASE_URL) or sqlite (SQLITE_PATH); see storage.py
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "supabase")
+DATABASE_URL = os.environ.get("DATABASE_URL")
+SQLITE_PATH = os.environ.get("SQLITE_PATH", ":memory:")
 JWT_SECRET = os.environ.get("JWT_SECRET", "fleetflow-jwt-secret-2024")
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "32"))
+KPI_RECONCILE_SECONDS = float(os.environ.get("KPI_RECONCILE_SECONDS", "300"))
+MAX_PAGE_SIZE = int(os.environ.get("MAX_PAGE_SIZE", "1000"))
+EXPORT_PAGE_SIZE = int(os.environ.get("EXPORT_PAGE_SIZE", "1000"))
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", "12"))
+AUTH_POOL_SIZE = int(os.environ.get("AUTH_POOL_SIZE", str(os.cpu_count() or 4)))
+AUTH_MAX_PENDING = int(os.environ.get("AUTH_MAX_PENDING", "64"))
+SEED_PARALLEL_BATCHES = int(os.environ.get("SEED_PARALLEL_BATCHES", "8"))
+# Synthetic fleets (/api/seed with counts) are for capacity testing; off unless explicitly enabled
+ALLOW_SYNTHETIC_SEED = os.environ.get("ALLOW_SYNTHETIC_SEED", "false").lower() in ("1", "true", "yes")
+TOKEN_CACHE_SIZE = int(os.environ.get("TOKEN_CACHE_SIZE", "10000"))
+TOKEN_CACHE_TTL = float(os.environ.get("TOKEN_CACHE_TTL", "300"))
+STREAM_TOKEN_TTL = int(os.environ.get("STREAM_TOKEN_TTL", "60"))
+MAX_BULK_TRIPS = int(os.environ.get("MAX_BULK_TRIPS", "1000"))
+IMPORT_PARALLEL_BATCHES = int(os.environ.get("IMPORT_PARALLEL_BATCHES", "4"))
+MIN_SAFETY_SCORE = float(os.environ.get("MIN_SAFETY_SCORE", "80"))
+CHANGES_PAGE_SIZE = int(os.environ.get("CHANGES_PAGE_SIZE", "500"))
+CHANGE_RETENTION_SECONDS = int(os.environ.get("CHANGE_RETENTION_SECONDS", "86400"))
+PARTITION_MONTHS_AHEAD = int(os.environ.get("PARTITION_MONTHS_AHEAD", "3"))
+EVENTS_MAX_PENDING = int(os.environ.get("EVENTS_MAX_PENDING", "1000"))
+EVENTS_COALESCE_MS = int(os.environ.get("EVENTS_COALESCE_MS", "200"))
+EVENTS_KEEPALIVE_SECONDS = float(os.environ.get("EVENTS_KEEPALIVE_SECONDS", "15"))
+REF_CACHE_MAX_ROWS = int(os.environ.get("REF_CACHE_MAX_ROWS", "50000"))
+REF_CACHE_TTL = float(os.environ.get("REF_CACHE_TTL", "30"))
+REF_CACHE_REDIS_URL = os.environ.get("REF_CACHE_REDIS_URL")
+SERVER_TIMING = os.environ.get("SERVER_TIMING", "true").lower() in ("1", "true", "yes")
+# Bearer token for Prometheus scrapes of /api/metrics; managers can always read it with their JWT
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+PROFILER_MAX_SECONDS = float(os.environ.get("PROFILER_MAX_SECONDS", "60"))
+PROFILER_MAX_PROFILES = int(os.environ.get("PROFILER_MAX_PROFILES", "20"))
+
+profiler = Profiler(max_profiles=PROFILER_MAX_PROFILES)
+app.add_middleware(ProfilerMiddleware, profiler=profiler)
+# Added last so it wraps everything else, CORS and the profiler included: the timings
+# and metrics cover the whole request as the server handles it
+metrics = Metrics()
+app.add_middleware(TimingMiddleware, metrics=metrics, server_timing=SERVER_TIMING)
+
+store = create_storage(STORAGE_BACKEND, SUPABASE_URL, SUPABASE_SERVICE_KEY, DATABASE_URL, SQLITE_PATH, DB_POOL_SIZE)
+
+# The supabase client is synchronous; its queries run on a bounded worker pool so a slow
+# round trip never blocks the event loop. The pool size caps in-flight DB calls (the
+# postgres backend caps them with its connection pool of the same size).
+db_executor = ThreadPoolExecutor(max_workers=DB_POOL_SIZE, thread_name_prefix="fleetflow-db")
+
+async def db(query):
+    """Execute a query built on `store` and return its response"""
+    with db_call():
+        if asyncio.iscoroutinefunction(query.execute):
+            return await query.execute()
+        return await asyncio.get_running_loop().run_in_executor(db_executor, query.execute)
+
+def is_missing_db_object(e: Exception) -> bool:
+    """True when a query failed because a table/view/function from schema.sql has not been created yet"""
+    msg = str(e).lower()
+    return "does not exist" in msg or "could not find the function" in msg or "pgrst202" in msg
+
+def is_uuid(value: str) -> bool:
+    try:
+        uuid.UUID(value)
+        return True
+    except ValueError:
+        return False
+
+# Assumes a single worker: each worker only applies deltas for the writes it handled, so
+# with several uvicorn workers their KPIs can disagree for up to KPI_RECONCILE_SECONDS.
+# Run one worker, or lower KPI_RECONCILE_SECONDS to bound how long they may differ.
+kpi_snapshot = KPISnapshot(max_age=KPI_RECONCILE_SECONDS)
+events = EventHub(max_pending=EVENTS_MAX_PENDING, window=EVENTS_COALESCE_MS / 1000)
+# Vehicles and drivers: read on most request paths, written rarely. Every handler that
+# writes them (directly, or via trip/maintenance status changes) invalidates the table.
+ref_cache = RefCache(RedisStore(REF_CACHE_REDIS_URL, REF_CACHE_TTL) if REF_CACHE_REDIS_URL
+                     else LocalStore(REF_CACHE_MAX_ROWS, REF_CACHE_TTL))
+
+@app.on_event("shutdown")
+def shutdown_executors():
+    db_executor.shutdown(wait=False)
+    auth_executor.shutdown(wait=False)
+
+@app.on_event("shutdown")
+async def close_storage():
+    if hasattr(store, 'close'):
+        await store.close()
 
 # --- Pydantic Models ---
 class RegisterRequest(BaseModel):
@@ -74,6 +185,24 @@ class TripCreate(BaseModel):
     distance: float = 0
     revenue: float = 0
 
+class TripPlan(BaseModel):
+    trips: list[TripCreate]
+
+class TripRequest(BaseModel):
+    origin: str
+    destination: str
+    cargo_weight: float
+    distance: float = 0
+    revenue: float = 0
+
+class AssignmentRequest(BaseModel):
+    trips: list[TripRequest]
+    min_safety_score: float = MIN_SAFETY_SCORE
+    create: bool = False
+
+class TripBatch(BaseModel):
+    trip_ids: list[str]
+
 class MaintenanceCreate(BaseModel):
     vehicle_id: str
     description: str
@@ -87,9 +216,34 @@ class ExpenseCreate(BaseModel):
     fuel_cost: float = 0
     other_cost: float = 0
 
+class ProfileTrigger(BaseModel):
+    route: Optional[str] = None
+    min_ms: float = Field(0, ge=0)
+    seconds: float = Field(300, gt=0, le=3600)
+    interval_ms: float = Field(10, ge=1, le=1000)
+    max_profiles: int = Field(5, ge=1, le=100)
+    idle: bool = False
+
 # --- Auth Helpers ---
+# bcrypt releases the GIL, so hashing on a thread pool keeps the event loop responsive and
+# runs up to AUTH_POOL_SIZE hashes in parallel. Beyond AUTH_MAX_PENDING queued or running
+# operations new logins are shed with a 503 instead of piling up behind the pool.
+auth_executor = ThreadPoolExecutor(max_workers=AUTH_POOL_SIZE, thread_name_prefix="fleetflow-auth")
+auth_pending = 0
+
+async def run_auth(fn, *args):
+    """Run a bcrypt helper on the auth pool, rejecting the call when the pool is saturated"""
+    global auth_pending
+    if auth_pending >= AUTH_MAX_PENDING:
+        raise HTTPException(503, "Authentication is busy, please retry", headers={"Retry-After": "1"})
+    auth_pending += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(auth_executor, fn, *args)
+    finally:
+        auth_pending -= 1
+
 def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode('utf-8')
 
 def verify_password(password: str, hashed: str) -> bool:
     return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
@@ -98,17 +252,57 @@ def create_token(user_id: str, role: str, email: str, full_name: str) -> str:
     payload = {"user_id": user_id, "role": role, "email": email, "full_name": full_name, "exp": datetime.now(timezone.utc) + timedelta(days=7)}
     return jwt.encode(payload, JWT_SECRET, algorithm="HS256")
 
-def get_current_user(request: Request):
-    auth_header = request.headers.get("Authorization", "")
-    if not auth_header.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Authentication required")
-    token = auth_header[7:]
+# Verified claims keyed by the raw token. An entry lives until the token's own `exp` or
+# TOKEN_CACHE_TTL, whichever comes first, so a cached token never outlives its expiry.
+# get_current_user runs on the threadpool, hence the lock.
+token_cache = TLRUCache(maxsize=TOKEN_CACHE_SIZE, timer=time.time,
+                        ttu=lambda token, claims, now: min(claims.get('exp', now), now + TOKEN_CACHE_TTL))
+token_cache_lock = threading.Lock()
+token_cache_stats = {"hits": 0, "misses": 0}
+
+def verify_token(token: str) -> dict:
+    with token_cache_lock:
+        claims = token_cache.get(token)
+        token_cache_stats["hits" if claims is not None else "misses"] += 1
+    if claims is not None:
+        return claims
     try:
-        return jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
+        claims = jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
+    with token_cache_lock:
+        token_cache[token] = claims
+    return claims
+
+def get_current_user(request: Request):
+    auth_header = request.headers.get("Authorization", "")
+    if not auth_header.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Authentication required")
+    return verify_token(auth_header[7:])
+
+# Browser EventSource can't send headers, so /api/events takes its token from the URL,
+# where it ends up in access logs and history. That token is a short-lived one issued by
+# /api/events/token with its own audience: session tokens are refused on the query string,
+# and stream tokens are refused everywhere else (jwt.decode rejects an unexpected `aud`).
+STREAM_TOKEN_AUDIENCE = "fleetflow-events"
+
+def create_stream_token(user: dict) -> str:
+    payload = {"user_id": user["user_id"], "role": user["role"], "aud": STREAM_TOKEN_AUDIENCE,
+               "exp": datetime.now(timezone.utc) + timedelta(seconds=STREAM_TOKEN_TTL)}
+    return jwt.encode(payload, JWT_SECRET, algorithm="HS256")
+
+def get_stream_user(request: Request, token: Optional[str] = None):
+    """get_current_user that also accepts a stream token as ?token="""
+    if token and "Authorization" not in request.headers:
+        try:
+            return jwt.decode(token, JWT_SECRET, algorithms=["HS256"], audience=STREAM_TOKEN_AUDIENCE)
+        except jwt.ExpiredSignatureError:
+            raise HTTPException(status_code=401, detail="Token expired")
+        except jwt.InvalidTokenError:
+            raise HTTPException(status_code=401, detail="Invalid stream token")
+    return get_current_user(request)
 
 def require_role(*roles):
     def checker(user=Depends(get_current_user)):
@@ -118,10 +312,18 @@ def require_role(*roles):
     return checker
 
 # --- Health & Setup ---
+@app.get("/api/metrics")
+async def get_metrics(request: Request):
+    """Per-route request, DB and response size histograms in the Prometheus text format"""
+    auth_header = request.headers.get("Authorization", "")
+    if not (METRICS_TOKEN and hmac.compare_digest(auth_header.encode(), f"Bearer {METRICS_TOKEN}".encode())):
+        require_role("manager")(get_current_user(request))
+    return Response(metrics.render(), media_type=METRICS_CONTENT_TYPE)
+
 @app.get("/api/health")
 async def health():
     try:
-        result = supabase.table('vehicles').select('id').limit(1).execute()
+        result = await db(store.table('vehicles').select('id').limit(1))
         return {"status": "healthy", "db_connected": True}
     except Exception as e:
         return {"status": "setup_required", "db_connected": False, "error": str(e)}
@@ -141,7 +343,7 @@ async def register(data: RegisterRequest):
     if data.role not in ['manager', 'dispatcher', 'safety', 'analyst']:
         raise HTTPException(400, "Invalid role. Must be: manager, dispatcher, safety, analyst")
     try:
-        existing = supabase.table('users').select('id').eq('email', data.email).execute()
+        existing = await db(store.table('users').select('id').eq('email', data.email))
         if existing.data:
             raise HTTPException(409, "Email already registered")
     except HTTPException:
@@ -151,9 +353,9 @@ async def register(data: RegisterRequest):
             raise HTTPException(503, "Database not set up. Please run schema.sql in Supabase SQL Editor.")
         raise HTTPException(500, str(e))
     
-    password_hash = hash_password(data.password)
+    password_hash = await run_auth(hash_password, data.password)
     user_data = {"email": data.email, "password_hash": password_hash, "full_name": data.full_name, "role": data.role, "status": "active"}
-    result = supabase.table('users').insert(user_data).execute()
+    result = await db(store.table('users').insert(user_data))
     user = result.data[0]
     token = create_token(user['id'], user['role'], user['email'], user['full_name'])
     return {"token": token, "user": {"id": user['id'], "email": user['email'], "full_name": user['full_name'], "role": user['role']}}
@@ -161,7 +363,7 @@ async def register(data: RegisterRequest):
 @app.post("/api/auth/login")
 async def login(data: LoginRequest):
     try:
-        result = supabase.table('users').select('*').eq('email', data.email).execute()
+        result = await db(store.table('users').select('*').eq('email', data.email))
     except Exception as e:
         if "does not exist" in str(e).lower():
             raise HTTPException(503, "Database not set up")
@@ -169,7 +371,7 @@ async def login(data: LoginRequest):
     if not result.data:
         raise HTTPException(401, "Invalid credentials")
     user = result.data[0]
-    if not verify_password(data.password, user['password_hash']):
+    if not await run_auth(verify_password, data.password, user['password_hash']):
         raise HTTPException(401, "Invalid credentials")
     token = create_token(user['id'], user['role'], user['email'], user['full_name'])
     return {"token": token, "user": {"id": user['id'], "email": user['email'], "full_name": user['full_name'], "role": user['role']}}
@@ -178,17 +380,155 @@ async def login(data: LoginRequest):
 async def get_me(user=Depends(get_current_user)):
     return {"user": user}
 
+@app.get("/api/auth/token-cache")
+async def get_token_cache_stats(user=Depends(require_role('manager'))):
+    with token_cache_lock:
+        hits, misses, size = token_cache_stats["hits"], token_cache_stats["misses"], token_cache.currsize
+    return {"hits": hits, "misses": misses, "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0,
+            "size": size, "max_size": TOKEN_CACHE_SIZE, "ttl_seconds": TOKEN_CACHE_TTL}
+
+@app.get("/api/cache/stats")
+async def get_ref_cache_stats(user=Depends(require_role('manager'))):
+    return ref_cache.info()
+
+# --- List Queries (keyset pagination, filters, projection) ---
+TABLE_COLUMNS = {
+    'vehicles': {'id', 'name', 'model', 'license_plate', 'max_capacity', 'odometer', 'status', 'acquisition_cost', 'created_at'},
+    'drivers': {'id', 'full_name', 'license_number', 'license_expiry', 'safety_score', 'status', 'created_at'},
+    'trips': {'id', 'vehicle_id', 'driver_id', 'origin', 'destination', 'cargo_weight', 'distance', 'revenue', 'status',
+              'start_time', 'end_time', 'created_at'},
+    'maintenance_logs': {'id', 'vehicle_id', 'description', 'cost', 'service_date', 'status', 'created_at'},
+    'expenses': {'id', 'vehicle_id', 'trip_id', 'fuel_liters', 'fuel_cost', 'other_cost', 'created_at'},
+}
+
+# Default select of each list endpoint; the changes feed returns rows in the same shape
+LIST_SELECT = {'vehicles': '*', 'drivers': '*', 'trips': '*, vehicles(*), drivers(*)',
+               'maintenance_logs': '*, vehicles(*)', 'expenses': '*, vehicles(*), trips(*)'}
+# Tables whose rows appear in each list response (the table itself plus its embeds)
+LIST_TABLES = {'vehicles': ['vehicles'], 'drivers': ['drivers'], 'trips': ['trips', 'vehicles', 'drivers'],
+               'maintenance_logs': ['maintenance_logs', 'vehicles'], 'expenses': ['expenses', 'vehicles', 'trips']}
+
+def list_params(limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE), cursor: Optional[str] = None,
+                status: Optional[str] = None, vehicle_id: Optional[str] = None, driver_id: Optional[str] = None,
+                trip_id: Optional[str] = None, since: Optional[str] = None, until: Optional[str] = None,
+                fields: Optional[str] = None):
+    """Common query parameters of the list endpoints. Without `limit` or `cursor` the full list is returned."""
+    return {"limit": limit, "cursor": cursor, "fields": fields, "since": since, "until": until,
+            "filters": {k: v for k, v in (("status", status), ("vehicle_id", vehicle_id), ("driver_id", driver_id),
+                                          ("trip_id", trip_id)) if v is not None}}
+
+def encode_cursor(row: dict) -> str:
+    return base64.urlsafe_b64encode(json.dumps([row['created_at'], row['id']]).encode()).decode()
+
+def decode_cursor(cursor: str):
+    """The (created_at, id) keyset of a cursor, re-serialised so it can be quoted into a filter"""
+    try:
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        parsed = datetime.fromisoformat(created_at)
+        if parsed.tzinfo is None or not is_uuid(row_id):
+            raise ValueError(cursor)
+    except Exception:
+        raise HTTPException(400, "Invalid cursor")
+    # Same fractional precision as the row the cursor came from: SQLite compares timestamps as text
+    fraction = re.match(r'.{19}\.(\d+)', created_at)
+    digits = min(len(fraction.group(1)), 6) if fraction else 0
+    text = parsed.isoformat(timespec='microseconds')
+    return text[:19 + bool(digits) + digits] + text[26:], str(uuid.UUID(row_id))
+
+def select_columns(table: str, fields: Optional[str], default: str, embeds: tuple = ()) -> str:
+    """Build the PostgREST select string for `fields=`; relation names (e.g. `vehicles`) embed the related row"""
+    if not fields:
+        return default
+    columns = []
+    for name in (f.strip() for f in fields.split(',')):
+        if name in TABLE_COLUMNS[table]:
+            columns.append(name)
+        elif name in embeds:
+            columns.append(f"{name}(*)")
+        elif name:
+            raise HTTPException(400, f"Unknown field '{name}' for {table}")
+    # The keyset cursor is built from these two columns
+    columns += [c for c in ('id', 'created_at') if c not in columns]
+    return ','.join(columns)
+
+def keyset_query(table: str, select: str, filters: dict, since: Optional[str] = None, until: Optional[str] = None,
+                 after: Optional[tuple] = None):
+    """Filtered query ordered by (created_at, id) descending, starting after the (created_at, id) keyset `after`"""
+    query = store.table(table).select(select)
+    for column, value in filters.items():
+        query = query.eq(column, value)
+    if since:
+        query = query.gte('created_at', since)
+    if until:
+        query = query.lt('created_at', until)
+    if after:
+        created_at, row_id = after
+        # The OR alone isn't an index condition; the redundant upper bound makes the page a range scan
+        query = query.lte('created_at', created_at).or_(f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt."{row_id}")')
+    return query.order('created_at', desc=True).order('id', desc=True)
+
+async def iter_pages(table: str, select: str, filters: dict, since: Optional[str] = None, until: Optional[str] = None,
+                     page_size: int = EXPORT_PAGE_SIZE):
+    """Yield every matching row in keyset-paginated batches, so memory is bounded by `page_size`"""
+    after = None
+    while True:
+        rows = (await db(keyset_query(table, select, filters, since, until, after).limit(page_size))).data
+        if rows:
+            yield rows
+        if len(rows) < page_size:
+            return
+        after = (rows[-1]['created_at'], rows[-1]['id'])
+
+async def list_rows(table: str, params: dict, default_select: str = '*', embeds: tuple = (), filters: tuple = ()):
+    """Keyset-paginated list query ordered by (created_at, id) descending; pages carry `next_cursor`"""
+    unsupported = set(params["filters"]) - set(filters)
+    if unsupported:
+        raise HTTPException(400, f"Unsupported filter(s) for {table}: {', '.join(sorted(unsupported))}")
+    after = decode_cursor(params["cursor"]) if params["cursor"] else None
+    query = keyset_query(table, select_columns(table, params["fields"], default_select, embeds), params["filters"],
+                         params["since"], params["until"], after)
+    paginated = params["limit"] is not None or params["cursor"] is not None
+    if not paginated:
+        return {"data": (await db(query)).data}
+    limit = params["limit"] or MAX_PAGE_SIZE
+    rows = (await db(query.limit(limit + 1))).data
+    page = rows[:limit]
+    return {"data": page, "next_cursor": encode_cursor(page[-1]) if len(rows) > limit else None}
+
+async def list_etag(request: Request, table: str) -> Optional[str]:
+    """ETag from table_versions() of the list's tables and the query string; None without table_versions"""
+    try:
+        version = (await db(store.rpc('table_versions', {'p_tables': LIST_TABLES[table]}))).data
+    except Exception:
+        return None
+    return make_etag(request.url.path, request.url.query, version)
+
+async def list_response(request: Request, table: str, params: dict, load):
+    """List response with a conditional 304, through the reference cache for vehicles and drivers"""
+    if table in ('vehicles', 'drivers'):
+        # Cached with the tag it was loaded under: a hit needs no table_versions call
+        async def load_tagged():
+            etag = await list_etag(request, table)
+            return {"etag": etag, "payload": await load()}
+
+        entry = await ref_cache.query(table, params, load_tagged)
+        return not_modified(request, entry["etag"]) or json_response(request, entry["payload"], entry["etag"])
+    etag = await list_etag(request, table)
+    return not_modified(request, etag) or json_response(request, await load(), etag)
+
 # --- Vehicles ---
 @app.get("/api/vehicles")
-async def get_vehicles(user=Depends(get_current_user)):
-    result = supabase.table('vehicles').select('*').order('created_at', desc=True).execute()
-    return {"data": result.data}
+async def get_vehicles(request: Request, params=Depends(list_params), user=Depends(get_current_user)):
+    return await list_response(request, 'vehicles', params, lambda: list_rows('vehicles', params, filters=('status',)))
 
 @app.post("/api/vehicles")
 async def create_vehicle(data: VehicleCreate, user=Depends(require_role('manager'))):
     vehicle_data = data.model_dump()
     vehicle_data['status'] = 'available'
-    result = supabase.table('vehicles').insert(vehicle_data).execute()
+    result = await db(store.table('vehicles').insert(vehicle_data))
+    await ref_cache.invalidate('vehicles')
+    kpi_snapshot.vehicle_changed(result.data[0])
+    events.publish('vehicles', 'upsert', result.data[0])
     return {"data": result.data[0]}
 
 @app.put("/api/vehicles/{vehicle_id}")
@@ -196,272 +536,623 @@ async def update_vehicle(vehicle_id: str, data: VehicleUpdate, user=Depends(requ
     update_data = {k: v for k, v in data.model_dump().items() if v is not None}
     if not update_data:
         raise HTTPException(400, "No fields to update")
-    result = supabase.table('vehicles').update(update_data).eq('id', vehicle_id).execute()
+    result = await db(store.table('vehicles').update(update_data).eq('id', vehicle_id))
+    await ref_cache.invalidate('vehicles')
+    if result.data:
+        kpi_snapshot.vehicle_changed(result.data[0])
+        events.publish('vehicles', 'upsert', result.data[0])
     return {"data": result.data[0] if result.data else None}
 
 @app.delete("/api/vehicles/{vehicle_id}")
 async def delete_vehicle(vehicle_id: str, user=Depends(require_role('manager'))):
-    trips = supabase.table('trips').select('id').eq('vehicle_id', vehicle_id).eq('status', 'dispatched').execute()
+    trips = await db(store.table('trips').select('id').eq('vehicle_id', vehicle_id).eq('status', 'dispatched'))
     if trips.data:
         raise HTTPException(400, "Cannot delete vehicle with active trips")
     try:
-        supabase.table('expenses').delete().eq('vehicle_id', vehicle_id).execute()
-        supabase.table('maintenance_logs').delete().eq('vehicle_id', vehicle_id).execute()
-        supabase.table('trips').delete().eq('vehicle_id', vehicle_id).execute()
-        supabase.table('vehicles').delete().eq('id', vehicle_id).execute()
+        await db(store.table('expenses').delete().eq('vehicle_id', vehicle_id))
+        await db(store.table('maintenance_logs').delete().eq('vehicle_id', vehicle_id))
+        await db(store.table('trips').delete().eq('vehicle_id', vehicle_id))
+        await db(store.table('vehicles').delete().eq('id', vehicle_id))
     except Exception as e:
         raise HTTPException(400, f"Cannot delete vehicle: {str(e)}")
+    finally:
+        await ref_cache.invalidate('vehicles')
+        kpi_snapshot.invalidate()
+        events.refresh('trips', 'maintenance_logs', 'expenses')
+    events.publish('vehicles', 'delete', row_id=vehicle_id)
     return {"success": True}
 
 # --- Drivers ---
 @app.get("/api/drivers")
-async def get_drivers(user=Depends(get_current_user)):
-    result = supabase.table('drivers').select('*').order('created_at', desc=True).execute()
-    return {"data": result.data}
+async def get_drivers(request: Request, params=Depends(list_params), user=Depends(get_current_user)):
+    return await list_response(request, 'drivers', params, lambda: list_rows('drivers', params, filters=('status',)))
 
 @app.post("/api/drivers")
 async def create_driver(data: DriverCreate, user=Depends(require_role('manager', 'safety'))):
-    result = supabase.table('drivers').insert(data.model_dump()).execute()
+    result = await db(store.table('drivers').insert(data.model_dump()))
+    await ref_cache.invalidate('drivers')
+    kpi_snapshot.driver_changed(result.data[0])
+    events.publish('drivers', 'upsert', result.data[0])
     return {"data": result.data[0]}
 
 @app.put("/api/drivers/{driver_id}")
 async def update_driver(driver_id: str, data: DriverUpdate, user=Depends(require_role('manager', 'safety'))):
     update_data = {k: v for k, v in data.model_dump().items() if v is not None}
-    result = supabase.table('drivers').update(update_data).eq('id', driver_id).execute()
+    result = await db(store.table('drivers').update(update_data).eq('id', driver_id))
+    await ref_cache.invalidate('drivers')
+    if result.data:
+        kpi_snapshot.driver_changed(result.data[0])
+        events.publish('drivers', 'upsert', result.data[0])
     return {"data": result.data[0] if result.data else None}
 
 @app.delete("/api/drivers/{driver_id}")
 async def delete_driver(driver_id: str, user=Depends(require_role('manager'))):
-    trips = supabase.table('trips').select('id').eq('driver_id', driver_id).eq('status', 'dispatched').execute()
+    trips = await db(store.table('trips').select('id').eq('driver_id', driver_id).eq('status', 'dispatched'))
     if trips.data:
         raise HTTPException(400, "Cannot delete driver with active trips")
     try:
-        supabase.table('trips').update({'driver_id': None}).eq('driver_id', driver_id).execute()
-        supabase.table('drivers').delete().eq('id', driver_id).execute()
+        await db(store.table('trips').update({'driver_id': None}).eq('driver_id', driver_id))
+        await db(store.table('drivers').delete().eq('id', driver_id))
     except Exception as e:
         raise HTTPException(400, f"Cannot delete driver: {str(e)}")
+    finally:
+        await ref_cache.invalidate('drivers')
+    kpi_snapshot.driver_removed(driver_id)
+    events.publish('drivers', 'delete', row_id=driver_id)
+    events.refresh('trips')
     return {"success": True}
 
 # --- Trips (Business Logic) ---
 @app.get("/api/trips")
-async def get_trips(user=Depends(get_current_user)):
-    result = supabase.table('trips').select('*, vehicles(*), drivers(*)').order('created_at', desc=True).execute()
-    return {"data": result.data}
+async def get_trips(request: Request, params=Depends(list_params), user=Depends(get_current_user)):
+    return await list_response(request, 'trips', params, lambda: list_rows(
+        'trips', params, LIST_SELECT['trips'], embeds=('vehicles', 'drivers'), filters=('status', 'vehicle_id', 'driver_id')))
+
+# Ids go out IN_QUERY_CHUNK at a time so the in_() filter stays well within URL length limits
+IN_QUERY_CHUNK = 200
+
+async def fetch_by_ids(table: str, select: str, ids) -> list:
+    ids = list(dict.fromkeys(i for i in ids if i and is_uuid(i)))
+    results = await asyncio.gather(*(db(store.table(table).select(select).in_('id', ids[i:i + IN_QUERY_CHUNK]))
+                                     for i in range(0, len(ids), IN_QUERY_CHUNK)))
+    return [row for r in results for row in r.data]
+
+async def load_trip_refs(trips: list):
+    """Vehicles and drivers referenced by `trips`, from the reference cache"""
+    return await asyncio.gather(
+        ref_cache.rows('vehicles', [t['vehicle_id'] for t in trips], lambda ids: fetch_by_ids('vehicles', '*', ids)),
+        ref_cache.rows('drivers', [t['driver_id'] for t in trips], lambda ids: fetch_by_ids('drivers', '*', ids)))
 
 @app.post("/api/trips")
 async def create_trip(data: TripCreate, user=Depends(require_role('manager', 'dispatcher'))):
-    vehicle = supabase.table('vehicles').select('*').eq('id', data.vehicle_id).execute()
-    if not vehicle.data:
-        raise HTTPException(404, "Vehicle not found")
-    v = vehicle.data[0]
-    if v['status'] != 'available':
-        raise HTTPException(400, f"Vehicle is '{v['status']}', must be 'available'")
-    
-    driver = supabase.table('drivers').select('*').eq('id', data.driver_id).execute()
-    if not driver.data:
-        raise HTTPException(404, "Driver not found")
-    d = driver.data[0]
-    if d['status'] == 'suspended':
-        raise HTTPException(400, "Driver is suspended")
-    if d['license_expiry']:
-        expiry = datetime.strptime(d['license_expiry'], '%Y-%m-%d').date()
-        if expiry < date.today():
-            raise HTTPException(400, "Driver's license has expired")
-    if data.cargo_weight > v['max_capacity']:
-        raise HTTPException(400, f"Cargo weight ({data.cargo_weight}kg) exceeds vehicle capacity ({v['max_capacity']}kg)")
-    
     trip_data = data.model_dump()
+    vehicles, drivers = await load_trip_refs([trip_data])
+    errors = check_trips([trip_data], vehicles, drivers)[0]
+    if errors:
+        raise HTTPException(*errors[0])
+    
     trip_data['status'] = 'draft'
-    result = supabase.table('trips').insert(trip_data).execute()
+    result = await db(store.table('trips').insert(trip_data))
+    kpi_snapshot.trip_changed(None, result.data[0])
+    events.publish('trips', 'upsert', result.data[0])
     return {"data": result.data[0]}
 
+@app.post("/api/trips/validate")
+async def validate_trips(data: TripPlan, user=Depends(require_role('manager', 'dispatcher'))):
+    """Check a batch of candidate trips against the create_trip rules without inserting anything"""
+    if len(data.trips) > MAX_BULK_TRIPS:
+        raise HTTPException(400, f"At most {MAX_BULK_TRIPS} trips per request")
+    trips = [t.model_dump() for t in data.trips]
+    vehicles, drivers = await load_trip_refs(trips)
+    results = [{"index": i, "feasible": not errors, "errors": [message for _, message in errors]}
+               for i, errors in enumerate(check_trips(trips, vehicles, drivers))]
+    feasible = sum(1 for r in results if r['feasible'])
+    return {"data": results, "feasible": feasible, "infeasible": len(results) - feasible}
+
+@app.post("/api/trips/assign")
+async def assign_trip_requests(data: AssignmentRequest, user=Depends(require_role('manager', 'dispatcher'))):
+    """Assign a vehicle and driver to each trip request; `create` inserts the assigned trips as drafts"""
+    if len(data.trips) > MAX_BULK_TRIPS:
+        raise HTTPException(400, f"At most {MAX_BULK_TRIPS} trips per request")
+    try:
+        candidates = (await db(store.rpc('assignment_candidates', {'p_min_safety_score': data.min_safety_score}))).data
+    except Exception as e:
+        raise db_error(e)
+    trips = [t.model_dump() for t in data.trips]
+    vehicles, drivers = candidates['vehicles'], candidates['drivers']
+    # The solver is CPU-bound (about 0.1s at 1k x 1k); keep it off the event loop
+    vehicle_of, driver_of = await asyncio.to_thread(assign_trips, trips, vehicles, drivers)
+
+    results, rows = [], []
+    for i, trip in enumerate(trips):
+        item = {"index": i, "ok": False, "vehicle_id": None, "driver_id": None}
+        if vehicle_of[i] < 0:
+            item["error"] = "No available vehicle with enough capacity"
+        elif driver_of[i] < 0:
+            item["error"] = "No eligible driver left"
+        else:
+            v, d = vehicles[vehicle_of[i]], drivers[driver_of[i]]
+            item.update(ok=True, vehicle_id=v['id'], vehicle_name=v['name'], driver_id=d['id'], driver_name=d['full_name'])
+            rows.append({**trip, "vehicle_id": v['id'], "driver_id": d['id'], "status": "draft"})
+        results.append(item)
+
+    if data.create and rows:
+        created = iter((await db(store.table('trips').insert(rows))).data)
+        for item in results:
+            if item['ok']:
+                item['trip'] = next(created)
+                kpi_snapshot.trip_changed(None, item['trip'])
+                events.publish('trips', 'upsert', item['trip'])
+    assigned = len(rows)
+    return {"data": results, "assigned": assigned, "unassigned": len(results) - assigned,
+            "available_vehicles": len(vehicles), "eligible_drivers": len(drivers)}
+
+def db_error(e: Exception) -> HTTPException:
+    """Map a failed query to an HTTPException; schema.sql functions raise SQLSTATE 'PT<status>' for client errors"""
+    code = str(getattr(e, 'code', None) or '')
+    if code.startswith('PT') and code[2:].isdigit():
+        return HTTPException(int(code[2:]), getattr(e, 'message', None) or str(e))
+    if is_missing_db_object(e):
+        return HTTPException(500, f"{e} - run schema.sql to install the FleetFlow database functions")
+    return HTTPException(500, str(e))
+
+def publish_trip(trip: dict):
+    """Announce a transitioned trip together with the vehicle and driver rows embedded in it"""
+    events.publish('trips', 'upsert', trip)
+    for table in ('vehicles', 'drivers'):
+        if trip.get(table):
+            events.publish(table, 'upsert', trip[table])
+
+async def transition_trip(action: str, trip_id: str):
+    """Run a trip transition as one locking database function (trip_dispatch/complete/cancel)"""
+    try:
+        result = (await db(store.rpc(f'trip_{action}', {'p_trip_id': trip_id}))).data
+    except Exception as e:
+        raise db_error(e)
+    await ref_cache.invalidate('vehicles', 'drivers')
+    kpi_snapshot.trip_changed(result['previous'], result['trip'])
+    publish_trip(result['trip'])
+    return {"data": result['trip']}
+
 @app.put("/api/trips/{trip_id}/dispatch")
 async def dispatch_trip(trip_id: str, user=Depends(require_role('manager', 'dispatcher'))):
-    trip = supabase.table('trips').select('*').eq('id', trip_id).execute()
-    if not trip.data:
-        raise HTTPException(404, "Trip not found")
-    t = trip.data[0]
-    if t['status'] != 'draft':
-        raise HTTPException(400, f"Trip is '{t['status']}', must be 'draft' to dispatch")
-    
-    vehicle = supabase.table('vehicles').select('status').eq('id', t['vehicle_id']).execute()
-    if vehicle.data and vehicle.data[0]['status'] != 'available':
-        raise HTTPException(400, "Vehicle is no longer available")
-    
-    now = datetime.now(timezone.utc).isoformat()
-    supabase.table('trips').update({'status': 'dispatched', 'start_time': now}).eq('id', trip_id).execute()
-    supabase.table('vehicles').update({'status': 'on_trip'}).eq('id', t['vehicle_id']).execute()
-    supabase.table('drivers').update({'status': 'on_duty'}).eq('id', t['driver_id']).execute()
-    
-    result = supabase.table('trips').select('*, vehicles(*), drivers(*)').eq('id', trip_id).execute()
-    return {"data": result.data[0]}
+    return await transition_trip('dispatch', trip_id)
 
 @app.put("/api/trips/{trip_id}/complete")
 async def complete_trip(trip_id: str, user=Depends(require_role('manager', 'dispatcher'))):
-    trip = supabase.table('trips').select('*').eq('id', trip_id).execute()
-    if not trip.data:
-        raise HTTPException(404, "Trip not found")
-    t = trip.data[0]
-    if t['status'] != 'dispatched':
-        raise HTTPException(400, "Trip must be dispatched to complete")
-    
-    now = datetime.now(timezone.utc).isoformat()
-    supabase.table('trips').update({'status': 'completed', 'end_time': now}).eq('id', trip_id).execute()
-    supabase.table('vehicles').update({'status': 'available'}).eq('id', t['vehicle_id']).execute()
-    supabase.table('drivers').update({'status': 'off_duty'}).eq('id', t['driver_id']).execute()
-    
-    result = supabase.table('trips').select('*, vehicles(*), drivers(*)').eq('id', trip_id).execute()
-    return {"data": result.data[0]}
+    return await transition_trip('complete', trip_id)
 
 @app.put("/api/trips/{trip_id}/cancel")
 async def cancel_trip(trip_id: str, user=Depends(require_role('manager', 'dispatcher'))):
-    trip = supabase.table('trips').select('*').eq('id', trip_id).execute()
-    if not trip.data:
-        raise HTTPException(404, "Trip not found")
-    t = trip.data[0]
-    if t['status'] not in ['draft', 'dispatched']:
-        raise HTTPException(400, "Only draft or dispatched trips can be cancelled")
-    
-    if t['status'] == 'dispatched':
-        supabase.table('vehicles').update({'status': 'available'}).eq('id', t['vehicle_id']).execute()
-        supabase.table('drivers').update({'status': 'off_duty'}).eq('id', t['driver_id']).execute()
-    
-    supabase.table('trips').update({'status': 'cancelled'}).eq('id', trip_id).execute()
-    result = supabase.table('trips').select('*, vehicles(*), drivers(*)').eq('id', trip_id).execute()
-    return {"data": result.data[0]}
+    return await transition_trip('cancel', trip_id)
+
+async def transition_trips(action: str, trip_ids: list):
+    """Bulk transition_trip in one transaction; failing items are reported per item"""
+    if len(trip_ids) > MAX_BULK_TRIPS:
+        raise HTTPException(400, f"At most {MAX_BULK_TRIPS} trips per request")
+    valid = [i for i in trip_ids if is_uuid(i)]
+    try:
+        results = (await db(store.rpc(f'trips_{action}', {'p_trip_ids': valid}))).data if valid else []
+    except Exception as e:
+        raise db_error(e)
+    if any(r.get('trip') for r in results):
+        await ref_cache.invalidate('vehicles', 'drivers')
+    by_position = iter(results)
+    items = []
+    for trip_id in trip_ids:
+        if not is_uuid(trip_id):
+            items.append({"id": trip_id, "ok": False, "error": "Trip not found"})
+            continue
+        r = next(by_position)
+        if r['error']:
+            items.append({"id": r['id'], "ok": False, "error": r['error']})
+        else:
+            kpi_snapshot.trip_changed(r['previous'], r['trip'])
+            publish_trip(r['trip'])
+            items.append({"id": r['id'], "ok": True, "data": r['trip']})
+    succeeded = sum(1 for i in items if i['ok'])
+    return {"data": items, "succeeded": succeeded, "failed": len(items) - succeeded}
+
+@app.post("/api/trips/bulk/dispatch")
+async def dispatch_trips(request: Request, data: TripBatch, user=Depends(require_role('manager', 'dispatcher'))):
+    return json_response(request, await transition_trips('dispatch', data.trip_ids))
+
+@app.post("/api/trips/bulk/complete")
+async def complete_trips(request: Request, data: TripBatch, user=Depends(require_role('manager', 'dispatcher'))):
+    return json_response(request, await transition_trips('complete', data.trip_ids))
 
 # --- Maintenance ---
 @app.get("/api/maintenance")
-async def get_maintenance(user=Depends(get_current_user)):
-    result = supabase.table('maintenance_logs').select('*, vehicles(*)').order('created_at', desc=True).execute()
-    return {"data": result.data}
+async def get_maintenance(request: Request, params=Depends(list_params), user=Depends(get_current_user)):
+    return await list_response(request, 'maintenance_logs', params, lambda: list_rows(
+        'maintenance_logs', params, LIST_SELECT['maintenance_logs'], embeds=('vehicles',), filters=('status', 'vehicle_id')))
 
 @app.post("/api/maintenance")
 async def create_maintenance(data: MaintenanceCreate, user=Depends(require_role('manager'))):
     maint_data = data.model_dump()
     maint_data['status'] = 'in_progress'
-    result = supabase.table('maintenance_logs').insert(maint_data).execute()
-    supabase.table('vehicles').update({'status': 'in_shop'}).eq('id', data.vehicle_id).execute()
+    result = await db(store.table('maintenance_logs').insert(maint_data))
+    vehicle = await db(store.table('vehicles').update({'status': 'in_shop'}).eq('id', data.vehicle_id))
+    await ref_cache.invalidate('vehicles')
+    kpi_snapshot.maintenance_added(result.data[0])
+    kpi_snapshot.vehicle_changed({'id': data.vehicle_id, 'status': 'in_shop'})
+    events.publish('maintenance_logs', 'upsert', result.data[0])
+    events.publish_rows('vehicles', vehicle.data)
     return {"data": result.data[0]}
 
 @app.put("/api/maintenance/{maint_id}/complete")
 async def complete_maintenance(maint_id: str, user=Depends(require_role('manager'))):
-    maint = supabase.table('maintenance_logs').select('*').eq('id', maint_id).execute()
+    maint = await db(store.table('maintenance_logs').select('*').eq('id', maint_id))
     if not maint.data:
         raise HTTPException(404, "Maintenance log not found")
-    supabase.table('maintenance_logs').update({'status': 'completed'}).eq('id', maint_id).execute()
-    supabase.table('vehicles').update({'status': 'available'}).eq('id', maint.data[0]['vehicle_id']).execute()
-    result = supabase.table('maintenance_logs').select('*, vehicles(*)').eq('id', maint_id).execute()
+    await db(store.table('maintenance_logs').update({'status': 'completed'}).eq('id', maint_id))
+    await db(store.table('vehicles').update({'status': 'available'}).eq('id', maint.data[0]['vehicle_id']))
+    await ref_cache.invalidate('vehicles')
+    result = await db(store.table('maintenance_logs').select('*, vehicles(*)').eq('id', maint_id))
+    kpi_snapshot.vehicle_changed(result.data[0].get('vehicles'))
+    events.publish('maintenance_logs', 'upsert', result.data[0])
+    if result.data[0].get('vehicles'):
+        events.publish('vehicles', 'upsert', result.data[0]['vehicles'])
     return {"data": result.data[0]}
 
 # --- Expenses ---
 @app.get("/api/expenses")
-async def get_expenses(user=Depends(get_current_user)):
-    result = supabase.table('expenses').select('*, vehicles(*), trips(*)').order('created_at', desc=True).execute()
-    return {"data": result.data}
+async def get_expenses(request: Request, params=Depends(list_params), user=Depends(get_current_user)):
+    return await list_response(request, 'expenses', params, lambda: list_rows(
+        'expenses', params, LIST_SELECT['expenses'], embeds=('vehicles', 'trips'), filters=('vehicle_id', 'trip_id')))
 
 @app.post("/api/expenses")
 async def create_expense(data: ExpenseCreate, user=Depends(require_role('manager', 'dispatcher'))):
     expense_data = data.model_dump()
     if expense_data.get('trip_id') == '':
         expense_data['trip_id'] = None
-    result = supabase.table('expenses').insert(expense_data).execute()
+    result = await db(store.table('expenses').insert(expense_data))
+    kpi_snapshot.expense_added(result.data[0])
+    events.publish('expenses', 'upsert', result.data[0])
     return {"data": result.data[0]}
 
+# --- Changes Feed ---
+change_log_pruned_at = float('-inf')
+
+def encode_change_cursor(txid: str, change_id: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps([txid, change_id, int(time.time())]).encode()).decode()
+
+def decode_change_cursor(cursor: str):
+    try:
+        txid, change_id, issued_at = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return str(int(txid)), int(change_id), float(issued_at)
+    except Exception:
+        raise HTTPException(400, "Invalid cursor")
+
+async def prune_change_log():
+    """Hourly housekeeping: prune change_log and create the coming expenses partitions"""
+    global change_log_pruned_at
+    if time.monotonic() - change_log_pruned_at < 3600:
+        return
+    change_log_pruned_at = time.monotonic()
+    today = date.today()
+    for name, params in (('prune_change_log', {'p_keep': f'{CHANGE_RETENTION_SECONDS} seconds'}),
+                         ('create_month_partitions', {'p_table': 'expenses', 'p_from': today.isoformat(),
+                                                      'p_to': (today + timedelta(days=PARTITION_MONTHS_AHEAD * 31)).isoformat()})):
+        try:
+            await db(store.rpc(name, params))
+        except Exception as e:
+            # Without new partitions expenses still insert (into expenses_default) but lose pruning
+            logger.error("Housekeeping %s failed: %s", name, e)
+
+@app.get("/api/changes")
+async def get_changes(request: Request, background: BackgroundTasks, since: Optional[str] = None,
+                      limit: int = Query(CHANGES_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE), user=Depends(get_current_user)):
+    """Rows changed after the `since` cursor, per table in list shape; `reset` means reload everything"""
+    reset = False
+    if since is None:
+        txid, change_id = '0', 0
+    else:
+        txid, change_id, issued_at = decode_change_cursor(since)
+        reset = time.time() - issued_at > CHANGE_RETENTION_SECONDS
+    start = since is None or reset
+    try:
+        result = (await db(store.rpc('changes_since', {'p_txid': txid, 'p_id': change_id,
+                                                           'p_limit': 0 if start else limit}))).data
+    except Exception as e:
+        raise db_error(e)
+    background.add_task(prune_change_log)
+    if start:
+        return {"changes": {}, "cursor": encode_change_cursor(result['horizon'], 0), "has_more": False, "reset": reset}
+
+    changes = result['changes']
+    has_more = len(changes) == limit
+    if has_more:
+        cursor = encode_change_cursor(changes[-1]['txid'], changes[-1]['id'])
+    else:
+        cursor = encode_change_cursor(*max((int(txid), change_id), (int(result['horizon']), 0)))
+
+    # Only the last operation on each row matters; current rows are re-read in list shape
+    latest = {}
+    for change in changes:
+        latest[(change['table'], change['row_id'])] = change['op']
+    by_table = {}
+    for (table, row_id), op in latest.items():
+        by_table.setdefault(table, []).append((row_id, op))
+    fetched = await asyncio.gather(*(fetch_by_ids(table, LIST_SELECT[table], [i for i, op in rows if op != 'delete'])
+                                     for table, rows in by_table.items()))
+    payload = {"changes": {}, "cursor": cursor, "has_more": has_more, "reset": False}
+    for (table, rows), current in zip(by_table.items(), fetched):
+        found = {r['id'] for r in current}
+        # Updated and then deleted before this read: report as deleted
+        payload["changes"][table] = {"upserted": current, "deleted": [i for i, _ in rows if i not in found]}
+    if payload["changes"]:
+        try:
+            payload["kpis"] = (await kpi_snapshot.read(load_kpi_state))["kpis"]
+        except Exception:
+            pass
+    return json_response(request, payload)
+
+# --- Event Stream ---
+def sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {encode_json(data).decode()}\n\n"
+
+@app.post("/api/events/token")
+async def issue_stream_token(user=Depends(get_current_user)):
+    """A token for ?token= on /api/events, valid for STREAM_TOKEN_TTL seconds and nothing else"""
+    return {"token": create_stream_token(user), "expires_in": STREAM_TOKEN_TTL}
+
+@app.get("/api/events")
+async def stream_events(request: Request, user=Depends(get_stream_user)):
+    """Server-Sent Events stream of this API's writes; a stream token may be passed as ?token="""
+    async def stream():
+        sub = events.subscribe()
+        try:
+            yield "retry: 3000\n\n"
+            while not await request.is_disconnected():
+                batch = await sub.next_batch(EVENTS_KEEPALIVE_SECONDS)
+                if batch is None:
+                    yield ": keepalive\n\n"
+                    continue
+                kind, items = batch
+                if kind == 'changes' and not items:
+                    continue
+                data = {"events": items}
+                try:
+                    data["kpis"] = (await kpi_snapshot.read(load_kpi_state))["kpis"]
+                except Exception:
+                    pass
+                yield sse(kind, data)
+        finally:
+            events.unsubscribe(sub)
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 # --- Analytics ---
+async def load_kpi_state():
+    return (await db(store.rpc('analytics_state'))).data
+
+# The snapshot re-renders its payload only when something changed; the encoded body and
+# its ETag are kept alongside until it does
+summary_body = {"payload": None, "body": None, "etag": None}
+
 @app.get("/api/analytics/summary")
-async def get_analytics_summary(user=Depends(get_current_user)):
-    vehicles = supabase.table('vehicles').select('*').execute().data
-    trips = supabase.table('trips').select('*').execute().data
-    drivers = supabase.table('drivers').select('*').execute().data
-    expenses = supabase.table('expenses').select('*').execute().data
-    maintenance = supabase.table('maintenance_logs').select('*').execute().data
-    
-    total_vehicles = len(vehicles)
-    available = len([v for v in vehicles if v['status'] == 'available'])
-    on_trip = len([v for v in vehicles if v['status'] == 'on_trip'])
-    in_shop = len([v for v in vehicles if v['status'] == 'in_shop'])
-    active_trips = len([t for t in trips if t['status'] == 'dispatched'])
-    completed_trips = len([t for t in trips if t['status'] == 'completed'])
-    total_revenue = sum(float(t.get('revenue', 0) or 0) for t in trips if t['status'] == 'completed')
-    total_fuel_cost = sum(float(e.get('fuel_cost', 0) or 0) for e in expenses)
-    total_maint_cost = sum(float(m.get('cost', 0) or 0) for m in maintenance)
-    total_other_cost = sum(float(e.get('other_cost', 0) or 0) for e in expenses)
-    utilization = (on_trip / total_vehicles * 100) if total_vehicles > 0 else 0
-    total_fuel_liters = sum(float(e.get('fuel_liters', 0) or 0) for e in expenses)
-    total_distance = sum(float(t.get('distance', 0) or 0) for t in trips if t['status'] == 'completed')
-    fuel_efficiency = (total_distance / total_fuel_liters) if total_fuel_liters > 0 else 0
-    
-    from collections import defaultdict
-    revenue_by_day = defaultdict(float)
-    expense_by_day = defaultdict(float)
-    for t in trips:
-        if t['status'] == 'completed' and t.get('end_time'):
-            day = t['end_time'][:10]
-            revenue_by_day[day] += float(t.get('revenue', 0) or 0)
-    for e in expenses:
-        if e.get('created_at'):
-            day = e['created_at'][:10]
-            expense_by_day[day] += float(e.get('fuel_cost', 0) or 0) + float(e.get('other_cost', 0) or 0)
-    
-    vehicle_roi = []
-    for v in vehicles:
-        v_trips = [t for t in trips if t.get('vehicle_id') == v['id'] and t['status'] == 'completed']
-        v_expenses = [e for e in expenses if e.get('vehicle_id') == v['id']]
-        v_maint = [m for m in maintenance if m.get('vehicle_id') == v['id']]
-        v_revenue = sum(float(t.get('revenue', 0) or 0) for t in v_trips)
-        v_cost = sum(float(e.get('fuel_cost', 0) or 0) + float(e.get('other_cost', 0) or 0) for e in v_expenses) + sum(float(m.get('cost', 0) or 0) for m in v_maint)
-        acq = float(v.get('acquisition_cost', 1) or 1)
-        roi = ((v_revenue - v_cost) / acq * 100) if acq > 0 else 0
-        vehicle_roi.append({"id": v['id'], "name": v['name'], "revenue": v_revenue, "cost": v_cost, "roi": round(roi, 1)})
-    
-    return {
-        "kpis": {
-            "total_vehicles": total_vehicles, "available_vehicles": available, "on_trip_vehicles": on_trip,
-            "in_shop_vehicles": in_shop, "active_trips": active_trips, "completed_trips": completed_trips,
-            "total_revenue": total_revenue, "total_fuel_cost": total_fuel_cost, "total_maintenance_cost": total_maint_cost,
-            "total_expenses": total_fuel_cost + total_maint_cost + total_other_cost,
-            "utilization": round(utilization, 1), "fuel_efficiency": round(fuel_efficiency, 2),
-            "on_duty_drivers": len([d for d in drivers if d['status'] == 'on_duty']), "total_drivers": len(drivers)
-        },
-        "revenue_by_day": dict(revenue_by_day),
-        "expense_by_day": dict(expense_by_day),
-        "vehicle_roi": vehicle_roi,
-        "cost_breakdown": {"fuel": total_fuel_cost, "maintenance": total_maint_cost, "other": total_other_cost}
-    }
+async def get_analytics_summary(request: Request, user=Depends(get_current_user)):
+    try:
+        payload = await kpi_snapshot.read(load_kpi_state)
+    except Exception as e:
+        if not is_missing_db_object(e):
+            raise HTTPException(500, str(e))
+        payload = None
+    if payload is not None:
+        if summary_body["payload"] is not payload:
+            body = encode_json(payload)
+            summary_body.update(payload=payload, body=body, etag=make_etag(body))
+        body, etag = summary_body["body"], summary_body["etag"]
+    else:
+        # No analytics_state (older schema, or the SQLite backend): aggregate in one analytics_summary call
+        try:
+            body = encode_json((await db(store.rpc('analytics_summary'))).data)
+        except Exception as e:
+            raise db_error(e)
+        etag = make_etag(body)
+    return not_modified(request, etag) or json_response(request, etag=etag, body=body)
 
 # --- Export ---
-@app.get("/api/export/csv")
-async def export_csv(user=Depends(get_current_user)):
-    trips = supabase.table('trips').select('*, vehicles(name), drivers(full_name)').execute().data
+CSV_HEADER = ['Trip ID', 'Vehicle', 'Driver', 'Origin', 'Destination', 'Cargo Weight', 'Distance', 'Revenue', 'Status', 'Start Time', 'End Time']
+
+async def trip_csv_chunks(pages):
+    """Render each page of trips to CSV text as soon as it arrives"""
     output = io.StringIO()
     writer = csv.writer(output)
-    writer.writerow(['Trip ID', 'Vehicle', 'Driver', 'Origin', 'Destination', 'Cargo Weight', 'Distance', 'Revenue', 'Status', 'Start Time', 'End Time'])
-    for t in trips:
-        writer.writerow([t['id'], (t.get('vehicles') or {}).get('name', ''), (t.get('drivers') or {}).get('full_name', ''),
-            t['origin'], t['destination'], t['cargo_weight'], t.get('distance', 0), t.get('revenue', 0),
-            t['status'], t.get('start_time', ''), t.get('end_time', '')])
-    output.seek(0)
-    return StreamingResponse(iter([output.getvalue()]), media_type="text/csv",
+    writer.writerow(CSV_HEADER)
+    yield output.getvalue()
+    async for trips in pages:
+        output.seek(0)
+        output.truncate()
+        for t in trips:
+            writer.writerow([t['id'], (t.get('vehicles') or {}).get('name', ''), (t.get('drivers') or {}).get('full_name', ''),
+                t['origin'], t['destination'], t['cargo_weight'], t.get('distance', 0), t.get('revenue', 0),
+                t['status'], t.get('start_time', ''), t.get('end_time', '')])
+        yield output.getvalue()
+
+async def gzip_chunks(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    async for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+@app.get("/api/export/csv")
+async def export_csv(status: Optional[str] = None, since: Optional[str] = None, until: Optional[str] = None,
+                     gzip: bool = False, user=Depends(get_current_user)):
+    filters = {'status': status} if status else {}
+    chunks = trip_csv_chunks(iter_pages('trips', '*, vehicles(name), drivers(full_name)', filters, since, until))
+    if gzip:
+        return StreamingResponse(gzip_chunks(chunks), media_type="application/gzip",
+            headers={"Content-Disposition": "attachment; filename=fleetflow_report.csv.gz"})
+    return StreamingResponse(chunks, media_type="text/csv",
         headers={"Content-Disposition": "attachment; filename=fleetflow_report.csv"})
 
+@app.get("/api/export/columnar/{dataset}")
+async def export_columnar(dataset: str, format: str = 'parquet', status: Optional[str] = None, since: Optional[str] = None,
+                          until: Optional[str] = None, user=Depends(get_current_user)):
+    """Stream trips, expenses or maintenance logs as typed Parquet or Arrow IPC record batches"""
+    if dataset not in COLUMNAR_DATASETS:
+        raise HTTPException(404, f"Unknown dataset. Must be: {', '.join(COLUMNAR_DATASETS)}")
+    if format not in COLUMNAR_FORMATS:
+        raise HTTPException(400, f"Invalid format. Must be: {', '.join(COLUMNAR_FORMATS)}")
+    table, select, schema = COLUMNAR_DATASETS[dataset]
+    if status and 'status' not in schema.names:
+        raise HTTPException(400, f"{dataset} cannot be filtered by status")
+    filters = {'status': status} if status else {}
+    media_type, extension = COLUMNAR_FORMATS[format]
+    return StreamingResponse(encode_stream(iter_pages(table, select, filters, since, until), schema, format),
+        media_type=media_type, headers={"Content-Disposition": f"attachment; filename=fleetflow_{dataset}.{extension}"})
+
+# --- Profiling (manager only) ---
+PROFILE_FORMATS = ("collapsed", "speedscope")
+
+def check_profile_format(format: str):
+    if format not in PROFILE_FORMATS:
+        raise HTTPException(400, f"Invalid format. Must be: {', '.join(PROFILE_FORMATS)}")
+
+def profile_response(profile, format: str):
+    if format == "speedscope":
+        return Response(encode_json(profile.speedscope()), media_type="application/json",
+                        headers={"Content-Disposition": f"attachment; filename=fleetflow_profile_{profile.id}.speedscope.json"})
+    return Response(profile.collapsed(), media_type="text/plain")
+
+@app.post("/api/profiler/sample")
+async def sample_profile(seconds: float = Query(10, gt=0), interval_ms: float = Query(10, ge=1, le=1000),
+                         idle: bool = False, format: str = "collapsed",
+                         user=Depends(require_role("manager"))):
+    """Sample every thread for `seconds` and return the profile"""
+    check_profile_format(format)
+    if seconds > PROFILER_MAX_SECONDS:
+        raise HTTPException(400, f"seconds must be at most {PROFILER_MAX_SECONDS:g}")
+    try:
+        profile = await profiler.sample(seconds, interval_ms / 1000, idle)
+    except RuntimeError as e:
+        raise HTTPException(409, str(e))
+    return profile_response(profile, format)
+
+@app.post("/api/profiler/trigger")
+async def arm_profiler(trigger: ProfileTrigger, user=Depends(require_role("manager"))):
+    """Capture a profile for each request matching the route and latency threshold, until max_profiles or `seconds` pass"""
+    if trigger.route is not None and trigger.route not in {r.path for r in app.routes}:
+        raise HTTPException(400, f"Unknown route '{trigger.route}': use a route template such as /api/trips/{{trip_id}}")
+    try:
+        profiler.arm(trigger.route, trigger.min_ms, trigger.seconds, trigger.interval_ms / 1000,
+                     trigger.max_profiles, trigger.idle)
+    except RuntimeError as e:
+        raise HTTPException(409, str(e))
+    return profiler.status()
+
+@app.get("/api/profiler")
+async def profiler_status(user=Depends(require_role("manager"))):
+    return profiler.status()
+
+@app.delete("/api/profiler")
+async def disarm_profiler(user=Depends(require_role("manager"))):
+    profiler.disarm()
+    return profiler.status()
+
+@app.get("/api/profiler/profiles/{profile_id}")
+async def get_profile(profile_id: int, format: str = "collapsed",
+                      user=Depends(require_role("manager"))):
+    check_profile_format(format)
+    profile = profiler.profiles.get(profile_id)
+    if profile is None:
+        raise HTTPException(404, "Profile not found")
+    return profile_response(profile, format)
+
 # --- Seed Data ---
+async def insert_rows(table: str, rows: list) -> list:
+    return (await db(store.table(table).insert(rows))).data
+
+# --- Bulk Import ---
+# dataset -> (table, row model, roles allowed to import); the same models and roles as the
+# single-record create endpoints
+IMPORT_DATASETS = {
+    'vehicles': ('vehicles', VehicleCreate, ('manager',)),
+    'drivers': ('drivers', DriverCreate, ('manager', 'safety')),
+    'expenses': ('expenses', ExpenseCreate, ('manager', 'dispatcher')),
+    'maintenance': ('maintenance_logs', MaintenanceCreate, ('manager',)),
+}
+
+def import_row(dataset: str, data: BaseModel) -> dict:
+    """Build the row create_vehicle / create_driver / create_expense / create_maintenance would insert"""
+    row = data.model_dump()
+    if dataset == 'vehicles':
+        row['status'] = 'available'
+    elif dataset == 'expenses' and row.get('trip_id') == '':
+        row['trip_id'] = None
+    elif dataset == 'maintenance':
+        # The maintenance_vehicle_status trigger moves each vehicle into the shop
+        row['status'] = 'in_progress'
+    return row
+
+@app.post("/api/import/{dataset}")
+async def bulk_import(dataset: str, request: Request, format: Optional[str] = None,
+                      batch_size: int = Query(500, ge=1, le=5000), user=Depends(get_current_user)):
+    """Stream a CSV or NDJSON upload into `dataset`, reporting bad rows by line number"""
+    if dataset not in IMPORT_DATASETS:
+        raise HTTPException(404, f"Unknown dataset '{dataset}'")
+    table, model, roles = IMPORT_DATASETS[dataset]
+    if user["role"] not in roles:
+        raise HTTPException(status_code=403, detail="Insufficient permissions")
+    fmt = format or ('ndjson' if 'json' in request.headers.get('content-type', '') else 'csv')
+    if fmt not in IMPORT_FORMATS:
+        raise HTTPException(400, f"format must be one of {', '.join(IMPORT_FORMATS)}")
+
+    async def insert(rows):
+        await db(store.table(table).insert(rows, returning=ReturnMethod.minimal))
+
+    try:
+        stats = await import_records(iter_records(request.stream(), fmt), model, lambda data: import_row(dataset, data),
+                                     insert, batch_size, IMPORT_PARALLEL_BATCHES)
+    finally:
+        kpi_snapshot.invalidate()
+        refreshed = (table, 'vehicles') if table == 'maintenance_logs' else (table,)
+        await ref_cache.invalidate(*refreshed)
+        events.refresh(*refreshed)
+    return {"dataset": dataset, "format": fmt, **stats}
+
 @app.post("/api/seed")
-async def seed_data():
+async def seed_data(request: Request, vehicles: int = Query(0, ge=0, le=1_000_000),
+                    drivers: int = Query(0, ge=0, le=1_000_000), trips: int = Query(0, ge=0, le=10_000_000),
+                    days: int = Query(180, ge=1, le=3650), batch_size: int = Query(1000, ge=1, le=5000),
+                    seed: Optional[int] = None, force: bool = False):
+    """Seed the demo fleet, or a synthetic fleet of the given size (ALLOW_SYNTHETIC_SEED, managers only)"""
+    if vehicles or drivers or trips:
+        if not ALLOW_SYNTHETIC_SEED:
+            raise HTTPException(403, "Synthetic seeding is disabled. Set ALLOW_SYNTHETIC_SEED to enable it")
+        require_role("manager")(get_current_user(request))
+        if trips and not (vehicles and drivers):
+            raise HTTPException(400, "Generating trips requires vehicles and drivers")
+        if not force and (await db(store.table('vehicles').select('id').limit(1))).data:
+            raise HTTPException(409, "Data already exists. Pass force=true to add a synthetic fleet anyway")
+        try:
+            stats = await generate_fleet(insert_rows, vehicles, drivers, trips, days, batch_size, SEED_PARALLEL_BATCHES, seed)
+        finally:
+            await ref_cache.invalidate(*LIST_SELECT)
+            kpi_snapshot.invalidate()
+            events.refresh(*LIST_SELECT)
+        return {"message": "Synthetic data generated", **stats}
+
     try:
-        existing = supabase.table('vehicles').select('id').limit(1).execute()
+        existing = await db(store.table('vehicles').select('id').limit(1))
         if existing.data:
             return {"message": "Data already exists", "skipped": True}
     except Exception as e:
         raise HTTPException(503, f"Database tables not created. Please run schema.sql first. Error: {str(e)}")
     
+    hashes = await asyncio.gather(*(run_auth(hash_password, "password123") for _ in range(4)))
     users = [
-        {"email": "manager@fleetflow.com", "password_hash": hash_password("password123"), "full_name": "Alex Thompson", "role": "manager"},
-        {"email": "dispatcher@fleetflow.com", "password_hash": hash_password("password123"), "full_name": "Sarah Chen", "role": "dispatcher"},
-        {"email": "safety@fleetflow.com", "password_hash": hash_password("password123"), "full_name": "Mike Rodriguez", "role": "safety"},
-        {"email": "analyst@fleetflow.com", "password_hash": hash_password("password123"), "full_name": "Emily Park", "role": "analyst"},
+        {"email": "manager@fleetflow.com", "password_hash": hashes[0], "full_name": "Alex Thompson", "role": "manager"},
+        {"email": "dispatcher@fleetflow.com", "password_hash": hashes[1], "full_name": "Sarah Chen", "role": "dispatcher"},
+        {"email": "safety@fleetflow.com", "password_hash": hashes[2], "full_name": "Mike Rodriguez", "role": "safety"},
+        {"email": "analyst@fleetflow.com", "password_hash": hashes[3], "full_name": "Emily Park", "role": "analyst"},
     ]
-    supabase.table('users').insert(users).execute()
+    await db(store.table('users').insert(users))
     
     vehicles_data = [
         {"name": "Falcon X Truck", "model": "Ford F-750", "license_plate": "FL-001-TX", "max_capacity": 8000, "odometer": 45230, "status": "on_trip", "acquisition_cost": 85000},
@@ -473,7 +1164,7 @@ async def seed_data():
         {"name": "Thunder Hauler", "model": "Peterbilt 579", "license_plate": "FL-007-TH", "max_capacity": 18000, "odometer": 115000, "status": "retired", "acquisition_cost": 145000},
         {"name": "Blaze Runner", "model": "Freightliner Cascadia", "license_plate": "FL-008-BR", "max_capacity": 10000, "odometer": 56700, "status": "available", "acquisition_cost": 95000},
     ]
-    v_res = supabase.table('vehicles').insert(vehicles_data).execute()
+    v_res = await db(store.table('vehicles').insert(vehicles_data))
     vids = [v['id'] for v in v_res.data]
     
     drivers_data = [
@@ -484,7 +1175,7 @@ async def seed_data():
         {"full_name": "Marcus Johnson", "license_number": "DL-2024-005", "license_expiry": "2026-08-10", "safety_score": 55, "status": "suspended"},
         {"full_name": "Lisa Wong", "license_number": "DL-2024-006", "license_expiry": "2027-12-01", "safety_score": 97, "status": "off_duty"},
     ]
-    d_res = supabase.table('drivers').insert(drivers_data).execute()
+    d_res = await db(store.table('drivers').insert(drivers_data))
     dids = [d['id'] for d in d_res.data]
     
     now = datetime.now(timezone.utc)
@@ -498,7 +1189,7 @@ async def seed_data():
         {"vehicle_id": vids[2], "driver_id": dids[2], "origin": "Denver, CO", "destination": "Phoenix, AZ", "cargo_weight": 9800, "distance": 945, "revenue": 6200, "status": "completed", "start_time": (now - timedelta(days=3)).isoformat(), "end_time": (now - timedelta(days=2)).isoformat()},
         {"vehicle_id": vids[5], "driver_id": dids[5], "origin": "Austin, TX", "destination": "San Antonio, TX", "cargo_weight": 1200, "distance": 130, "revenue": 950, "status": "cancelled"},
     ]
-    supabase.table('trips').insert(trips_data).execute()
+    await db(store.table('trips').insert(trips_data))
     
     maint_data = [
         {"vehicle_id": vids[3], "description": "Brake Replacement - Front axle", "cost": 1200, "service_date": str(date.today()), "status": "in_progress"},
@@ -507,7 +1198,7 @@ async def seed_data():
         {"vehicle_id": vids[1], "description": "Tire Rotation", "cost": 180, "service_date": str(date.today() - timedelta(days=10)), "status": "completed"},
         {"vehicle_id": vids[2], "description": "Transmission Service", "cost": 2500, "service_date": str(date.today() - timedelta(days=20)), "status": "completed"},
     ]
-    supabase.table('maintenance_logs').insert(maint_data).execute()
+    await db(store.table('maintenance_logs').insert(maint_data))
     
     exp_data = [
         {"vehicle_id": vids[0], "fuel_liters": 120, "fuel_cost": 210, "other_cost": 45},
@@ -516,7 +1207,10 @@ async def seed_data():
         {"vehicle_id": vids[5], "fuel_liters": 60, "fuel_cost": 105, "other_cost": 15},
         {"vehicle_id": vids[0], "fuel_liters": 95, "fuel_cost": 166, "other_cost": 25},
     ]
-    supabase.table('expenses').insert(exp_data).execute()
+    await db(store.table('expenses').insert(exp_data))
+    await ref_cache.invalidate(*LIST_SELECT)
+    kpi_snapshot.invalidate()
+    events.refresh(*LIST_SELECT)
     
     return {"message": "Demo data seeded successfully", "counts": {"users": 4, "vehicles": 8, "drivers": 6, "trips": 8, "maintenance": 5, "expenses": 5}}
 
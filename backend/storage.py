@@ -0,0 +1,758 @@
+"""Storage backends with PostgREST's query-builder interface: supabase-py, Postgres (asyncpg) and SQLite"""
+import re
+import json
+import asyncio
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+from analytics import summarize
+
+TABLES = ('users', 'vehicles', 'drivers', 'trips', 'maintenance_logs', 'expenses')
+# Embeddable relation -> the foreign key column referencing it
+RELATIONS = {'vehicles': 'vehicle_id', 'drivers': 'driver_id', 'trips': 'trip_id'}
+OPERATORS = {'eq': '=', 'neq': '<>', 'gt': '>', 'gte': '>=', 'lt': '<', 'lte': '<='}
+
+
+class StorageError(Exception):
+    def __init__(self, message, code=None):
+        super().__init__(message)
+        self.message = message
+        self.code = code
+
+
+class Response:
+    def __init__(self, data):
+        self.data = data
+
+
+def _ident(name: str) -> str:
+    if not re.fullmatch(r'[A-Za-z_][A-Za-z0-9_]*', name or ''):
+        raise StorageError(f"Invalid identifier '{name}'", 'PGRST100')
+    return f'"{name}"'
+
+
+def _split(text: str) -> list:
+    """Split on the commas outside parentheses and double quotes"""
+    parts, depth, quoted, start = [], 0, False, 0
+    for i, ch in enumerate(text):
+        if ch == '"':
+            quoted = not quoted
+        elif not quoted and ch in '()':
+            depth += 1 if ch == '(' else -1
+        elif not quoted and ch == ',' and depth == 0:
+            parts.append(text[start:i])
+            start = i + 1
+    parts.append(text[start:])
+    return [p.strip() for p in parts if p.strip()]
+
+
+def parse_condition(text: str):
+    """One PostgREST logic-tree item (`col.op.value`, `and(...)`, `or(...)`) as a condition node"""
+    for group in ('and', 'or'):
+        if text.startswith(group + '(') and text.endswith(')'):
+            return (group, [parse_condition(p) for p in _split(text[len(group) + 1:-1])])
+    column, op, value = text.split('.', 2)
+    if op not in OPERATORS:
+        raise StorageError(f"Unsupported operator '{op}'", 'PGRST100')
+    if len(value) > 1 and value[0] == value[-1] == '"':
+        value = value[1:-1]
+    return ('cmp', column, op, value)
+
+
+def parse_select(select: str):
+    """'*, vehicles(name), id' -> (['*', 'id'], {'vehicles': ['name']})"""
+    columns, embeds = [], {}
+    for item in _split(select or '*'):
+        match = re.fullmatch(r'(\w+)\s*\((.*)\)', item)
+        if match:
+            embeds[match.group(1)] = _split(match.group(2)) or ['*']
+        else:
+            columns.append(item)
+    return columns, embeds
+
+
+class Query:
+    """Query builder with supabase-py's chaining interface; `execute()` runs it on its storage"""
+
+    def __init__(self, storage, table):
+        self.storage = storage
+        self.table = table
+        self.action = 'select'
+        self.columns = '*'
+        self.values = None
+        self.returning = True
+        self.conditions = []
+        self.ordering = []
+        self.row_limit = None
+
+    def select(self, columns='*'):
+        self.action, self.columns = 'select', columns
+        return self
+
+    def insert(self, rows, returning=None):
+        self.action = 'insert'
+        self.values = rows if isinstance(rows, list) else [rows]
+        # postgrest.ReturnMethod or its value
+        self.returning = getattr(returning, 'value', returning) != 'minimal'
+        return self
+
+    def update(self, values):
+        self.action, self.values = 'update', values
+        return self
+
+    def delete(self):
+        self.action = 'delete'
+        return self
+
+    def _compare(self, column, op, value):
+        self.conditions.append(('cmp', column, op, value))
+        return self
+
+    def eq(self, column, value):
+        return self._compare(column, 'eq', value)
+
+    def neq(self, column, value):
+        return self._compare(column, 'neq', value)
+
+    def gt(self, column, value):
+        return self._compare(column, 'gt', value)
+
+    def gte(self, column, value):
+        return self._compare(column, 'gte', value)
+
+    def lt(self, column, value):
+        return self._compare(column, 'lt', value)
+
+    def lte(self, column, value):
+        return self._compare(column, 'lte', value)
+
+    def in_(self, column, values):
+        self.conditions.append(('in', column, list(values)))
+        return self
+
+    def or_(self, filters):
+        self.conditions.append(('or', [parse_condition(p) for p in _split(filters)]))
+        return self
+
+    def order(self, column, desc=False):
+        self.ordering.append((column, desc))
+        return self
+
+    def limit(self, size):
+        self.row_limit = int(size)
+        return self
+
+    async def execute(self):
+        return Response(await self.storage.run(self))
+
+
+class RpcCall:
+    def __init__(self, storage, name, params):
+        self.storage = storage
+        self.name = name
+        self.params = params
+
+    async def execute(self):
+        return Response(await self.storage.call(self.name, self.params))
+
+
+class _Compiler:
+    """WHERE / ORDER BY / LIMIT for one statement; subclasses render parameters for their driver"""
+
+    def __init__(self, table, columns):
+        self.table = table
+        self.columns = columns
+        self.params = []
+
+    def column(self, name):
+        if name not in self.columns:
+            raise StorageError(f'column {self.table}.{name} does not exist', '42703')
+        return _ident(name)
+
+    def condition(self, node):
+        kind = node[0]
+        if kind == 'cmp':
+            _, column, op, value = node
+            return f'{self.column(column)} {OPERATORS[op]} {self.param(column, value)}'
+        if kind == 'in':
+            _, column, values = node
+            return self.in_list(column, values) if values else 'FALSE'
+        joiner = ' AND ' if kind == 'and' else ' OR '
+        return '(' + joiner.join(self.condition(n) for n in node[1]) + ')'
+
+    def where(self, conditions):
+        return ' WHERE ' + ' AND '.join(self.condition(c) for c in conditions) if conditions else ''
+
+    def tail(self, query):
+        sql = ''
+        if query.ordering:
+            sql += ' ORDER BY ' + ', '.join(f"{self.column(c)}{' DESC' if desc else ''}" for c, desc in query.ordering)
+        if query.row_limit is not None:
+            sql += f' LIMIT {query.row_limit:d}'
+        return sql
+
+
+# --- Postgres (asyncpg) ---
+
+def _pg_text(value):
+    """Text input form of a parameter; every parameter is sent as text and cast to the column or argument type"""
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (list, tuple)):
+        items = ('NULL' if v is None else '"' + str(v).replace('\\', '\\\\').replace('"', '\\"') + '"' for v in value)
+        return '{' + ','.join(items) + '}'
+    if isinstance(value, dict):
+        return json.dumps(value, default=str)
+    return str(value)
+
+
+class _PostgresCompiler(_Compiler):
+    def value(self, value):
+        self.params.append(value)
+        return f'${len(self.params)}'
+
+    def param(self, column, value):
+        return f'{self.value(_pg_text(value))}::text::{self.columns[column]}'
+
+    def in_list(self, column, values):
+        return f'{self.column(column)} = ANY({self.value([_pg_text(v) for v in values])}::text[]::{self.columns[column]}[])'
+
+
+class PostgresStorage:
+    name = 'postgres'
+
+    def __init__(self, dsn, max_size=32):
+        self.dsn = dsn
+        self.max_size = max_size
+        self.pool = None
+        self.columns = {}
+        self.functions = {}
+        self._connecting = None
+
+    def table(self, name):
+        return Query(self, name)
+
+    def rpc(self, name, params=None):
+        return RpcCall(self, name, params or {})
+
+    async def _pool(self):
+        if self.pool is None:
+            if self._connecting is None:
+                self._connecting = asyncio.ensure_future(self._connect())
+            try:
+                await asyncio.shield(self._connecting)
+            except Exception:
+                self._connecting = None
+                raise
+        return self.pool
+
+    async def _connect(self):
+        import asyncpg  # only needed for this backend
+
+        pool = await asyncpg.create_pool(self.dsn, min_size=1, max_size=self.max_size)
+        async with pool.acquire() as conn:
+            await self._load_catalog(conn)
+        self.pool = pool
+
+    async def _load_catalog(self, conn):
+        """Column types of every table and the signatures of every function in the public schema"""
+        columns = {}
+        for table, column, type_name in await conn.fetch("""
+            SELECT c.relname, a.attname, format_type(a.atttypid, a.atttypmod)
+            FROM pg_attribute a JOIN pg_class c ON c.oid = a.attrelid
+            WHERE c.relnamespace = 'public'::regnamespace AND c.relkind IN ('r', 'p', 'v')
+              AND a.attnum > 0 AND NOT a.attisdropped"""):
+            columns.setdefault(table, {})[column] = type_name
+        self.columns = columns
+        self.functions = {name: (list(args), types, returns) for name, args, types, returns in await conn.fetch("""
+            SELECT p.proname, COALESCE(p.proargnames, '{}'),
+                   ARRAY(SELECT format_type(t, NULL) FROM unnest(p.proargtypes::oid[]) t),
+                   format_type(p.prorettype, NULL)
+            FROM pg_proc p WHERE p.pronamespace = 'public'::regnamespace""")}
+
+    async def _fetchval(self, sql, params, execute=False):
+        import asyncpg
+
+        pool = await self._pool()
+        try:
+            if execute:
+                return await pool.execute(sql, *params)
+            return await pool.fetchval(sql, *params)
+        except asyncpg.PostgresError as e:
+            raise StorageError(getattr(e, 'message', None) or str(e), e.sqlstate) from e
+
+    def compile(self, query):
+        columns = self.columns.get(query.table)
+        if query.table not in TABLES or columns is None:
+            raise StorageError(f'relation "public.{query.table}" does not exist', '42P01')
+        table = _ident(query.table)
+        c = _PostgresCompiler(query.table, columns)
+        if query.action == 'select':
+            sql = f'SELECT {self._select_list(query.table, query.columns, columns)} FROM {table}'
+            sql += c.where(query.conditions) + c.tail(query)
+            return f"SELECT COALESCE(json_agg(_r), '[]')::text FROM ({sql}) _r", c.params
+        if query.action == 'insert':
+            names = ', '.join(c.column(k) for k in dict.fromkeys(k for row in query.values for k in row))
+            rows = c.value(json.dumps(query.values, default=str))
+            sql = f'INSERT INTO {table} ({names}) SELECT {names} FROM jsonb_populate_recordset(NULL::{table}, {rows}::jsonb)'
+        elif query.action == 'update':
+            names = ', '.join(c.column(k) for k in query.values)
+            row = c.value(json.dumps(query.values, default=str))
+            sql = (f'UPDATE {table} SET ({names}) = (SELECT {names} FROM jsonb_populate_record(NULL::{table}, {row}::jsonb))'
+                   + c.where(query.conditions))
+        else:
+            sql = f'DELETE FROM {table}' + c.where(query.conditions)
+        if not query.returning:
+            return sql, c.params
+        return f"WITH _r AS ({sql} RETURNING *) SELECT COALESCE(json_agg(_r), '[]')::text FROM _r", c.params
+
+    def _select_list(self, table, select, columns):
+        names, embeds = parse_select(select)
+        items = [f'{_ident(table)}.*' if n == '*' else _ident(n) for n in names if n in columns or n == '*']
+        unknown = [n for n in names if n != '*' and n not in columns]
+        if unknown:
+            raise StorageError(f'column {table}.{unknown[0]} does not exist', '42703')
+        for relation, fields in embeds.items():
+            key = RELATIONS.get(relation)
+            if key not in columns:
+                raise StorageError(f"Could not find a relationship between '{table}' and '{relation}'", 'PGRST200')
+            if fields == ['*']:
+                value = 'to_json(_e)'
+            else:
+                value = 'json_build_object(' + ', '.join(f"'{f}', _e.{_ident(f)}" for f in fields) + ')'
+            items.append(f'(SELECT {value} FROM {_ident(relation)} _e WHERE _e.id = {_ident(table)}.{_ident(key)}) '
+                         f'AS {_ident(relation)}')
+        return ', '.join(items)
+
+    async def run(self, query):
+        await self._pool()
+        if query.action in ('insert', 'update') and not query.values:
+            return []
+        sql, params = self.compile(query)
+        if not query.returning:
+            await self._fetchval(sql, params, execute=True)
+            return []
+        return json.loads(await self._fetchval(sql, params))
+
+    async def call(self, name, params):
+        await self._pool()
+        if name not in self.functions:
+            # Functions created after the pool connected (schema.sql applied later)
+            async with self.pool.acquire() as conn:
+                await self._load_catalog(conn)
+        if name not in self.functions:
+            raise StorageError(f'Could not find the function public.{name} in the schema cache', 'PGRST202')
+        arg_names, arg_types, returns = self.functions[name]
+        args, values = [], []
+        for key, value in params.items():
+            if key not in arg_names:
+                raise StorageError(f'Could not find the function public.{name}({key}) in the schema cache', 'PGRST202')
+            values.append(_pg_text(value))
+            args.append(f'{_ident(key)} => ${len(values)}::text::{arg_types[arg_names.index(key)]}')
+        call = f'{_ident(name)}({", ".join(args)})'
+        if returns == 'void':
+            await self._fetchval(f'SELECT {call}', values, execute=True)
+            return None
+        return json.loads(await self._fetchval(f'SELECT to_json({call})::text', values))
+
+    async def close(self):
+        if self.pool is not None:
+            await self.pool.close()
+
+
+# --- SQLite ---
+
+_UUID = ("(lower(hex(randomblob(4)) || '-' || hex(randomblob(2)) || '-4' || substr(hex(randomblob(2)), 2) || '-' || "
+         "substr('89ab', 1 + abs(random()) % 4, 1) || substr(hex(randomblob(2)), 2) || '-' || hex(randomblob(6))))")
+_NOW = "(strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now'))"
+
+# schema.sql's six tables in SQLite terms: uuids and timestamps as text in PostgREST's
+# output format, numeric affinity for numbers (integral values come back as ints)
+SQLITE_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS users (
+  id TEXT PRIMARY KEY DEFAULT {_UUID},
+  email TEXT UNIQUE NOT NULL,
+  password_hash TEXT NOT NULL,
+  full_name TEXT NOT NULL,
+  role TEXT NOT NULL CHECK (role IN ('manager', 'dispatcher', 'safety', 'analyst')),
+  status TEXT DEFAULT 'active',
+  created_at TEXT DEFAULT {_NOW}
+);
+CREATE TABLE IF NOT EXISTS vehicles (
+  id TEXT PRIMARY KEY DEFAULT {_UUID},
+  name TEXT NOT NULL,
+  model TEXT,
+  license_plate TEXT UNIQUE NOT NULL,
+  max_capacity NUMERIC NOT NULL CHECK (max_capacity > 0),
+  odometer NUMERIC DEFAULT 0,
+  status TEXT NOT NULL DEFAULT 'available' CHECK (status IN ('available', 'on_trip', 'in_shop', 'retired')),
+  acquisition_cost NUMERIC DEFAULT 0,
+  created_at TEXT DEFAULT {_NOW}
+);
+CREATE TABLE IF NOT EXISTS drivers (
+  id TEXT PRIMARY KEY DEFAULT {_UUID},
+  full_name TEXT NOT NULL,
+  license_number TEXT UNIQUE NOT NULL,
+  license_expiry TEXT NOT NULL,
+  safety_score NUMERIC DEFAULT 100,
+  status TEXT NOT NULL DEFAULT 'off_duty' CHECK (status IN ('on_duty', 'off_duty', 'suspended')),
+  created_at TEXT DEFAULT {_NOW}
+);
+CREATE TABLE IF NOT EXISTS trips (
+  id TEXT PRIMARY KEY DEFAULT {_UUID},
+  vehicle_id TEXT REFERENCES vehicles(id),
+  driver_id TEXT REFERENCES drivers(id),
+  origin TEXT NOT NULL,
+  destination TEXT NOT NULL,
+  cargo_weight NUMERIC NOT NULL,
+  distance NUMERIC DEFAULT 0,
+  revenue NUMERIC DEFAULT 0,
+  status TEXT NOT NULL DEFAULT 'draft' CHECK (status IN ('draft', 'dispatched', 'completed', 'cancelled')),
+  start_time TEXT,
+  end_time TEXT,
+  created_at TEXT DEFAULT {_NOW}
+);
+CREATE TABLE IF NOT EXISTS maintenance_logs (
+  id TEXT PRIMARY KEY DEFAULT {_UUID},
+  vehicle_id TEXT REFERENCES vehicles(id),
+  description TEXT NOT NULL,
+  cost NUMERIC NOT NULL,
+  service_date TEXT NOT NULL,
+  status TEXT DEFAULT 'in_progress' CHECK (status IN ('in_progress', 'completed')),
+  created_at TEXT DEFAULT {_NOW}
+);
+CREATE TABLE IF NOT EXISTS expenses (
+  id TEXT PRIMARY KEY DEFAULT {_UUID},
+  vehicle_id TEXT REFERENCES vehicles(id),
+  trip_id TEXT REFERENCES trips(id),
+  fuel_liters NUMERIC,
+  fuel_cost NUMERIC,
+  other_cost NUMERIC DEFAULT 0,
+  created_at TEXT DEFAULT {_NOW}
+);
+
+CREATE TRIGGER IF NOT EXISTS maintenance_vehicle_status AFTER INSERT ON maintenance_logs
+WHEN NEW.status IS NOT 'completed'
+BEGIN
+  UPDATE vehicles SET status = 'in_shop' WHERE id = NEW.vehicle_id;
+END;
+
+CREATE INDEX IF NOT EXISTS vehicles_created_idx ON vehicles (created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS drivers_created_idx ON drivers (created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS trips_created_idx ON trips (created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS trips_status_created_idx ON trips (status, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS trips_vehicle_created_idx ON trips (vehicle_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS trips_driver_created_idx ON trips (driver_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS maintenance_created_idx ON maintenance_logs (created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS maintenance_vehicle_created_idx ON maintenance_logs (vehicle_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS expenses_created_idx ON expenses (created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS expenses_vehicle_created_idx ON expenses (vehicle_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS expenses_trip_idx ON expenses (trip_id);
+"""
+
+
+def _sqlite_value(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=str)
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    return str(value)
+
+
+def _integrity_code(e: sqlite3.IntegrityError) -> str:
+    message = str(e)
+    for marker, code in (('UNIQUE', '23505'), ('FOREIGN KEY', '23503'), ('NOT NULL', '23502'), ('CHECK', '23514')):
+        if marker in message:
+            return code
+    return '23000'
+
+
+class _SQLiteCompiler(_Compiler):
+    def param(self, column, value):
+        self.params.append(_sqlite_value(value))
+        return '?'
+
+    def in_list(self, column, values):
+        self.params.extend(_sqlite_value(v) for v in values)
+        return f"{self.column(column)} IN ({', '.join('?' * len(values))})"
+
+
+class SQLiteStorage:
+    """SQLite backend on one connection and worker thread; each query or rpc call is its own transaction"""
+    name = 'sqlite'
+
+    def __init__(self, path=':memory:'):
+        self.path = path
+        self.conn = None
+        self.columns = {}
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fleetflow-sqlite")
+
+    def table(self, name):
+        return Query(self, name)
+
+    def rpc(self, name, params=None):
+        return RpcCall(self, name, params or {})
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA foreign_keys = ON')
+        conn.executescript(SQLITE_SCHEMA)
+        self.columns = {t: {r['name'] for r in conn.execute(f'PRAGMA table_info({t})')} for t in TABLES}
+        return conn
+
+    def _transaction(self, fn, *args):
+        if self.conn is None:
+            self.conn = self._connect()
+        try:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                result = fn(self.conn, *args)
+            except BaseException:
+                self.conn.execute('ROLLBACK')
+                raise
+            self.conn.execute('COMMIT')
+            return result
+        except sqlite3.IntegrityError as e:
+            raise StorageError(str(e), _integrity_code(e)) from e
+        except sqlite3.Error as e:
+            raise StorageError(str(e)) from e
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self._transaction, fn, *args)
+
+    async def run(self, query):
+        return await self._run(self._execute, query)
+
+    async def call(self, name, params):
+        function = SQLITE_FUNCTIONS.get(name)
+        if function is None:
+            raise StorageError(f'Could not find the function public.{name} in the schema cache', 'PGRST202')
+        return await self._run(lambda conn: function(conn, **params))
+
+    def _execute(self, conn, query):
+        if query.table not in TABLES:
+            raise StorageError(f'relation "public.{query.table}" does not exist', '42P01')
+        columns = self.columns[query.table]
+        table = _ident(query.table)
+        c = _SQLiteCompiler(query.table, columns)
+        if query.action == 'select':
+            return self._select(conn, query, c)
+        if query.action == 'insert':
+            rows = []
+            for row in query.values:
+                names = ', '.join(c.column(k) for k in row)
+                sql = f"INSERT INTO {table} ({names}) VALUES ({', '.join('?' * len(row))}) RETURNING *"
+                rows.append(dict(conn.execute(sql, [_sqlite_value(v) for v in row.values()]).fetchone()))
+            return rows if query.returning else []
+        if query.action == 'update':
+            if not query.values:
+                return []
+            assignments = ', '.join(f'{c.column(k)} = ?' for k in query.values)
+            values = [_sqlite_value(v) for v in query.values.values()]
+            sql = f'UPDATE {table} SET {assignments}{c.where(query.conditions)} RETURNING *'
+        else:
+            values = []
+            sql = f'DELETE FROM {table}{c.where(query.conditions)} RETURNING *'
+        rows = [dict(r) for r in conn.execute(sql, values + c.params)]
+        return rows if query.returning else []
+
+    def _select(self, conn, query, c):
+        names, embeds = parse_select(query.columns)
+        selected = list(dict.fromkeys(n if n == '*' else c.column(n) for n in names))
+        # Foreign keys the embeds need, fetched even when not selected and dropped again below
+        hidden = [RELATIONS.get(r) for r in embeds if '*' not in names and RELATIONS.get(r) not in names]
+        for relation in embeds:
+            if RELATIONS.get(relation) not in c.columns:
+                raise StorageError(f"Could not find a relationship between '{query.table}' and '{relation}'", 'PGRST200')
+        sql = f"SELECT {', '.join(selected + [_ident(k) for k in hidden])} FROM {_ident(query.table)}"
+        sql += c.where(query.conditions) + c.tail(query)
+        rows = [dict(r) for r in conn.execute(sql, c.params)]
+        for relation, fields in embeds.items():
+            self._embed(conn, rows, relation, RELATIONS[relation], fields)
+        for row in rows:
+            for key in hidden:
+                row.pop(key, None)
+        return rows
+
+    def _embed(self, conn, rows, relation, key, fields):
+        ids = list({r[key] for r in rows if r.get(key)})
+        fetched = '*' if fields == ['*'] else ', '.join(_ident(f) for f in dict.fromkeys(['id'] + fields))
+        related = {}
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            for r in conn.execute(f"SELECT {fetched} FROM {_ident(relation)} WHERE id IN ({', '.join('?' * len(chunk))})", chunk):
+                related[r['id']] = dict(r)
+        for row in rows:
+            found = related.get(row.get(key))
+            if found is not None and fields != ['*'] and 'id' not in fields:
+                found = {k: v for k, v in found.items() if k != 'id'}
+            row[relation] = dict(found) if found is not None else None
+
+    async def close(self):
+        self.executor.shutdown(wait=True)
+        if self.conn is not None:
+            self.conn.close()
+
+
+# --- schema.sql functions for SQLite ---
+# Same checks, messages and results as the plpgsql versions; each runs in one transaction.
+
+def _client_error(status: int, message: str) -> StorageError:
+    return StorageError(message, f'PT{status}')
+
+
+def _row(conn, table, row_id):
+    row = conn.execute(f'SELECT * FROM {table} WHERE id = ?', (row_id,)).fetchone() if row_id else None
+    return dict(row) if row else None
+
+
+def _trip_with_relations(conn, trip_id):
+    trip = _row(conn, 'trips', trip_id)
+    trip['vehicles'] = _row(conn, 'vehicles', trip['vehicle_id'])
+    trip['drivers'] = _row(conn, 'drivers', trip['driver_id'])
+    return trip
+
+
+def _move(conn, trips, status, vehicle_status=None, driver_status=None, stamp=None):
+    stamped = f', {stamp} = {_NOW}' if stamp else ''
+    for trip in trips:
+        conn.execute(f'UPDATE trips SET status = ?{stamped} WHERE id = ?', (status, trip['id']))
+        if vehicle_status:
+            conn.execute('UPDATE vehicles SET status = ? WHERE id = ?', (vehicle_status, trip['vehicle_id']))
+        if driver_status:
+            conn.execute('UPDATE drivers SET status = ? WHERE id = ?', (driver_status, trip['driver_id']))
+
+
+def _dispatch_error(conn, trip):
+    if trip['status'] != 'draft':
+        return f"Trip is '{trip['status']}', must be 'draft' to dispatch"
+    vehicle = _row(conn, 'vehicles', trip['vehicle_id'])
+    if vehicle is not None and vehicle['status'] != 'available':
+        return 'Vehicle is no longer available'
+    return None
+
+
+def _complete_error(conn, trip):
+    return 'Trip must be dispatched to complete' if trip['status'] != 'dispatched' else None
+
+
+def _locked_trip(conn, trip_id):
+    trip = _row(conn, 'trips', trip_id)
+    if trip is None:
+        raise _client_error(404, 'Trip not found')
+    return trip
+
+
+def trip_dispatch(conn, p_trip_id):
+    trip = _locked_trip(conn, p_trip_id)
+    error = _dispatch_error(conn, trip)
+    if error:
+        raise _client_error(400, error)
+    _move(conn, [trip], 'dispatched', 'on_trip', 'on_duty', stamp='start_time')
+    return {'previous': trip, 'trip': _trip_with_relations(conn, p_trip_id)}
+
+
+def trip_complete(conn, p_trip_id):
+    trip = _locked_trip(conn, p_trip_id)
+    error = _complete_error(conn, trip)
+    if error:
+        raise _client_error(400, error)
+    _move(conn, [trip], 'completed', 'available', 'off_duty', stamp='end_time')
+    return {'previous': trip, 'trip': _trip_with_relations(conn, p_trip_id)}
+
+
+def trip_cancel(conn, p_trip_id):
+    trip = _locked_trip(conn, p_trip_id)
+    if trip['status'] not in ('draft', 'dispatched'):
+        raise _client_error(400, 'Only draft or dispatched trips can be cancelled')
+    if trip['status'] == 'dispatched':
+        _move(conn, [trip], 'cancelled', 'available', 'off_duty')
+    else:
+        _move(conn, [trip], 'cancelled')
+    return {'previous': trip, 'trip': _trip_with_relations(conn, p_trip_id)}
+
+
+def _transition_batch(conn, trip_ids, validate, one_per_vehicle):
+    """Validate every trip against the state before the batch, then move the valid ones; results in request order"""
+    checked, seen, taken = [], set(), set()
+    for trip_id in trip_ids:
+        trip = _row(conn, 'trips', trip_id)
+        if trip is None:
+            error = 'Trip not found'
+        elif trip_id in seen:
+            error = 'Duplicate trip id in batch'
+        else:
+            error = validate(conn, trip)
+        seen.add(trip_id)
+        checked.append([trip_id, error, trip])
+    if one_per_vehicle:
+        # Only the first valid trip per vehicle in the batch gets the vehicle
+        for item in checked:
+            vehicle_id = item[2]['vehicle_id'] if item[1] is None else None
+            if vehicle_id in taken:
+                item[1] = 'Vehicle is already dispatched in this batch'
+            elif vehicle_id:
+                taken.add(vehicle_id)
+    return checked
+
+
+def _batch_results(conn, checked):
+    return [{'id': trip_id, 'error': None, 'previous': trip, 'trip': _trip_with_relations(conn, trip_id)}
+            if error is None else {'id': trip_id, 'error': error} for trip_id, error, trip in checked]
+
+
+def trips_dispatch(conn, p_trip_ids):
+    checked = _transition_batch(conn, p_trip_ids, _dispatch_error, one_per_vehicle=True)
+    _move(conn, [t for _, e, t in checked if e is None], 'dispatched', 'on_trip', 'on_duty', stamp='start_time')
+    return _batch_results(conn, checked)
+
+
+def trips_complete(conn, p_trip_ids):
+    checked = _transition_batch(conn, p_trip_ids, _complete_error, one_per_vehicle=False)
+    _move(conn, [t for _, e, t in checked if e is None], 'completed', 'available', 'off_duty', stamp='end_time')
+    return _batch_results(conn, checked)
+
+
+def assignment_candidates(conn, p_min_safety_score=0):
+    vehicles = conn.execute("""
+        SELECT v.id, v.name, v.max_capacity,
+               (SELECT t.destination FROM trips t WHERE t.vehicle_id = v.id AND t.status = 'completed'
+                ORDER BY t.end_time IS NULL, t.end_time DESC LIMIT 1) AS location
+        FROM vehicles v WHERE v.status = 'available'""")
+    drivers = conn.execute("""
+        SELECT id, full_name, safety_score FROM drivers
+        WHERE status <> 'suspended' AND (license_expiry IS NULL OR license_expiry >= date('now'))
+          AND COALESCE(safety_score, 0) >= ?""", (p_min_safety_score,))
+    return {'vehicles': [dict(r) for r in vehicles], 'drivers': [dict(r) for r in drivers]}
+
+
+def analytics_summary(conn):
+    def rows(table, order=''):
+        return [dict(r) for r in conn.execute(f'SELECT * FROM {table}{order}')]
+
+    # Vehicles newest first, as the plpgsql version lists them
+    return summarize(rows('vehicles', ' ORDER BY created_at DESC, id DESC'), rows('trips'), rows('drivers'),
+                     rows('expenses'), rows('maintenance_logs'))
+
+
+SQLITE_FUNCTIONS = {
+    'trip_dispatch': trip_dispatch, 'trip_complete': trip_complete, 'trip_cancel': trip_cancel,
+    'trips_dispatch': trips_dispatch, 'trips_complete': trips_complete,
+    'assignment_candidates': assignment_candidates, 'analytics_summary': analytics_summary,
+}
+
+
+def create_storage(backend, supabase_url=None, supabase_key=None, database_url=None, sqlite_path=':memory:',
+                   pool_size=32):
+    if backend == 'supabase':
+        from supabase import create_client
+
+        return create_client(supabase_url, supabase_key)
+    if backend == 'postgres':
+        return PostgresStorage(database_url, max_size=pool_size)
+    if backend == 'sqlite':
+        return SQLiteStorage(sqlite_path)
+    raise ValueError(f"Unknown STORAGE_BACKEND '{backend}': expected supabase, postgres or sqlite")
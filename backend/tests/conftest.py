@@ -0,0 +1,37 @@
+"""
+Shared fixtures for the local backend tests
+
+`postgres_dsn` gives the tests that also run against schema.sql's Postgres functions a
+database to use: TEST_DATABASE_URL, with schema.sql applied and the fleet tables emptied.
+Those tests are skipped when it is not set.
+"""
+import asyncio
+import os
+
+import pytest
+
+SCHEMA = os.path.join(os.path.dirname(__file__), '..', 'schema.sql')
+TEST_DATABASE_URL = os.environ.get('TEST_DATABASE_URL')
+
+
+async def reset_postgres(dsn):
+    import asyncpg  # only needed for the postgres backend
+
+    conn = await asyncpg.connect(dsn)
+    try:
+        if await conn.fetchval("SELECT to_regprocedure('trip_dispatch(uuid)') IS NULL"):
+            if not await conn.fetchval("SELECT EXISTS (SELECT 1 FROM pg_publication WHERE pubname = 'supabase_realtime')"):
+                await conn.execute("CREATE PUBLICATION supabase_realtime")
+            with open(SCHEMA) as f:
+                await conn.execute(f.read())
+        await conn.execute("TRUNCATE vehicles, drivers, trips CASCADE")
+    finally:
+        await conn.close()
+
+
+@pytest.fixture
+def postgres_dsn():
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL not set")
+    asyncio.run(reset_postgres(TEST_DATABASE_URL))
+    return TEST_DATABASE_URL
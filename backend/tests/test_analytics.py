@@ -0,0 +1,126 @@
+"""
+Analytics summary tests
+Checks analytics.summarize on a small hand-built fleet, and that the analytics_summary RPC the
+endpoint falls back to returns the same payload on SQLite and, when TEST_DATABASE_URL is set, Postgres
+"""
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from analytics import summarize  # noqa: E402
+from storage import PostgresStorage, SQLiteStorage  # noqa: E402
+
+V1, V2, V3 = ('00000000-0000-4000-8000-00000000000%d' % i for i in (1, 2, 3))
+D1, D2 = ('00000000-0000-4000-8000-00000000010%d' % i for i in (1, 2))
+
+
+def fleet():
+    vehicles = [
+        {"id": V1, "name": "Truck 1", "license_plate": "T-1", "max_capacity": 1000, "status": "on_trip",
+         "acquisition_cost": 10000, "created_at": "2026-01-03T00:00:00+00:00"},
+        {"id": V2, "name": "Truck 2", "license_plate": "T-2", "max_capacity": 1000, "status": "available",
+         "acquisition_cost": 0, "created_at": "2026-01-02T00:00:00+00:00"},
+        {"id": V3, "name": "Truck 3", "license_plate": "T-3", "max_capacity": 1000, "status": "in_shop",
+         "acquisition_cost": 5000, "created_at": "2026-01-01T00:00:00+00:00"},
+    ]
+    drivers = [
+        {"id": D1, "full_name": "Dana", "license_number": "L-1", "license_expiry": "2099-01-01",
+         "status": "on_duty"},
+        {"id": D2, "full_name": "Lee", "license_number": "L-2", "license_expiry": "2099-01-01",
+         "status": "off_duty"},
+    ]
+    trip = {"driver_id": D1, "origin": "A", "destination": "B", "cargo_weight": 100}
+    trips = [
+        dict(trip, vehicle_id=V1, status="completed", revenue=1000, distance=300, end_time="2026-02-01T10:00:00+00:00"),
+        dict(trip, vehicle_id=V1, status="completed", revenue=500, distance=100, end_time="2026-02-02T10:00:00+00:00"),
+        dict(trip, vehicle_id=V2, status="completed", revenue=200, distance=100, end_time="2026-02-01T12:00:00+00:00"),
+        dict(trip, vehicle_id=V1, status="dispatched", revenue=900, distance=50),
+        dict(trip, vehicle_id=V3, status="cancelled", revenue=700, distance=70),
+    ]
+    expenses = [
+        {"vehicle_id": V1, "fuel_liters": 40, "fuel_cost": 80, "other_cost": 20, "created_at": "2026-02-01T09:00:00+00:00"},
+        {"vehicle_id": V3, "fuel_liters": 10, "fuel_cost": 30, "other_cost": 0, "created_at": "2026-02-03T09:00:00+00:00"},
+    ]
+    maintenance = [
+        {"vehicle_id": V3, "description": "Brakes", "cost": 400, "service_date": "2026-02-03", "status": "in_progress"},
+        {"vehicle_id": V1, "description": "Oil", "cost": 100, "service_date": "2026-01-20", "status": "completed"},
+    ]
+    return vehicles, trips, drivers, expenses, maintenance
+
+
+class TestSummarize:
+    """analytics.summarize"""
+
+    def test_kpis(self):
+        kpis = summarize(*fleet())['kpis']
+        assert kpis == {
+            "total_vehicles": 3, "available_vehicles": 1, "on_trip_vehicles": 1, "in_shop_vehicles": 1,
+            "active_trips": 1, "completed_trips": 3, "total_revenue": 1700.0, "total_fuel_cost": 110.0,
+            "total_maintenance_cost": 500.0, "total_expenses": 630.0, "utilization": 33.3,
+            "fuel_efficiency": 10.0, "on_duty_drivers": 1, "total_drivers": 2,
+        }
+        print("✓ KPIs count statuses and sum completed trips, expenses and maintenance")
+
+    def test_grouping_by_day_and_vehicle(self):
+        summary = summarize(*fleet())
+        assert summary['revenue_by_day'] == {"2026-02-01": 1200.0, "2026-02-02": 500.0}
+        assert summary['expense_by_day'] == {"2026-02-01": 100.0, "2026-02-03": 30.0}
+        assert summary['vehicle_roi'] == [
+            {"id": V1, "name": "Truck 1", "revenue": 1500.0, "cost": 200.0, "roi": 13.0},
+            {"id": V2, "name": "Truck 2", "revenue": 200.0, "cost": 0, "roi": 20000.0},
+            {"id": V3, "name": "Truck 3", "revenue": 0, "cost": 430.0, "roi": -8.6},
+        ]
+        assert summary['cost_breakdown'] == {"fuel": 110.0, "maintenance": 500.0, "other": 20.0}
+        print("✓ Revenue, expenses and ROI are grouped per day and per vehicle")
+
+    def test_empty_fleet(self):
+        summary = summarize([], [], [], [], [])
+        assert summary['kpis']['utilization'] == 0
+        assert summary['kpis']['fuel_efficiency'] == 0
+        assert summary['vehicle_roi'] == []
+        print("✓ An empty fleet summarizes to zeros")
+
+
+def approx_summary(summary):
+    """The summary with every number wrapped in pytest.approx (Postgres sums numerics exactly)"""
+    if isinstance(summary, dict):
+        return {k: approx_summary(v) for k, v in summary.items()}
+    if isinstance(summary, list):
+        return [approx_summary(v) for v in summary]
+    return pytest.approx(summary) if isinstance(summary, (int, float)) else summary
+
+
+@pytest.fixture(params=['sqlite', 'postgres'])
+def summary_store(request):
+    if request.param == 'sqlite':
+        return SQLiteStorage()
+    return PostgresStorage(request.getfixturevalue('postgres_dsn'), max_size=1)
+
+
+class TestAnalyticsSummaryFunction:
+    """The analytics_summary RPC against analytics.summarize"""
+
+    def test_matches_summarize(self, summary_store):
+        store = summary_store
+
+        async def run():
+            try:
+                vehicles, trips, drivers, expenses, maintenance = fleet()
+                for table, rows in (('vehicles', vehicles), ('drivers', drivers), ('trips', trips),
+                                    ('expenses', expenses), ('maintenance_logs', maintenance)):
+                    await store.table(table).insert(rows).execute()
+                rows = [(await store.table(table).select('*').execute()).data
+                        for table in ('vehicles', 'trips', 'drivers', 'expenses', 'maintenance_logs')]
+                return (await store.rpc('analytics_summary').execute()).data, rows
+            finally:
+                await store.close()
+
+        result, rows = asyncio.run(run())
+        # analytics_summary lists vehicles newest first
+        rows[0].sort(key=lambda v: v['created_at'], reverse=True)
+        assert result == approx_summary(summarize(*rows))
+        print("✓ analytics_summary() returns the same payload as summarize()")
@@ -0,0 +1,71 @@
+"""
+Database call tests
+Checks that server.db() keeps blocking (supabase-style) queries off the event loop
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.environ.setdefault("STORAGE_BACKEND", "sqlite")
+os.environ.setdefault("JWT_SECRET", "fleetflow-test-secret-0123456789")
+
+import server  # noqa: E402
+
+
+class BlockingQuery:
+    """A query whose execute() blocks like the synchronous supabase client does"""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.thread = None
+
+    def execute(self):
+        self.thread = threading.current_thread()
+        time.sleep(self.latency)
+        return self
+
+
+class AsyncQuery:
+    def __init__(self):
+        self.thread = None
+
+    async def execute(self):
+        self.thread = threading.current_thread()
+        return self
+
+
+class TestDb:
+    """server.db"""
+
+    def test_blocking_queries_run_concurrently(self):
+        queries = [BlockingQuery(0.2) for _ in range(4)]
+        ticks = []
+
+        async def ticker():
+            while len(ticks) < 10:
+                ticks.append(time.perf_counter())
+                await asyncio.sleep(0.01)
+
+        async def run():
+            start = time.perf_counter()
+            tick = asyncio.create_task(ticker())
+            await asyncio.gather(*(server.db(q) for q in queries))
+            elapsed = time.perf_counter() - start
+            await tick
+            return elapsed
+
+        elapsed = asyncio.run(run())
+        assert elapsed < 0.6
+        assert all(q.thread is not threading.main_thread() for q in queries)
+        # The loop kept ticking while the queries blocked their worker threads
+        assert ticks[9] - ticks[0] < 0.2
+        print(f"✓ 4 blocking queries of 200ms took {elapsed * 1000:.0f}ms without stalling the loop")
+
+    def test_async_queries_stay_on_the_loop(self):
+        query = AsyncQuery()
+        assert asyncio.run(server.db(query)) is query
+        assert query.thread is threading.main_thread()
+        print("✓ Natively async queries are awaited on the event loop")
@@ -2,9 +2,12 @@
 FleetFlow API Test Suite
 Tests authentication, CRUD operations, business logic workflows, and export functionality
 """
+import base64
+import json
 import pytest
 import requests
 import os
+import time
 
 BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', 'https://vehicle-ops-dev.preview.emergentagent.com')
 
@@ -80,6 +83,18 @@ class TestAuthentication:
         data = response.json()
         assert data["user"]["email"] == DEMO_MANAGER["email"]
         print("✓ Get current user successful")
+
+    def test_token_cache_stats(self):
+        login_res = requests.post(f"{BASE_URL}/api/auth/login", json=DEMO_MANAGER)
+        headers = {"Authorization": f"Bearer {login_res.json()['token']}"}
+        for _ in range(3):
+            requests.get(f"{BASE_URL}/api/auth/me", headers=headers)
+        response = requests.get(f"{BASE_URL}/api/auth/token-cache", headers=headers)
+        assert response.status_code == 200
+        stats = response.json()
+        assert stats["hits"] >= 2
+        assert stats["size"] <= stats["max_size"]
+        print(f"✓ Token cache hit rate: {stats['hit_rate']}")
         
     def test_forgot_password_mock(self):
         """Test forgot password mock endpoint"""
@@ -122,6 +137,51 @@ class TestVehicles:
             assert "status" in vehicle
             print(f"✓ Vehicle data structure valid: {vehicle['name']}")
 
+    def test_vehicle_list_reflects_update(self, auth_headers):
+        vehicles = requests.get(f"{BASE_URL}/api/vehicles", headers=auth_headers).json()["data"]
+        if not vehicles:
+            pytest.skip("No vehicles available")
+        vehicle = vehicles[0]
+        odometer = (vehicle.get("odometer") or 0) + 1
+        response = requests.put(f"{BASE_URL}/api/vehicles/{vehicle['id']}", headers=auth_headers, json={"odometer": odometer})
+        assert response.status_code == 200
+        # The list is served from the reference cache; the update must have invalidated it
+        vehicles = requests.get(f"{BASE_URL}/api/vehicles", headers=auth_headers).json()["data"]
+        assert next(v for v in vehicles if v["id"] == vehicle["id"])["odometer"] == odometer
+        stats = requests.get(f"{BASE_URL}/api/cache/stats", headers=auth_headers).json()
+        assert "hit_rate" in stats
+        print(f"✓ Vehicle list reflects the update (cache hit rate {stats['hit_rate']})")
+
+    def test_vehicle_list_conditional_get(self, auth_headers):
+        response = requests.get(f"{BASE_URL}/api/vehicles", headers=auth_headers)
+        etag = response.headers.get("ETag")
+        assert etag
+        response = requests.get(f"{BASE_URL}/api/vehicles", headers={**auth_headers, "If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.content == b""
+        print(f"✓ Unchanged vehicle list revalidates with 304 ({etag})")
+
+    def test_vehicle_list_etag_tracks_writes(self, auth_headers):
+        vehicles = requests.get(f"{BASE_URL}/api/vehicles", headers=auth_headers)
+        etag = vehicles.headers.get("ETag")
+        if not etag or not vehicles.json()["data"]:
+            pytest.skip("No vehicle list ETag")
+        vehicle = vehicles.json()["data"][0]
+        # Served from the reference cache under the same tag
+        assert requests.get(f"{BASE_URL}/api/vehicles", headers=auth_headers).headers["ETag"] == etag
+        requests.put(f"{BASE_URL}/api/vehicles/{vehicle['id']}", headers=auth_headers,
+                     json={"odometer": (vehicle.get("odometer") or 0) + 1})
+        response = requests.get(f"{BASE_URL}/api/vehicles", headers={**auth_headers, "If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.headers["ETag"] != etag
+        print("✓ A cached vehicle list gets a new tag after a write")
+
+    def test_if_none_match_star(self, auth_headers):
+        response = requests.get(f"{BASE_URL}/api/analytics/summary", headers={**auth_headers, "If-None-Match": "*"})
+        assert response.status_code == 304
+        assert response.headers["ETag"]
+        print("✓ If-None-Match: * revalidates any current representation")
+
 
 class TestDrivers:
     """Driver CRUD tests"""
@@ -179,6 +239,76 @@ class TestTrips:
             assert "drivers" in trip or trip.get("driver_id")
             print(f"✓ Trip includes relations: {trip.get('origin')} → {trip.get('destination')}")
 
+    def test_trips_keyset_pagination(self, auth_headers):
+        first = requests.get(f"{BASE_URL}/api/trips", params={"limit": 1}, headers=auth_headers).json()
+        assert len(first["data"]) <= 1
+        if not first["next_cursor"]:
+            pytest.skip("Not enough trips to paginate")
+        second = requests.get(f"{BASE_URL}/api/trips", params={"limit": 1, "cursor": first["next_cursor"]},
+                              headers=auth_headers).json()
+        assert second["data"][0]["id"] != first["data"][0]["id"]
+        assert second["data"][0]["created_at"] <= first["data"][0]["created_at"]
+        print("✓ Trips keyset pagination returns the next page")
+
+    def test_tampered_cursor_rejected(self, auth_headers):
+        row_id = "00000000-0000-0000-0000-000000000000"
+        for keyset in (["notadate", "x"], ["2026-01-01T00:00:00+00:00", f'{row_id}"),id.gt.("'],
+                       ['2026-01-01T00:00:00+00:00"),id.gt.("', row_id], ["2026-01-01", row_id]):
+            cursor = base64.urlsafe_b64encode(json.dumps(keyset).encode()).decode()
+            response = requests.get(f"{BASE_URL}/api/trips", params={"limit": 1, "cursor": cursor}, headers=auth_headers)
+            assert response.status_code == 400
+            assert response.json()["detail"] == "Invalid cursor"
+        print("✓ Cursors with a non-timestamp, non-uuid or injected filter term are rejected")
+
+    def test_trips_filter_and_projection(self, auth_headers):
+        response = requests.get(f"{BASE_URL}/api/trips", params={"status": "completed", "fields": "id,status,revenue"},
+                                headers=auth_headers)
+        assert response.status_code == 200
+        for trip in response.json()["data"]:
+            assert trip["status"] == "completed"
+            assert "vehicles" not in trip
+        print("✓ Trips status filter and field projection working")
+
+    def test_bulk_dispatch_reports_per_item_errors(self, auth_headers):
+        completed = requests.get(f"{BASE_URL}/api/trips", params={"status": "completed", "limit": 1},
+                                 headers=auth_headers).json()["data"]
+        trip_ids = [t["id"] for t in completed] + ["00000000-0000-0000-0000-000000000000", "not-a-uuid"]
+        response = requests.post(f"{BASE_URL}/api/trips/bulk/dispatch", json={"trip_ids": trip_ids}, headers=auth_headers)
+        assert response.status_code == 200
+        data = response.json()
+        assert [item["id"] for item in data["data"]] == trip_ids
+        assert data["succeeded"] == 0 and data["failed"] == len(trip_ids)
+        assert all(not item["ok"] and item["error"] for item in data["data"])
+        print("✓ Bulk dispatch returns per-item errors")
+
+    def test_validate_trip_plan(self, auth_headers):
+        vehicles = requests.get(f"{BASE_URL}/api/vehicles", params={"status": "available", "limit": 1},
+                                headers=auth_headers).json()["data"]
+        if not vehicles:
+            pytest.skip("No available vehicle")
+        candidate = {"vehicle_id": vehicles[0]["id"], "driver_id": "00000000-0000-0000-0000-000000000000",
+                     "origin": "A", "destination": "B", "cargo_weight": float(vehicles[0]["max_capacity"]) + 1}
+        response = requests.post(f"{BASE_URL}/api/trips/validate", json={"trips": [candidate]}, headers=auth_headers)
+        assert response.status_code == 200
+        result = response.json()["data"][0]
+        assert not result["feasible"]
+        assert "Driver not found" in result["errors"]
+        assert any(e.startswith("Cargo weight") for e in result["errors"])
+        print("✓ Trip plan validation reports every failed rule")
+
+    def test_assign_trip_requests(self, auth_headers):
+        requests_ = [{"origin": "Chicago, IL", "destination": "Detroit, MI", "cargo_weight": 100},
+                     {"origin": "Chicago, IL", "destination": "Detroit, MI", "cargo_weight": 1e12}]
+        response = requests.post(f"{BASE_URL}/api/trips/assign", json={"trips": requests_}, headers=auth_headers)
+        assert response.status_code == 200
+        data = response.json()
+        assert len(data["data"]) == 2
+        assert not data["data"][1]["ok"] and data["data"][1]["error"]
+        if data["data"][0]["ok"]:
+            assert data["data"][0]["vehicle_id"] and data["data"][0]["driver_id"]
+            assert "trip" not in data["data"][0]
+        print(f"✓ Assignment engine assigned {data['assigned']} of {len(requests_)} requests")
+
 
 class TestMaintenance:
     """Maintenance log tests"""
@@ -215,6 +345,16 @@ class TestExpenses:
         assert isinstance(data["data"], list)
         print(f"✓ Get expenses returned {len(data['data'])} expense records")
 
+    def test_bulk_import_reports_row_errors(self, auth_headers):
+        body = "vehicle_id,fuel_cost\n,12.5\nnot-a-uuid,abc\n"
+        response = requests.post(f"{BASE_URL}/api/import/expenses", params={"format": "csv"}, data=body,
+                                 headers=auth_headers)
+        assert response.status_code == 200
+        data = response.json()
+        assert data["received"] == 2 and data["inserted"] == 0 and data["failed"] == 2
+        assert [e["line"] for e in data["errors"]] == [2, 3]
+        print("✓ Bulk import reports per-row validation errors")
+
 
 class TestAnalytics:
     """Analytics endpoint tests"""
@@ -245,6 +385,56 @@ class TestAnalytics:
         
         print(f"✓ Analytics summary: {kpis['total_vehicles']} vehicles, ${kpis['total_revenue']} revenue")
 
+    def test_summary_reflects_new_expense(self, auth_headers):
+        vehicles = requests.get(f"{BASE_URL}/api/vehicles", headers=auth_headers).json()["data"]
+        if not vehicles:
+            pytest.skip("No vehicles available")
+        before = requests.get(f"{BASE_URL}/api/analytics/summary", headers=auth_headers).json()["kpis"]
+        response = requests.post(f"{BASE_URL}/api/expenses", headers=auth_headers,
+                                 json={"vehicle_id": vehicles[0]["id"], "fuel_liters": 5, "fuel_cost": 10, "other_cost": 0})
+        assert response.status_code == 200
+        after = requests.get(f"{BASE_URL}/api/analytics/summary", headers=auth_headers).json()["kpis"]
+        assert after["total_fuel_cost"] == pytest.approx(before["total_fuel_cost"] + 10)
+        print("✓ Analytics summary reflects new expense immediately")
+
+    def test_changes_feed_returns_new_expense(self, auth_headers):
+        vehicles = requests.get(f"{BASE_URL}/api/vehicles", headers=auth_headers).json()["data"]
+        if not vehicles:
+            pytest.skip("No vehicles available")
+        cursor = requests.get(f"{BASE_URL}/api/changes", headers=auth_headers).json()["cursor"]
+        expense = requests.post(f"{BASE_URL}/api/expenses", headers=auth_headers,
+                                json={"vehicle_id": vehicles[0]["id"], "fuel_liters": 1, "fuel_cost": 2}).json()["data"]
+        upserted = []
+        for _ in range(10):
+            data = requests.get(f"{BASE_URL}/api/changes", params={"since": cursor}, headers=auth_headers).json()
+            upserted += data["changes"].get("expenses", {}).get("upserted", [])
+            cursor = data["cursor"]
+            if any(e["id"] == expense["id"] for e in upserted):
+                break
+            time.sleep(0.5)
+        assert any(e["id"] == expense["id"] and "vehicles" in e for e in upserted)
+        print("✓ Changes feed returns the new expense in list shape")
+
+    def test_event_stream(self, auth_headers):
+        assert requests.get(f"{BASE_URL}/api/events", timeout=10).status_code == 401
+        response = requests.post(f"{BASE_URL}/api/events/token", headers=auth_headers)
+        assert response.status_code == 200
+        token = response.json()["token"]
+        with requests.get(f"{BASE_URL}/api/events", params={"token": token}, stream=True, timeout=10) as response:
+            assert response.status_code == 200
+            assert response.headers["content-type"].startswith("text/event-stream")
+            assert next(response.iter_lines(decode_unicode=True)).startswith("retry:")
+        print("✓ Event stream opens with a query-string stream token")
+
+    def test_event_stream_token_is_single_purpose(self, auth_headers):
+        session_token = auth_headers["Authorization"][7:]
+        response = requests.get(f"{BASE_URL}/api/events", params={"token": session_token}, timeout=10)
+        assert response.status_code == 401
+        stream_token = requests.post(f"{BASE_URL}/api/events/token", headers=auth_headers).json()["token"]
+        response = requests.get(f"{BASE_URL}/api/vehicles", headers={"Authorization": f"Bearer {stream_token}"})
+        assert response.status_code == 401
+        print("✓ Session tokens are refused on the query string and stream tokens everywhere else")
+
 
 class TestExport:
     """Export functionality tests"""
@@ -267,6 +457,27 @@ class TestExport:
         assert "Driver" in content
         print("✓ CSV export working with proper headers")
 
+    def test_csv_export_gzip_with_filter(self, auth_headers):
+        import gzip
+        response = requests.get(f"{BASE_URL}/api/export/csv", params={"gzip": "true", "status": "completed"},
+                                headers=auth_headers)
+        assert response.status_code == 200
+        assert "application/gzip" in response.headers.get("content-type", "")
+        lines = gzip.decompress(response.content).decode().splitlines()
+        assert lines[0].startswith("Trip ID")
+        assert all(",completed," in line for line in lines[1:])
+        print(f"✓ Gzipped CSV export returned {len(lines) - 1} completed trips")
+
+    def test_parquet_export(self, auth_headers):
+        pq = pytest.importorskip("pyarrow.parquet")
+        import io
+        response = requests.get(f"{BASE_URL}/api/export/columnar/trips", params={"format": "parquet"}, headers=auth_headers)
+        assert response.status_code == 200
+        table = pq.read_table(io.BytesIO(response.content))
+        assert str(table.schema.field("revenue").type) == "double"
+        assert str(table.schema.field("created_at").type).startswith("timestamp")
+        print(f"✓ Parquet export returned {table.num_rows} typed trip rows")
+
 
 class TestRoleBasedAccess:
     """Role-based access control tests"""
@@ -300,6 +511,105 @@ class TestRoleBasedAccess:
         assert response.status_code == 200
         print("✓ Dispatcher can read vehicles (200 OK)")
 
+    def test_synthetic_seed_requires_manager(self):
+        # Disabled (403) unless ALLOW_SYNTHETIC_SEED is set, and then manager-only
+        response = requests.post(f"{BASE_URL}/api/seed", params={"vehicles": 10})
+        assert response.status_code in (401, 403)
+        login_res = requests.post(f"{BASE_URL}/api/auth/login", json=DEMO_ANALYST)
+        headers = {"Authorization": f"Bearer {login_res.json()['token']}"}
+        response = requests.post(f"{BASE_URL}/api/seed", params={"vehicles": 10}, headers=headers)
+        assert response.status_code == 403
+        print("✓ Anonymous and non-manager synthetic seeding is rejected")
+
+    def test_synthetic_seed_keeps_existing_data_check(self):
+        login_res = requests.post(f"{BASE_URL}/api/auth/login", json=DEMO_MANAGER)
+        headers = {"Authorization": f"Bearer {login_res.json()['token']}"}
+        response = requests.post(f"{BASE_URL}/api/seed", params={"vehicles": 10}, headers=headers)
+        # 403 when synthetic seeding is disabled, 409 because the demo data already exists
+        assert response.status_code in (403, 409)
+        print("✓ Synthetic seeding never adds to existing data without force")
+
+
+class TestMetrics:
+    """Request timing and metrics tests"""
+
+    @pytest.fixture
+    def auth_headers(self):
+        login_res = requests.post(f"{BASE_URL}/api/auth/login", json=DEMO_MANAGER)
+        token = login_res.json()["token"]
+        return {"Authorization": f"Bearer {token}"}
+
+    def test_server_timing_header(self, auth_headers):
+        response = requests.get(f"{BASE_URL}/api/vehicles", headers=auth_headers)
+        assert response.status_code == 200
+        timing = response.headers["Server-Timing"]
+        assert "total;dur=" in timing
+        assert "db;desc=" in timing
+        print(f"✓ Server-Timing: {timing}")
+
+    def test_streamed_response_timing_omits_db(self, auth_headers):
+        with requests.get(f"{BASE_URL}/api/export/csv", headers=auth_headers, stream=True) as response:
+            assert response.status_code == 200
+            timing = response.headers["Server-Timing"]
+        assert "total;dur=" in timing
+        assert "db;" not in timing
+        print("✓ Streamed responses leave the DB entry out of Server-Timing")
+
+    def test_metrics_per_route(self, auth_headers):
+        requests.get(f"{BASE_URL}/api/vehicles", headers=auth_headers)
+        response = requests.get(f"{BASE_URL}/api/metrics", headers=auth_headers)
+        assert response.status_code == 200
+        assert 'fleetflow_http_request_duration_seconds_bucket{method="GET",route="/api/vehicles",le="+Inf"}' in response.text
+        assert 'fleetflow_http_request_db_calls_count{method="GET",route="/api/vehicles"}' in response.text
+        print("✓ Metrics expose per-route histograms")
+
+    def test_metrics_require_manager(self):
+        login_res = requests.post(f"{BASE_URL}/api/auth/login", json=DEMO_ANALYST)
+        headers = {"Authorization": f"Bearer {login_res.json()['token']}"}
+        assert requests.get(f"{BASE_URL}/api/metrics", headers=headers).status_code == 403
+        assert requests.get(f"{BASE_URL}/api/metrics").status_code == 401
+        print("✓ Metrics are manager-only without the scrape token")
+
+
+class TestProfiler:
+    """Sampling profiler tests"""
+
+    @pytest.fixture
+    def auth_headers(self):
+        login_res = requests.post(f"{BASE_URL}/api/auth/login", json=DEMO_MANAGER)
+        token = login_res.json()["token"]
+        return {"Authorization": f"Bearer {token}"}
+
+    def test_sample_returns_collapsed_stacks(self, auth_headers):
+        response = requests.post(f"{BASE_URL}/api/profiler/sample", params={"seconds": 1, "idle": True},
+                                 headers=auth_headers)
+        assert response.status_code == 200
+        line = response.text.splitlines()[0]
+        stack, count = line.rsplit(" ", 1)
+        assert ";" in stack and int(count) > 0
+        print("✓ Timed sample returns collapsed stacks")
+
+    def test_trigger_captures_matching_request(self, auth_headers):
+        response = requests.post(f"{BASE_URL}/api/profiler/trigger", headers=auth_headers,
+                                 json={"route": "/api/analytics/summary", "max_profiles": 1, "idle": True})
+        assert response.status_code == 200
+        requests.get(f"{BASE_URL}/api/analytics/summary", headers=auth_headers)
+        status = requests.get(f"{BASE_URL}/api/profiler", headers=auth_headers).json()
+        assert status["armed"] is False
+        profile = status["profiles"][0]
+        assert profile["name"].startswith("GET /api/analytics/summary")
+        response = requests.get(f"{BASE_URL}/api/profiler/profiles/{profile['id']}",
+                                params={"format": "speedscope"}, headers=auth_headers)
+        assert response.status_code == 200
+        assert response.json()["$schema"] == "https://www.speedscope.app/file-format-schema.json"
+        print("✓ Route trigger captures a speedscope profile and disarms after max_profiles")
+
+    def test_profiler_requires_manager(self):
+        login_res = requests.post(f"{BASE_URL}/api/auth/login", json=DEMO_DISPATCHER)
+        headers = {"Authorization": f"Bearer {login_res.json()['token']}"}
+        assert requests.post(f"{BASE_URL}/api/profiler/sample", params={"seconds": 1}, headers=headers).status_code == 403
+        print("✓ Profiler is manager-only")
+
 
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
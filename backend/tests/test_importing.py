@@ -0,0 +1,56 @@
+"""
+Bulk import tests
+Runs import_records against an in-memory insert that rejects some rows
+"""
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from pydantic import BaseModel  # noqa: E402
+
+from importing import import_records  # noqa: E402
+
+
+class Row(BaseModel):
+    value: int
+
+
+class DataError(Exception):
+    code = '23514'
+
+
+async def records(values):
+    for line, value in enumerate(values, start=1):
+        yield line, {"value": value}, None
+
+
+def run_import(values, max_errors, batch_size=2):
+    async def insert(rows):
+        # Earlier batches are slower, so later batches fail first
+        await asyncio.sleep(0.01 / abs(rows[0]['value']))
+        if any(r['value'] < 0 for r in rows):
+            raise DataError("negative value")
+
+    return asyncio.run(import_records(records(values), Row, lambda r: r.model_dump(), insert,
+                                      batch_size=batch_size, parallel=4, max_errors=max_errors))
+
+
+class TestImportRecords:
+    """import_records error reporting"""
+
+    def test_keeps_first_errors_by_line(self):
+        result = run_import([-1, -2, 3, 4, 5, -6, 7, -8], max_errors=2)
+        assert result['failed'] == 4
+        assert result['inserted'] == 4
+        assert [e['line'] for e in result['errors']] == [1, 2]
+        assert result['errors_truncated'] is True
+        print("✓ The first max_errors failing lines are reported, whatever order batches finish in")
+
+    def test_validation_and_insert_errors_interleave(self):
+        values = [1, "x", -3, 4]
+        result = run_import(values, max_errors=10)
+        assert [e['line'] for e in result['errors']] == [2, 3]
+        assert result['errors_truncated'] is False
+        print("✓ Validation and insert errors are reported in line order")
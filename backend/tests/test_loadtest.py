@@ -0,0 +1,51 @@
+"""
+Load test harness tests
+Checks benchmarks/loadtest.py's mix parsing, per-endpoint stats and baseline comparison
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+os.environ.setdefault("STORAGE_BACKEND", "sqlite")
+
+from loadtest import Recorder, compare, parse_mix  # noqa: E402
+
+
+def run_result(endpoints, **config):
+    return {"name": "run", "revision": "abc123", "started_at": "2026-01-01T00:00:00+00:00",
+            "config": dict({"backend": "sqlite", "trips": 1000}, **config), "endpoints": endpoints}
+
+
+class TestLoadTest:
+    """loadtest helpers"""
+
+    def test_parse_mix(self):
+        assert parse_mix("dashboard=8, dispatch=2,login") == {"dashboard": 8, "dispatch": 2, "login": 1}
+        with pytest.raises(SystemExit):
+            parse_mix("dashboard=1,browse=2")
+        print("✓ Traffic mixes parse into users per scenario")
+
+    def test_recorder_stats(self):
+        rec = Recorder()
+        rec.samples = {"GET /api/vehicles": [(i / 1000, 500 if i == 100 else 200, 1000) for i in range(1, 101)]}
+        stats = rec.stats(elapsed=10)["GET /api/vehicles"]
+        assert stats == {"requests": 100, "errors": 1, "rps": 10.0, "p50_ms": 51.0, "p95_ms": 95.0,
+                         "p99_ms": 99.0, "mean_wire_bytes": 1000}
+        print("✓ Per-endpoint stats report throughput, errors and latency percentiles")
+
+    def test_compare_flags_regressions(self, capsys):
+        baseline = run_result({"GET /a": {"p95_ms": 100, "rps": 50}, "GET /b": {"p95_ms": 100, "rps": 50},
+                               "GET /c": {"p95_ms": 100, "rps": 50}})
+        current = run_result({"GET /a": {"p95_ms": 105, "rps": 48}, "GET /b": {"p95_ms": 130, "rps": 50},
+                              "GET /c": {"p95_ms": 100, "rps": 30}, "GET /d": {"p95_ms": 10, "rps": 5}})
+        assert compare(current, baseline, threshold=0.1) == ["GET /b", "GET /c"]
+        assert "not like for like" not in capsys.readouterr().out
+        print("✓ Comparison flags endpoints whose p95 or throughput regressed past the threshold")
+
+    def test_compare_warns_on_config_change(self, capsys):
+        baseline = run_result({"GET /a": {"p95_ms": 100, "rps": 50}})
+        assert compare(run_result(baseline["endpoints"], trips=5000), baseline, threshold=0.1) == []
+        assert "differ in trips" in capsys.readouterr().out
+        print("✓ Comparison warns when the runs were configured differently")
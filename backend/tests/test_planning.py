@@ -0,0 +1,129 @@
+"""
+Trip planning tests
+Checks check_trips against the per-trip create_trip checks it replaced, and the assignment solvers
+against scipy's linear_sum_assignment
+"""
+import os
+import random
+import sys
+from datetime import date, datetime
+
+import numpy as np
+import pytest
+from scipy.optimize import linear_sum_assignment
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from planning import _assign_drivers, assign_trips, check_trips, driver_costs  # noqa: E402
+
+TODAY = date(2026, 6, 1)
+
+
+def former_create_trip_error(trip, vehicles, drivers, today):
+    """The create_trip checks as they were before check_trips: the first failing rule, or None"""
+    v = next((v for v in vehicles if v['id'] == trip['vehicle_id']), None)
+    if v is None:
+        return 404, "Vehicle not found"
+    if v['status'] != 'available':
+        return 400, f"Vehicle is '{v['status']}', must be 'available'"
+    d = next((d for d in drivers if d['id'] == trip['driver_id']), None)
+    if d is None:
+        return 404, "Driver not found"
+    if d['status'] == 'suspended':
+        return 400, "Driver is suspended"
+    if d['license_expiry']:
+        if datetime.strptime(d['license_expiry'], '%Y-%m-%d').date() < today:
+            return 400, "Driver's license has expired"
+    if trip['cargo_weight'] > v['max_capacity']:
+        return 400, f"Cargo weight ({trip['cargo_weight']}kg) exceeds vehicle capacity ({v['max_capacity']}kg)"
+    return None
+
+
+def random_fleet(rng):
+    vehicles = [{"id": f"v{i}", "status": rng.choice(['available', 'available', 'on_trip', 'in_shop', 'retired']),
+                 "max_capacity": rng.choice([500, 1000, 2500.5])} for i in range(6)]
+    drivers = [{"id": f"d{i}", "status": rng.choice(['on_duty', 'off_duty', 'suspended']),
+                "license_expiry": rng.choice([None, '2026-05-31', '2026-06-01', '2027-01-01'])} for i in range(6)]
+    trips = [{"vehicle_id": f"v{rng.randrange(8)}", "driver_id": f"d{rng.randrange(8)}",
+              "cargo_weight": float(rng.choice([100, 500, 1000, 2000, 3000]))} for _ in range(200)]
+    return trips, vehicles, drivers
+
+
+class TestCheckTrips:
+    """planning.check_trips"""
+
+    def test_first_error_matches_create_trip(self):
+        rng = random.Random(14)
+        for _ in range(5):
+            trips, vehicles, drivers = random_fleet(rng)
+            errors = check_trips(trips, vehicles, drivers, today=TODAY)
+            for trip, found in zip(trips, errors):
+                assert (found[0] if found else None) == former_create_trip_error(trip, vehicles, drivers, TODAY)
+        print("✓ The first error of each candidate is the one create_trip used to raise")
+
+    def test_all_errors_in_rule_order(self):
+        vehicles = [{"id": "v1", "status": "in_shop", "max_capacity": 500}]
+        drivers = [{"id": "d1", "status": "suspended", "license_expiry": "2020-01-01"}]
+        trips = [{"vehicle_id": "v1", "driver_id": "d1", "cargo_weight": 600.0},
+                 {"vehicle_id": "v9", "driver_id": "d9", "cargo_weight": 600.0}]
+        assert check_trips(trips, vehicles, drivers, today=TODAY) == [
+            [(400, "Vehicle is 'in_shop', must be 'available'"), (400, "Driver is suspended"),
+             (400, "Driver's license has expired"), (400, "Cargo weight (600.0kg) exceeds vehicle capacity (500kg)")],
+            [(404, "Vehicle not found"), (404, "Driver not found")],
+        ]
+        print("✓ Every failed rule is reported, in create_trip's order")
+
+    def test_missing_numbers(self):
+        vehicles = [{"id": "v1", "status": "available", "max_capacity": None}]
+        drivers = [{"id": "d1", "status": "on_duty", "license_expiry": None}]
+        errors = check_trips([{"vehicle_id": "v1", "driver_id": "d1", "cargo_weight": None},
+                              {"vehicle_id": "v1", "driver_id": "d1", "cargo_weight": 1.0}], vehicles, drivers, today=TODAY)
+        assert errors[0] == []
+        assert errors[1] == [(400, "Cargo weight (1.0kg) exceeds vehicle capacity (Nonekg)")]
+        print("✓ Missing capacities and cargo weights count as zero instead of failing")
+
+
+class TestAssignTrips:
+    """planning.assign_trips and its driver solver"""
+
+    @staticmethod
+    def cost(costs, assigned):
+        return sum(costs[i, j] for i, j in enumerate(assigned) if j >= 0)
+
+    @pytest.mark.parametrize('n_trips, n_drivers', [(1, 1), (3, 3), (4, 7), (6, 6), (5, 9)])
+    def test_drivers_match_linear_sum_assignment(self, n_trips, n_drivers):
+        rng = random.Random(n_trips * 100 + n_drivers)
+        for _ in range(20):
+            trips = [{"cargo_weight": rng.choice([0, 100, 250, 250, 900])} for _ in range(n_trips)]
+            drivers = [{"safety_score": rng.choice([None, 50, 75, 75, 100])} for _ in range(n_drivers)]
+            costs = driver_costs(trips, drivers)
+            assigned = _assign_drivers(trips, drivers)
+            rows, cols = linear_sum_assignment(costs)
+            assert (assigned >= 0).all()
+            assert len(set(assigned.tolist())) == n_trips
+            assert self.cost(costs, assigned) == pytest.approx(costs[rows, cols].sum())
+        print(f"✓ Sorted driver assignment is optimal for {n_trips} trips and {n_drivers} drivers")
+
+    def test_fewer_drivers_go_to_heaviest_loads(self):
+        rng = random.Random(15)
+        for _ in range(20):
+            trips = [{"cargo_weight": rng.randrange(1, 1000)} for _ in range(8)]
+            drivers = [{"safety_score": rng.randrange(0, 101)} for _ in range(3)]
+            assigned = _assign_drivers(trips, drivers)
+            heaviest = sorted(range(8), key=lambda i: -trips[i]['cargo_weight'])[:3]
+            assert sorted(np.flatnonzero(assigned >= 0).tolist()) == sorted(heaviest)
+            costs = driver_costs(trips, drivers)[heaviest]
+            rows, cols = linear_sum_assignment(costs)
+            assert self.cost(costs, assigned[heaviest]) == pytest.approx(costs[rows, cols].sum())
+        print("✓ With fewer drivers than trips the heaviest loads get the optimal drivers")
+
+    def test_infeasible_pairs_are_unassigned(self):
+        trips = [{"origin": "A", "cargo_weight": 400}, {"origin": "B", "cargo_weight": 5000},
+                 {"origin": "A", "cargo_weight": 900}]
+        vehicles = [{"max_capacity": 1000, "location": "A"}, {"max_capacity": 500, "location": "B"}]
+        drivers = [{"safety_score": 90}, {"safety_score": 70}, {"safety_score": 80}]
+        vehicle_of, driver_of = assign_trips(trips, vehicles, drivers)
+        assert vehicle_of.tolist() == [1, -1, 0]
+        assert driver_of[1] == -1
+        assert driver_of[2] == 0 and driver_of[0] == 2
+        print("✓ Trips no vehicle can carry get neither a vehicle nor a driver")
@@ -0,0 +1,59 @@
+"""
+Synthetic fleet generation tests
+Generates small fleets into the in-memory SQLite backend and checks the trip invariants and seeded reproducibility
+"""
+import asyncio
+import os
+import sys
+from datetime import date
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from seeding import generate_fleet  # noqa: E402
+from storage import SQLiteStorage  # noqa: E402
+
+
+def generate(**kwargs):
+    store = SQLiteStorage()
+
+    async def insert(table, rows):
+        return (await store.table(table).insert(rows).execute()).data
+
+    async def run():
+        await generate_fleet(insert, batch_size=50, parallel=4, **kwargs)
+        tables = {}
+        for table in ('vehicles', 'drivers', 'trips', 'expenses'):
+            tables[table] = (await store.table(table).select('*').execute()).data
+        return tables
+
+    return asyncio.run(run())
+
+
+class TestGenerateFleet:
+    """generate_fleet output"""
+
+    def test_dispatched_trips_have_eligible_drivers(self):
+        fleet = generate(vehicles=120, drivers=40, trips=300, seed=7)
+        vehicles = {v['id']: v for v in fleet['vehicles']}
+        drivers = {d['id']: d for d in fleet['drivers']}
+        dispatched = [t for t in fleet['trips'] if t['status'] == 'dispatched']
+        on_trip = [v for v in fleet['vehicles'] if v['status'] == 'on_trip']
+        assert 0 < len(on_trip) <= len(drivers)
+        assert len(dispatched) == len(on_trip)
+        assert len({t['driver_id'] for t in dispatched}) == len(dispatched)
+        assert len({t['vehicle_id'] for t in dispatched}) == len(dispatched)
+        for trip in dispatched:
+            driver = drivers[trip['driver_id']]
+            assert driver['status'] == 'on_duty'
+            assert driver['license_expiry'] >= str(date.today())
+            assert vehicles[trip['vehicle_id']]['status'] == 'on_trip'
+        print("✓ Each dispatched trip has its own on_trip vehicle and on-duty licensed driver")
+
+    def test_seed_reproduces_values(self):
+        def values(fleet):
+            return (sorted((t['origin'], t['destination'], t['distance'], t['status']) for t in fleet['trips']),
+                    sorted((e['fuel_liters'], e['fuel_cost'], e['other_cost']) for e in fleet['expenses']))
+
+        assert values(generate(vehicles=30, drivers=30, trips=400, seed=3)) == \
+            values(generate(vehicles=30, drivers=30, trips=400, seed=3))
+        print("✓ The same seed generates the same trips and expenses")
@@ -0,0 +1,228 @@
+"""
+Storage backend tests
+Runs the PostgREST-style query interface and the trip functions against the in-memory SQLite backend;
+the trip transition tests also run against schema.sql's plpgsql functions when TEST_DATABASE_URL is set
+"""
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from storage import PostgresStorage, SQLiteStorage, StorageError  # noqa: E402
+
+# One loop for the whole module, so the Postgres pool outlives a single call
+loop = asyncio.new_event_loop()
+
+
+def run(coro):
+    return loop.run_until_complete(coro)
+
+
+async def execute(query):
+    return (await query.execute()).data
+
+
+@pytest.fixture
+def fleet():
+    store = SQLiteStorage()
+
+    async def setup():
+        vehicles = await execute(store.table('vehicles').insert([
+            {"name": "Truck 1", "license_plate": "T-1", "max_capacity": 1000},
+            {"name": "Truck 2", "license_plate": "T-2", "max_capacity": 500, "status": "in_shop"},
+        ]))
+        drivers = await execute(store.table('drivers').insert(
+            {"full_name": "Dana", "license_number": "L-1", "license_expiry": "2099-01-01", "safety_score": 90}))
+        trips = await execute(store.table('trips').insert([
+            {"vehicle_id": vehicles[0]['id'], "driver_id": drivers[0]['id'], "origin": "A", "destination": "B",
+             "cargo_weight": 100} for _ in range(3)]))
+        return vehicles, drivers, trips
+
+    vehicles, drivers, trips = run(setup())
+    return store, vehicles, drivers, trips
+
+
+@pytest.fixture(params=['sqlite', 'postgres'])
+def trip_store(request):
+    if request.param == 'sqlite':
+        yield SQLiteStorage()
+        return
+    store = PostgresStorage(request.getfixturevalue('postgres_dsn'), max_size=2)
+    yield store
+    run(store.close())
+
+
+def add_trip(store, status='draft', vehicle_status='available', driver_status='off_duty'):
+    """One trip with its own vehicle and driver, in the given states"""
+    async def setup():
+        n = len(await execute(store.table('vehicles').select('id')))
+        vehicle = await execute(store.table('vehicles').insert(
+            {"name": f"Truck {n}", "license_plate": f"T-{n}", "max_capacity": 1000, "status": vehicle_status}))
+        driver = await execute(store.table('drivers').insert(
+            {"full_name": f"Driver {n}", "license_number": f"L-{n}", "license_expiry": "2099-01-01",
+             "safety_score": 90, "status": driver_status}))
+        trip = await execute(store.table('trips').insert(
+            {"vehicle_id": vehicle[0]['id'], "driver_id": driver[0]['id'], "origin": "A", "destination": "B",
+             "cargo_weight": 100, "status": status}))
+        return trip[0]
+
+    return run(setup())
+
+
+def statuses(store, trip):
+    async def fetch():
+        rows = {}
+        for table, key in (('trips', 'id'), ('vehicles', 'vehicle_id'), ('drivers', 'driver_id')):
+            rows[table] = (await execute(store.table(table).select('status').eq('id', trip[key])))[0]['status']
+        return rows['trips'], rows['vehicles'], rows['drivers']
+
+    return run(fetch())
+
+
+def call(store, action, trip_id):
+    return run(execute(store.rpc(f'trip_{action}', {'p_trip_id': trip_id})))
+
+
+class TestSQLiteQueries:
+    """Query builder against the SQLite backend"""
+
+    def test_insert_applies_defaults(self, fleet):
+        store, vehicles, drivers, trips = fleet
+        assert vehicles[0]['status'] == 'available'
+        assert len(vehicles[0]['id']) == 36
+        assert vehicles[0]['created_at'].endswith('+00:00')
+        print("✓ Inserted rows carry generated ids and defaults")
+
+    def test_select_with_embeds_and_filters(self, fleet):
+        store, vehicles, drivers, trips = fleet
+        rows = run(execute(store.table('trips').select('id, vehicles(name), drivers(*)')
+                           .eq('status', 'draft').order('created_at', desc=True).order('id', desc=True).limit(2)))
+        assert len(rows) == 2
+        assert rows[0]['vehicles'] == {"name": "Truck 1"}
+        assert rows[0]['drivers']['full_name'] == "Dana"
+        assert 'vehicle_id' not in rows[0]
+        print("✓ Select embeds related rows and applies filters, order and limit")
+
+    def test_keyset_or_filter(self, fleet):
+        store, vehicles, drivers, trips = fleet
+        ordered = run(execute(store.table('trips').select('*').order('created_at', desc=True).order('id', desc=True)))
+        first = ordered[0]
+        rest = run(execute(store.table('trips').select('*').lte('created_at', first['created_at'])
+                           .or_(f'created_at.lt."{first["created_at"]}",and(created_at.eq."{first["created_at"]}",id.lt."{first["id"]}")')
+                           .order('created_at', desc=True).order('id', desc=True)))
+        assert [r['id'] for r in rest] == [r['id'] for r in ordered[1:]]
+        print("✓ or_() logic trees page through rows by keyset")
+
+    def test_constraint_violation_has_sqlstate(self, fleet):
+        store = fleet[0]
+        with pytest.raises(StorageError) as e:
+            run(execute(store.table('vehicles').insert({"name": "Dup", "license_plate": "T-1", "max_capacity": 1})))
+        assert e.value.code == '23505'
+        print("✓ Unique violations surface as SQLSTATE 23505")
+
+
+class TestSQLiteFunctions:
+    """Python implementations of the schema.sql trip functions"""
+
+    def test_dispatch_and_complete(self, fleet):
+        store, vehicles, drivers, trips = fleet
+        result = run(execute(store.rpc('trip_dispatch', {'p_trip_id': trips[0]['id']})))
+        assert result['previous']['status'] == 'draft'
+        assert result['trip']['status'] == 'dispatched'
+        assert result['trip']['vehicles']['status'] == 'on_trip'
+        with pytest.raises(StorageError) as e:
+            run(execute(store.rpc('trip_dispatch', {'p_trip_id': trips[1]['id']})))
+        assert e.value.code == 'PT400'
+        result = run(execute(store.rpc('trip_complete', {'p_trip_id': trips[0]['id']})))
+        assert result['trip']['vehicles']['status'] == 'available'
+        print("✓ Trip transitions update trip, vehicle and driver together")
+
+    def test_bulk_dispatch_reports_per_item_errors(self, fleet):
+        store, vehicles, drivers, trips = fleet
+        ids = [t['id'] for t in trips]
+        results = run(execute(store.rpc('trips_dispatch', {'p_trip_ids': ids + [ids[0]]})))
+        assert [r['error'] for r in results] == [None, 'Vehicle is already dispatched in this batch',
+                                                 'Vehicle is already dispatched in this batch', 'Duplicate trip id in batch']
+        assert results[0]['trip']['status'] == 'dispatched'
+        print("✓ Bulk dispatch gives each vehicle to the first valid trip only")
+
+    def test_unknown_function(self, fleet):
+        store = fleet[0]
+        with pytest.raises(StorageError) as e:
+            run(execute(store.rpc('changes_since', {'p_txid': '0'})))
+        assert e.value.code == 'PGRST202'
+        print("✓ Functions without a SQLite implementation report PGRST202")
+
+
+class TestTripTransitions:
+    """trip_dispatch / trip_complete / trip_cancel on SQLite and, with TEST_DATABASE_URL, Postgres"""
+
+    def test_dispatch_puts_vehicle_and_driver_on_trip(self, trip_store):
+        trip = add_trip(trip_store)
+        result = call(trip_store, 'dispatch', trip['id'])
+        assert result['previous']['status'] == 'draft'
+        assert result['trip']['status'] == 'dispatched'
+        assert result['trip']['start_time']
+        assert result['trip']['vehicles']['status'] == 'on_trip'
+        assert result['trip']['drivers']['status'] == 'on_duty'
+        assert statuses(trip_store, trip) == ('dispatched', 'on_trip', 'on_duty')
+        print("✓ Dispatch moves the trip, vehicle and driver together")
+
+    def test_complete_releases_vehicle_and_driver(self, trip_store):
+        trip = add_trip(trip_store)
+        call(trip_store, 'dispatch', trip['id'])
+        result = call(trip_store, 'complete', trip['id'])
+        assert result['previous']['status'] == 'dispatched'
+        assert result['trip']['end_time']
+        assert statuses(trip_store, trip) == ('completed', 'available', 'off_duty')
+        print("✓ Complete frees the vehicle and takes the driver off duty")
+
+    def test_cancel_dispatched_releases_vehicle_and_driver(self, trip_store):
+        trip = add_trip(trip_store)
+        call(trip_store, 'dispatch', trip['id'])
+        result = call(trip_store, 'cancel', trip['id'])
+        assert result['previous']['status'] == 'dispatched'
+        assert statuses(trip_store, trip) == ('cancelled', 'available', 'off_duty')
+        print("✓ Cancelling a dispatched trip frees its vehicle and driver")
+
+    def test_cancel_draft_leaves_vehicle_and_driver(self, trip_store):
+        trip = add_trip(trip_store, vehicle_status='in_shop', driver_status='on_duty')
+        call(trip_store, 'cancel', trip['id'])
+        assert statuses(trip_store, trip) == ('cancelled', 'in_shop', 'on_duty')
+        print("✓ Cancelling a draft trip doesn't touch its vehicle or driver")
+
+    @pytest.mark.parametrize('action, status, message', [
+        ('dispatch', 'dispatched', "Trip is 'dispatched', must be 'draft' to dispatch"),
+        ('dispatch', 'completed', "Trip is 'completed', must be 'draft' to dispatch"),
+        ('complete', 'draft', 'Trip must be dispatched to complete'),
+        ('complete', 'cancelled', 'Trip must be dispatched to complete'),
+        ('cancel', 'completed', 'Only draft or dispatched trips can be cancelled'),
+        ('cancel', 'cancelled', 'Only draft or dispatched trips can be cancelled'),
+    ])
+    def test_status_guards(self, trip_store, action, status, message):
+        trip = add_trip(trip_store, status=status, vehicle_status='in_shop', driver_status='suspended')
+        with pytest.raises(StorageError) as e:
+            call(trip_store, action, trip['id'])
+        assert e.value.code == 'PT400'
+        assert message in str(e.value)
+        assert statuses(trip_store, trip) == (status, 'in_shop', 'suspended')
+        print(f"✓ {action} refuses a {status} trip and changes nothing")
+
+    def test_dispatch_needs_available_vehicle(self, trip_store):
+        trip = add_trip(trip_store, vehicle_status='in_shop')
+        with pytest.raises(StorageError) as e:
+            call(trip_store, 'dispatch', trip['id'])
+        assert e.value.code == 'PT400'
+        assert 'Vehicle is no longer available' in str(e.value)
+        assert statuses(trip_store, trip) == ('draft', 'in_shop', 'off_duty')
+        print("✓ Dispatch refuses a vehicle that isn't available")
+
+    @pytest.mark.parametrize('action', ['dispatch', 'complete', 'cancel'])
+    def test_missing_trip(self, trip_store, action):
+        with pytest.raises(StorageError) as e:
+            call(trip_store, action, '00000000-0000-0000-0000-000000000000')
+        assert e.value.code == 'PT404'
+        print(f"✓ {action} of a missing trip reports PT404")
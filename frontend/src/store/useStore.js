@@ -1,8 +1,66 @@
 import { create } from 'zustand';
-import { supabase } from '../lib/supabase';
 
 const API = process.env.REACT_APP_BACKEND_URL;
 
+// Change events arrive in bursts (a dispatch touches trips, vehicles and drivers);
+// coalesce them into a single KPI refresh
+const KPI_REFRESH_DELAY_MS = 1000;
+let kpiRefreshTimer = null;
+
+// The /api/events stream pushes the rows written through the API as they change. Writes
+// it can't see (other API workers, edits made directly in the database) and anything
+// missed while disconnected are caught up from /api/changes since our cursor: on
+// reconnect, on a `resync` signal and every SYNC_INTERVAL_MS
+const SYNC_DELAY_MS = 250;
+const SYNC_INTERVAL_MS = 30000;
+// EventSource can't send headers, so each connection authenticates with a short-lived
+// stream token in the URL instead of the session token. Once it has expired the
+// browser's own reconnect is refused; a closed stream reconnects with a fresh one.
+const STREAM_RETRY_MS = 3000;
+let syncTimer = null;
+let syncing = false;
+let syncAgain = false;
+const TABLE_KEYS = { vehicles: 'vehicles', drivers: 'drivers', trips: 'trips', maintenance_logs: 'maintenance', expenses: 'expenses' };
+
+// Replace changed rows in place, drop deleted ones and put new rows first (lists are newest first)
+const mergeRows = (list, upserted, deleted) => {
+  const gone = new Set(deleted);
+  const changed = new Map(upserted.map((r) => [r.id, r]));
+  const kept = list.filter((r) => !gone.has(r.id)).map((r) => {
+    const row = changed.get(r.id);
+    if (!row) return r;
+    changed.delete(r.id);
+    return row;
+  });
+  return [...changed.values(), ...kept];
+};
+
+// Related rows each list embeds (see the backend's LIST_SELECT), keyed by the id column
+const EMBEDS = {
+  trips: { vehicles: ['vehicle_id', 'vehicles'], drivers: ['driver_id', 'drivers'] },
+  maintenance_logs: { vehicles: ['vehicle_id', 'vehicles'] },
+  expenses: { vehicles: ['vehicle_id', 'vehicles'], trips: ['trip_id', 'trips'] },
+};
+
+// Pushed rows come straight from the write, usually without their embeds; keep the ones
+// we already have and look the rest up in the local lists
+const fillEmbeds = (state, table, row) => {
+  const current = state[TABLE_KEYS[table]].find((r) => r.id === row.id);
+  const filled = { ...current, ...row };
+  Object.entries(EMBEDS[table] || {}).forEach(([key, [column, source]]) => {
+    if (filled[key] !== undefined && filled[key]?.id === filled[column]) return;
+    filled[key] = state[TABLE_KEYS[source]].find((r) => r.id === filled[column]) || null;
+  });
+  return filled;
+};
+
+// Refresh the embedded copy of a changed vehicle/driver (e.g. trip.vehicles)
+const patchEmbedded = (list, key, rows) => {
+  if (!rows.length) return list;
+  const byId = new Map(rows.map((r) => [r.id, r]));
+  return list.map((r) => (r[key] && byId.has(r[key].id) ? { ...r, [key]: byId.get(r[key].id) } : r));
+};
+
 const useStore = create((set, get) => ({
   token: localStorage.getItem('ff_token'),
   user: JSON.parse(localStorage.getItem('ff_user') || 'null'),
@@ -12,6 +70,7 @@ const useStore = create((set, get) => ({
   maintenance: [],
   expenses: [],
   kpis: null,
+  changesCursor: null,
   loading: false,
   dbReady: null,
 
@@ -33,7 +92,7 @@ const useStore = create((set, get) => ({
   logout: () => {
     localStorage.removeItem('ff_token');
     localStorage.removeItem('ff_user');
-    set({ token: null, user: null, vehicles: [], drivers: [], trips: [], maintenance: [], expenses: [], kpis: null });
+    set({ token: null, user: null, vehicles: [], drivers: [], trips: [], maintenance: [], expenses: [], kpis: null, changesCursor: null });
   },
 
   checkHealth: async () => {
@@ -63,22 +122,103 @@ const useStore = create((set, get) => ({
   fetchKPIs: async () => {
     try { const res = await get().api('/api/analytics/summary'); set({ kpis: res }); } catch {}
   },
+  scheduleKPIs: () => {
+    clearTimeout(kpiRefreshTimer);
+    kpiRefreshTimer = setTimeout(() => get().fetchKPIs(), KPI_REFRESH_DELAY_MS);
+  },
 
   fetchAll: async () => {
     set({ loading: true });
+    // Take the change cursor before loading, so nothing written during the load is missed
+    try { const res = await get().api('/api/changes'); set({ changesCursor: res.cursor }); } catch {}
     await Promise.all([get().fetchVehicles(), get().fetchDrivers(), get().fetchTrips(), get().fetchMaintenance(), get().fetchExpenses(), get().fetchKPIs()]);
     set({ loading: false });
   },
 
+  applyChanges: ({ changes, kpis }) => {
+    const state = get();
+    const next = {};
+    Object.entries(changes).forEach(([table, { upserted, deleted }]) => {
+      const key = TABLE_KEYS[table];
+      if (key) next[key] = mergeRows(state[key], upserted, deleted);
+    });
+    const vehicles = changes.vehicles?.upserted || [];
+    const drivers = changes.drivers?.upserted || [];
+    next.trips = patchEmbedded(patchEmbedded(next.trips || state.trips, 'vehicles', vehicles), 'drivers', drivers);
+    next.maintenance = patchEmbedded(next.maintenance || state.maintenance, 'vehicles', vehicles);
+    next.expenses = patchEmbedded(next.expenses || state.expenses, 'vehicles', vehicles);
+    if (kpis && state.kpis) next.kpis = { ...state.kpis, kpis };
+    set(next);
+    // KPI numbers are patched above; charts (by-day series, ROI) follow on the debounced refresh
+    if (Object.keys(changes).length) get().scheduleKPIs();
+  },
+  syncChanges: async () => {
+    if (syncing) { syncAgain = true; return; }
+    syncing = true;
+    try {
+      let res;
+      do {
+        const cursor = get().changesCursor;
+        if (!cursor) { await get().fetchAll(); break; }
+        res = await get().api(`/api/changes?since=${encodeURIComponent(cursor)}`);
+        if (res.reset) { await get().fetchAll(); break; }
+        get().applyChanges(res);
+        set({ changesCursor: res.cursor });
+      } while (res.has_more);
+    } catch {} finally {
+      syncing = false;
+      if (syncAgain) { syncAgain = false; get().scheduleSync(); }
+    }
+  },
+  applyEvents: ({ events, kpis }) => {
+    const state = get();
+    const changes = {};
+    const reload = new Set();
+    events.forEach(({ table, op, id, row }) => {
+      if (!TABLE_KEYS[table]) return;
+      if (op === 'refresh') { reload.add(table); return; }
+      const entry = changes[table] || (changes[table] = { upserted: [], deleted: [] });
+      if (op === 'delete') entry.deleted.push(id);
+      else entry.upserted.push(fillEmbeds(state, table, row));
+    });
+    reload.forEach((table) => delete changes[table]);
+    get().applyChanges({ changes, kpis });
+    const fetchers = { vehicles: 'fetchVehicles', drivers: 'fetchDrivers', trips: 'fetchTrips', maintenance_logs: 'fetchMaintenance', expenses: 'fetchExpenses' };
+    reload.forEach((table) => get()[fetchers[table]]());
+    if (reload.size) get().scheduleKPIs();
+  },
+  scheduleSync: () => {
+    clearTimeout(syncTimer);
+    syncTimer = setTimeout(() => get().syncChanges(), SYNC_DELAY_MS);
+  },
+
   initRealtime: () => {
-    const channel = supabase.channel('fleetflow-realtime')
-      .on('postgres_changes', { event: '*', schema: 'public', table: 'vehicles' }, () => { get().fetchVehicles(); get().fetchKPIs(); })
-      .on('postgres_changes', { event: '*', schema: 'public', table: 'drivers' }, () => { get().fetchDrivers(); get().fetchKPIs(); })
-      .on('postgres_changes', { event: '*', schema: 'public', table: 'trips' }, () => { get().fetchTrips(); get().fetchKPIs(); })
-      .on('postgres_changes', { event: '*', schema: 'public', table: 'maintenance_logs' }, () => { get().fetchMaintenance(); get().fetchKPIs(); })
-      .on('postgres_changes', { event: '*', schema: 'public', table: 'expenses' }, () => { get().fetchExpenses(); get().fetchKPIs(); })
-      .subscribe();
-    return () => supabase.removeChannel(channel);
+    if (!get().token) return () => {};
+    let source = null;
+    let retryTimer = null;
+    let stopped = false;
+    let opened = false;
+    const retry = () => { if (!stopped && get().token) retryTimer = setTimeout(connect, STREAM_RETRY_MS); };
+    const connect = async () => {
+      let streamToken;
+      try {
+        streamToken = (await get().api('/api/events/token', { method: 'POST' })).token;
+      } catch (e) {
+        retry();
+        return;
+      }
+      if (stopped) return;
+      const es = new EventSource(`${API}/api/events?token=${encodeURIComponent(streamToken)}`);
+      source = es;
+      // The first open follows fetchAll; later ones are reconnects that may have missed events
+      es.addEventListener('open', () => { if (opened) get().scheduleSync(); opened = true; });
+      es.addEventListener('changes', (e) => get().applyEvents(JSON.parse(e.data)));
+      es.addEventListener('resync', () => get().scheduleSync());
+      es.addEventListener('error', () => { if (es.readyState === EventSource.CLOSED) retry(); });
+    };
+    connect();
+    const interval = setInterval(() => get().scheduleSync(), SYNC_INTERVAL_MS);
+    return () => { stopped = true; if (source) source.close(); clearTimeout(retryTimer); clearInterval(interval); };
   },
 
   hasPermission: (action) => {